@@ -0,0 +1,484 @@
+import os  # 导入操作系统模块，用于文件路径和目录操作
+import sys  # 导入系统模块，用于设置导入路径和输出
+import json  # 输出/读取机器可读的结果
+import time  # 计时
+import random  # 生成可复现的测试文案 (固定种子)
+import hashlib  # 记录所用字体的指纹，方便判断两次结果是否可比
+import platform  # 记录运行环境
+import argparse  # 命令行参数解析
+import tempfile  # 生成的背景和输出都放在临时目录里
+import statistics  # 中位数等统计
+from PIL import Image, ImageChops, ImageFont, features  # 导入 Pillow 库
+
+# 与 utils 里的脚本一样按平铺方式导入模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'utils'))
+
+from generator import ImageGenerator  # noqa: E402
+from cache import LRUCache, FontCache, BackgroundCache  # noqa: E402
+from render_cache import RenderCache  # noqa: E402
+from layout_store import LayoutStore  # noqa: E402
+from encoder import encode_image  # noqa: E402
+from glyph_atlas import GlyphAtlas  # noqa: E402
+from stroke import STROKE_ENGINES  # noqa: E402
+
+# ==========================================
+#  渲染各阶段的基准测试 (无界面、无网络)
+#  用法: python benchmarks/bench_render.py -o result.json
+#        python benchmarks/bench_render.py --compare baseline.json
+#        python benchmarks/bench_render.py --glyph-atlas   (字形图集后端，并检查与整行绘制的像素差)
+#        python benchmarks/bench_render.py --stroke-scaling (两种描边引擎随描边宽度、文案长度的耗时变化)
+#  字体按顺序从 --font-folder、benchmarks/fonts、Font 里找 (.ttf/.otf/.ttc)，
+#  背景图在临时目录里现场生成，结果只与代码、字体和机器有关
+# ==========================================
+
+FONT_DIRS = [os.path.join(ROOT, 'benchmarks', 'fonts'), os.path.join(ROOT, 'Font')]
+FONT_EXTS = ('.ttf', '.otf', '.ttc')
+
+LENGTHS = [1, 10, 50, 200, 800, 2000]
+OUTLINE_WIDTHS = [0, 1, 2, 3, 5, 8, 10]
+
+# 描边引擎对比: 描边宽度 x 文案长度
+STROKE_WIDTHS = [1, 3, 6, 10, 16, 24]
+STROKE_LENGTHS = [10, 100, 500]
+
+LATIN_WORDS = ("the quick brown fox jumps over lazy dog sherry meme caption "
+               "render layout wrap outline stroke font size width line").split()
+CJK_CHARS = "橘雪莉表情包生成器今天也要开心哦好可爱大家一起来玩吧这是什么意思我不知道你说得对"
+CJK_PUNCT = "，。！？"
+
+
+def make_text(script, length, seed=0):
+    """生成指定长度的文案 (同样的参数总是得到同样的文字)"""
+    rng = random.Random(f"{script}-{length}-{seed}")
+    out = []
+    if script == 'latin':
+        while len(''.join(out)) < length:
+            out.append(rng.choice(LATIN_WORDS) + ' ')
+    else:
+        while len(out) < length:
+            out.append(rng.choice(CJK_PUNCT) if rng.random() < 0.08 else rng.choice(CJK_CHARS))
+    return ''.join(out)[:length].rstrip() or 'x'
+
+
+def make_backgrounds(folder):
+    """
+    生成测试背景：一张需要缩放的 JPEG (1200x900)，一张尺寸正好的 PNG
+    只用渐变拼合，不依赖随机数，每次生成的像素都一样
+    """
+    os.makedirs(folder, exist_ok=True)
+    grad = Image.linear_gradient('L')
+    radial = Image.radial_gradient('L')
+    rgb = Image.merge('RGB', (grad, radial, grad.transpose(Image.Transpose.ROTATE_90)))
+    rgb.resize((1200, 900)).save(os.path.join(folder, 'gradient.jpg'), quality=90)
+    rgb.resize((900, 900)).save(os.path.join(folder, 'square.png'))
+    return {'jpeg': 'gradient.jpg', 'png': 'square.png'}
+
+
+def _covers(font, char):
+    """[辅助] 粗略判断字体是否有该字的字形 (与缺字方框的蒙版比较)"""
+    missing = font.getmask('￿')
+    mask = font.getmask(char)
+    return mask.size != missing.size or bytes(mask) != bytes(missing)
+
+
+def find_fonts(folders):
+    """
+    在候选目录里找测试字体
+    返回: {'latin': 路径或 None, 'cjk': 路径或 None}
+    没有 CJK 字体时 CJK 用例也会跑 (绘制缺字方框)，但结果里会标记出来
+    """
+    found = {'latin': None, 'cjk': None}
+    for folder in folders:
+        if not folder or not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(FONT_EXTS):
+                continue
+            path = os.path.abspath(os.path.join(folder, name))
+            try:
+                font = ImageFont.truetype(path, 40)
+            except OSError:
+                continue
+            if found['latin'] is None and _covers(font, 'A'):
+                found['latin'] = path
+            if found['cjk'] is None and _covers(font, '橘'):
+                found['cjk'] = path
+    return found
+
+
+def file_sha(path):
+    """[辅助] 文件 sha256 前 16 位"""
+    if not path:
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def build_cases(fonts, backgrounds):
+    """
+    用例矩阵:
+      长度 1~2000 x 拉丁/中日韩 (描边 3)
+      描边宽度 0~10 (中等长度)
+      缺字体兜底、缺背景兜底、不需要缩放的背景
+      中英混排缺字回退 (拉丁字体与中文字体在同一文件夹时)
+    """
+    cases = []
+
+    def add(name, text, font_path, bg_file, outline_width, **extra):
+        cases.append(dict(name=name, text=text, font_path=font_path, bg_file=bg_file,
+                          outline_width=outline_width, **extra))
+
+    for script in ('latin', 'cjk'):
+        font_path = fonts[script] or fonts['latin']
+        for length in LENGTHS:
+            add(f"{script}-len{length}", make_text(script, length), font_path,
+                backgrounds['jpeg'], 3, script=script)
+    for width in OUTLINE_WIDTHS:
+        add(f"outline-w{width}", make_text('cjk', 20), fonts['cjk'] or fonts['latin'],
+            backgrounds['jpeg'], width, script='cjk')
+    add("fallback-missing-font", make_text('latin', 50), None, backgrounds['jpeg'], 3, script='latin')
+    add("fallback-missing-bg", make_text('latin', 50), fonts['latin'], 'missing.png', 3, script='latin')
+    add("bg-no-resize", make_text('latin', 50), fonts['latin'], backgrounds['png'], 3, script='latin')
+    if (fonts['latin'] and fonts['cjk'] and fonts['latin'] != fonts['cjk']
+            and os.path.dirname(fonts['latin']) == os.path.dirname(fonts['cjk'])):
+        mixed = ' '.join(make_text('latin', 40, seed=1).split()[:4] + [make_text('cjk', 20, seed=1)])
+        add("fallback-mixed-scripts", mixed, fonts['latin'], backgrounds['jpeg'], 3, script='mixed')
+    return cases
+
+
+def case_settings(case, bg_folder):
+    """[辅助] 用例 -> 渲染参数"""
+    font_file = os.path.basename(case['font_path']) if case['font_path'] else 'missing-font.ttf'
+    return {
+        'text': case['text'],
+        'bg_path': os.path.join(bg_folder, case['bg_file']),
+        'font_file': font_file,
+        'font_size': 100,
+        'text_color': (255, 255, 255),
+        'use_outline': case['outline_width'] > 0,
+        'outline_width': case['outline_width'],
+        'outline_color': (0, 0, 0),
+    }
+
+
+def clear_caches(generator, persistent=True):
+    """[辅助] 清空渲染器的所有内存缓存，用于测冷启动耗时 (persistent 为真时连磁盘排版缓存一起清空)"""
+    for cache in (generator.font_cache, generator.background_cache,
+                  generator.layout_cache, generator.mask_cache, generator.glyph_atlas):
+        if cache is not None:
+            cache.clear()
+    generator.fallback.clear()
+    if persistent and generator.layout_store is not None:
+        generator.layout_store.clear()
+
+
+def timed(func):
+    """[辅助] 执行一次并返回 (结果, 毫秒)"""
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def summarize(samples):
+    """[辅助] 一组耗时 (毫秒) 的统计值"""
+    return {
+        'median_ms': statistics.median(samples),
+        'min_ms': min(samples),
+        'max_ms': max(samples),
+        'mean_ms': statistics.fmean(samples),
+        'runs': len(samples),
+    }
+
+
+def max_diff(a, b):
+    """[辅助] 两张图逐像素最大差值"""
+    return max(high for _, high in ImageChops.difference(a, b).getextrema())
+
+
+def run_case(generator, case, bg_folder, repeat, reference=None):
+    """
+    跑一个用例的各个阶段:
+      layout_cold  清空缓存后排版 (字号二分 + 换行)
+      layout_warm_start  只清空内存缓存后排版 (相当于重启后读磁盘排版缓存)
+      wrap         在排版结果的字号下单独换行一次
+      render_cold  清空缓存后完整渲染 (背景解码缩放 + 排版 + 蒙版 + 合成)
+      render_warm  缓存全部命中时重新渲染
+      recolor      只改文字颜色 (排版和蒙版命中缓存)
+      remask       只清空蒙版缓存后重新渲染 (字体/排版/字形图集仍是热的，相当于同一批字的新文案)
+      preview      300x300 草稿预览
+      export_sizes 在已有 900 成品的基础上再导出 512 + 240 两个尺寸 (排版复用，文字按各尺寸重新栅格化)
+      encode_png   PNG 编码
+    reference: 用于对照的渲染器 (整行绘制)，给出时记录两者输出的最大像素差
+    """
+    settings = case_settings(case, bg_folder)
+    times = {name: [] for name in ('layout_cold', 'layout_warm_start', 'wrap', 'render_cold', 'render_warm',
+                                   'recolor', 'remask', 'preview', 'export_sizes', 'encode_png')}
+    layout = None
+    image = None
+
+    # 预热一轮 (导入、首次分配等一次性开销不计入)
+    for run in range(repeat + 1):
+        clear_caches(generator)
+        layout, ms_layout = timed(lambda: generator.layout_text(
+            settings['text'], settings['font_file'], settings['font_size']))
+        clear_caches(generator, persistent=False)
+        _, ms_warm_start = timed(lambda: generator.layout_text(
+            settings['text'], settings['font_file'], settings['font_size']))
+
+        font = generator._layout_font(layout)
+        _, ms_wrap = timed(lambda: generator._calculate_wrapped_text(
+            None, settings['text'], font, generator.DRAW_AREA_W))
+
+        clear_caches(generator)
+        image, ms_cold = timed(lambda: generator.render_image(settings))
+        _, ms_warm = timed(lambda: generator.render_image(settings))
+
+        recolored = dict(settings, text_color=(255, 200, 0) if run % 2 else (0, 200, 255))
+        _, ms_recolor = timed(lambda: generator.render_image(recolored))
+        generator.mask_cache.clear()
+        _, ms_remask = timed(lambda: generator.render_image(settings))
+        _, ms_preview = timed(lambda: generator.render_preview(settings, 300))
+        generator.mask_cache.clear()
+        _, ms_export = timed(lambda: generator.render_sizes(settings, [512, 240]))
+        (_, info), ms_encode = timed(lambda: encode_image(image, 'png'))
+
+        if run == 0:
+            continue
+        for name, ms in (('layout_cold', ms_layout), ('layout_warm_start', ms_warm_start), ('wrap', ms_wrap),
+                         ('render_cold', ms_cold), ('render_warm', ms_warm), ('recolor', ms_recolor), ('remask', ms_remask),
+                         ('preview', ms_preview), ('export_sizes', ms_export), ('encode_png', ms_encode)):
+            times[name].append(ms)
+
+    result = {
+        'script': case.get('script'),
+        'chars': len(settings['text']),
+        'outline_width': case['outline_width'],
+        'font': os.path.basename(case['font_path']) if case['font_path'] else None,
+        'bg': case['bg_file'],
+        'font_size': layout['size'],
+        'lines': len(layout['lines']),
+        'probes': layout['probes'],
+        'use_default_font': layout['use_default'],
+        'png_bytes': info['bytes'],
+        'stages': {name: summarize(samples) for name, samples in times.items()},
+    }
+    if reference is not None:
+        result['atlas_max_diff'] = max(
+            max_diff(image, reference.render_image(settings)),
+            max_diff(generator.render_preview(settings, 300), reference.render_preview(settings, 300)))
+    return result
+
+
+def run_suite(font_folder=None, repeat=5, only=None, glyph_atlas=False, stroke_engine='freetype',
+              log=sys.stderr):
+    """
+    跑整套基准，返回可直接 json.dump 的结果 dict (meta + cases)
+    only: 只跑名字包含该子串的用例
+    glyph_atlas: 使用字形图集后端，并与整行绘制的输出逐像素对照
+    stroke_engine: 描边引擎 ('freetype' / 'dilate')
+    """
+    fonts = find_fonts([font_folder] + FONT_DIRS)
+    if fonts['latin'] is None:
+        print("警告: 没有找到测试字体，只能测默认字体兜底路径 "
+              "(把 .ttf/.otf 放进 benchmarks/fonts 或用 --font-folder 指定)", file=log)
+    if fonts['cjk'] is None:
+        print("警告: 没有找到覆盖中文的字体，CJK 用例会使用拉丁字体 (绘制缺字方框)", file=log)
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="sherry-bench-") as work:
+        bg_folder = os.path.join(work, 'backgrounds')
+        backgrounds = make_backgrounds(bg_folder)
+        cases = [c for c in build_cases(fonts, backgrounds) if not only or only in c['name']]
+        # 渲染器会在当前目录创建 output_images 等文件夹，放到临时目录里
+        os.chdir(work)
+        try:
+            for case in cases:
+                # 字体按文件名引用，每个用例都指向字体所在的目录
+                font_folder_for_case = os.path.dirname(case['font_path']) if case['font_path'] else work
+                def make_generator(atlas=None):
+                    return ImageGenerator(
+                        bg_folder=bg_folder, font_folder=font_folder_for_case,
+                        font_cache=FontCache(), background_cache=BackgroundCache(),
+                        layout_cache=LRUCache(max_items=512),
+                        render_cache=RenderCache(os.path.join(work, 'renders')), glyph_atlas=atlas,
+                        stroke_engine=stroke_engine,
+                        layout_store=LayoutStore(os.path.join(work, 'layouts.sqlite3')))
+
+                if glyph_atlas:
+                    generator, reference = make_generator(GlyphAtlas()), make_generator()
+                else:
+                    generator, reference = make_generator(), None
+                results[case['name']] = run_case(generator, case, bg_folder, repeat, reference)
+                stages = results[case['name']]['stages']
+                line = (f"{case['name']:<24} 冷渲染 {stages['render_cold']['median_ms']:8.1f} ms  "
+                        f"热渲染 {stages['render_warm']['median_ms']:7.1f} ms  "
+                        f"重绘蒙版 {stages['remask']['median_ms']:7.1f} ms  "
+                        f"排版 {stages['layout_cold']['median_ms']:7.1f} ms")
+                if reference is not None:
+                    line += f"  像素差 {results[case['name']]['atlas_max_diff']}"
+                print(line, file=log)
+        finally:
+            os.chdir(cwd)
+
+    meta = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pillow': Image.__version__,
+        'raqm': bool(features.check('raqm')),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'glyph_atlas': bool(glyph_atlas),
+        'stroke_engine': stroke_engine,
+        'fonts': {k: [os.path.basename(v), file_sha(v)] if v else None for k, v in fonts.items()},
+    }
+    return {'meta': meta, 'cases': results}
+
+
+def run_stroke_scaling(font_folder=None, repeat=5, log=sys.stderr):
+    """
+    描边引擎对比：每种描边宽度 x 文案长度下，清空蒙版缓存 (排版命中缓存) 后生成文字+描边蒙版，
+    记录两种引擎的总耗时 (masks) 和其中描边部分的耗时 (stroke)，以及描边部分的加速比
+    返回可直接 json.dump 的结果 dict (meta + stroke_scaling)
+    """
+    fonts = find_fonts([font_folder] + FONT_DIRS)
+    font_path = fonts['latin'] or fonts['cjk']
+    if font_path is None:
+        print("警告: 没有找到测试字体，只能测默认字体", file=log)
+    font_file = os.path.basename(font_path) if font_path else 'missing-font.ttf'
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="sherry-bench-") as work:
+        os.chdir(work)
+        try:
+            generators = {engine: ImageGenerator(ensure_dirs=False,
+                bg_folder=os.path.join(work, 'backgrounds'),
+                font_folder=os.path.dirname(font_path) if font_path else work,
+                font_cache=FontCache(), background_cache=BackgroundCache(), layout_cache=LRUCache(max_items=64),
+                render_cache=RenderCache(os.path.join(work, 'renders')), stroke_engine=engine)
+                for engine in STROKE_ENGINES}
+            for length in STROKE_LENGTHS:
+                text = make_text('latin', length)
+                for width in STROKE_WIDTHS:
+                    case = {'chars': len(text), 'outline_width': width, 'engines': {}}
+                    for engine, generator in generators.items():
+                        layout = generator.layout_text(text, font_file, 100)
+                        case['lines'] = len(layout['lines'])
+                        samples = []
+                        generator.stats.reset()
+                        # 预热一轮
+                        for run in range(repeat + 1):
+                            generator.mask_cache.clear()
+                            _, ms = timed(lambda: generator._text_masks(layout, width))
+                            if run:
+                                samples.append(ms)
+                        stroke = generator.stats.snapshot()['stages'].get('stroke', {})
+                        case['engines'][engine] = {'masks': summarize(samples),
+                                                   'stroke_p50_ms': stroke.get('p50_ms', 0.0)}
+                    ft = case['engines']['freetype']['stroke_p50_ms']
+                    dl = case['engines']['dilate']['stroke_p50_ms']
+                    case['stroke_speedup'] = ft / dl if dl > 0 else None
+                    name = f"len{length}-w{width}"
+                    results[name] = case
+                    print(f"{name:<14} 行数 {case['lines']:3d}  描边 freetype {ft:7.2f} ms  dilate {dl:7.2f} ms  "
+                          f"x{case['stroke_speedup'] or 0:5.1f}", file=log)
+        finally:
+            os.chdir(cwd)
+
+    meta = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pillow': Image.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'font': [font_file, file_sha(font_path)],
+    }
+    return {'meta': meta, 'stroke_scaling': results}
+
+
+def compare(current, baseline, threshold=0.15, min_delta_ms=0.5, log=sys.stderr):
+    """
+    与基线结果对比各阶段的中位数
+    变慢超过 threshold (比例) 且绝对差超过 min_delta_ms 时视为退化
+    返回: 退化项列表 [(用例, 阶段, 基线 ms, 当前 ms), ...]
+    """
+    if current['meta'].get('fonts') != baseline['meta'].get('fonts'):
+        print("警告: 两次测试使用的字体不同，结果可能不可比", file=log)
+    if current['meta'].get('glyph_atlas') != baseline['meta'].get('glyph_atlas'):
+        print("提示: 两次测试的文字绘制后端不同 (字形图集 / 整行绘制)", file=log)
+    if current['meta'].get('stroke_engine', 'freetype') != baseline['meta'].get('stroke_engine', 'freetype'):
+        print("提示: 两次测试的描边引擎不同", file=log)
+    regressions = []
+    for name, case in current['cases'].items():
+        base_case = baseline['cases'].get(name)
+        if base_case is None:
+            continue
+        for stage, stat in case['stages'].items():
+            base = base_case['stages'].get(stage)
+            if base is None:
+                continue
+            old, new = base['median_ms'], stat['median_ms']
+            ratio = new / old if old > 0 else 1.0
+            flag = ''
+            if ratio > 1 + threshold and new - old > min_delta_ms:
+                regressions.append((name, stage, old, new))
+                flag = '  <-- 变慢'
+            elif ratio < 1 - threshold and old - new > min_delta_ms:
+                flag = '  (变快)'
+            print(f"{name:<24} {stage:<12} {old:9.2f} -> {new:9.2f} ms  x{ratio:5.2f}{flag}", file=log)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="橘雪莉表情包渲染基准测试")
+    parser.add_argument('-o', '--output', default=None, help="结果 JSON 写入的文件 (默认输出到 stdout)")
+    parser.add_argument('--compare', default=None, help="与之对比的基线 JSON")
+    parser.add_argument('--threshold', type=float, default=0.15, help="判定为变慢的比例 (默认 0.15)")
+    parser.add_argument('--font-folder', default=None, help="测试字体所在文件夹")
+    parser.add_argument('-n', '--repeat', type=int, default=5, help="每个用例重复次数")
+    parser.add_argument('--only', default=None, help="只跑名字包含该子串的用例")
+    parser.add_argument('--glyph-atlas', action='store_true', help="使用字形图集后端")
+    parser.add_argument('--atlas-tolerance', type=int, default=0,
+                        help="字形图集与整行绘制允许的最大像素差 (默认 0，即逐像素一致)")
+    parser.add_argument('--stroke-engine', default='freetype', choices=STROKE_ENGINES, help="描边引擎")
+    parser.add_argument('--stroke-scaling', action='store_true',
+                        help="只跑描边引擎对比 (描边宽度 x 文案长度)")
+    args = parser.parse_args(argv)
+
+    if args.stroke_scaling:
+        result = run_stroke_scaling(args.font_folder, max(1, args.repeat))
+    else:
+        result = run_suite(args.font_folder, max(1, args.repeat), args.only, args.glyph_atlas, args.stroke_engine)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    status = 0
+    if args.glyph_atlas:
+        mismatched = [name for name, case in result['cases'].items()
+                      if case['atlas_max_diff'] > args.atlas_tolerance]
+        if mismatched:
+            print(f"字形图集输出超出容差: {', '.join(mismatched)}", file=sys.stderr)
+            status = 1
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} 项变慢", file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
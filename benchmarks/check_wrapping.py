@@ -0,0 +1,123 @@
+import os  # 导入操作系统模块，用于文件路径
+import sys  # 导入系统模块，用于设置导入路径和退出码
+import random  # 生成可复现的测试文案 (固定种子)
+import argparse  # 命令行参数解析
+from PIL import ImageFont, features  # 导入 Pillow 字体模块
+
+# 与 utils 里的脚本一样按平铺方式导入模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'utils'))
+
+from wrapping import wrap_text  # noqa: E402
+from bench_render import FONT_DIRS, FONT_EXTS, make_text  # noqa: E402
+
+# ==========================================
+#  换行正确性检查: wrapping.wrap_text (单遍查表) 与最初的逐字 getlength 暴力算法逐行对比
+#  覆盖拉丁文、中文、中英混排 (含换行符)，多种字体、字号、行宽和排版引擎 (BASIC / RAQM)
+#  用法: python benchmarks/check_wrapping.py [--font-folder 字体文件夹] [--cases 200]
+#  有不一致时打印第一处差异并以退出码 1 结束
+# ==========================================
+
+SCRIPTS = ('latin', 'cjk', 'mixed')
+FONT_SIZES = [12, 40, 100]
+WIDTHS = [30, 200, 780]
+
+
+def baseline_wrap(text, font, max_width):
+    """最初的换行算法 (ImageGenerator._calculate_wrapped_text): 逐字把 当前行 + 字 整体测宽"""
+    lines = []
+    for paragraph in text.split('\n'):
+        current_line = ""
+        for char in paragraph:
+            test_line = current_line + char
+            w = font.getlength(test_line)
+            if w <= max_width:
+                current_line = test_line
+            else:
+                lines.append(current_line)
+                current_line = char
+        if current_line:
+            lines.append(current_line)
+    return lines
+
+
+def make_case(script, seed):
+    """生成一条测试文案: 混排时拉丁/中文片段交替，偶尔插入换行"""
+    rng = random.Random(f"wrap-{script}-{seed}")
+    length = rng.choice([1, 5, 20, 80, 300])
+    if script != 'mixed':
+        text = make_text(script, length, seed)
+    else:
+        parts = [make_text(rng.choice(('latin', 'cjk')), rng.randint(1, 12), seed * 100 + i)
+                 for i in range(max(1, length // 6))]
+        text = ''.join(parts)
+    if rng.random() < 0.3 and len(text) > 2:
+        cut = rng.randrange(1, len(text))
+        text = text[:cut] + '\n' + text[cut:]
+    return text
+
+
+def find_all_fonts(folders):
+    """候选目录里所有能打开的字体文件"""
+    paths = []
+    for folder in folders:
+        if not folder or not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(FONT_EXTS):
+                paths.append(os.path.abspath(os.path.join(folder, name)))
+    return paths
+
+
+def layout_engines():
+    """可用的排版引擎 (没有 libraqm 时只测 BASIC)"""
+    engines = [ImageFont.Layout.BASIC]
+    if features.check('raqm'):
+        engines.append(ImageFont.Layout.RAQM)
+    return engines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="检查 wrap_text 与原换行算法的结果是否一致")
+    parser.add_argument('--font-folder', default=None, help="测试字体所在文件夹 (优先于 benchmarks/fonts 和 Font)")
+    parser.add_argument('--cases', type=int, default=20, help="每种文字类型的随机文案条数")
+    args = parser.parse_args(argv)
+
+    fonts = find_all_fonts([args.font_folder] + FONT_DIRS)
+    if not fonts:
+        print("没有找到测试字体 (用 --font-folder 指定)", file=sys.stderr)
+        return 2
+
+    checked = 0
+    for path in fonts:
+        for engine in layout_engines():
+            for size in FONT_SIZES:
+                try:
+                    font = ImageFont.truetype(path, size, layout_engine=engine)
+                except OSError:
+                    continue
+                for script in SCRIPTS:
+                    for seed in range(args.cases):
+                        text = make_case(script, seed)
+                        for width in WIDTHS:
+                            expected = baseline_wrap(text, font, width)
+                            actual = wrap_text(text, font, width)
+                            checked += 1
+                            if actual != expected:
+                                print(f"不一致: {os.path.basename(path)} engine={engine.name} size={size} "
+                                      f"width={width} script={script} seed={seed}", file=sys.stderr)
+                                print(f"  文案: {text!r}", file=sys.stderr)
+                                for i, (a, b) in enumerate(zip(expected, actual)):
+                                    if a != b:
+                                        print(f"  第 {i} 行: 原算法 {a!r} / wrap_text {b!r}", file=sys.stderr)
+                                        break
+                                else:
+                                    print(f"  行数: 原算法 {len(expected)} / wrap_text {len(actual)}", file=sys.stderr)
+                                return 1
+    print(f"一致: {checked} 组 ({len(fonts)} 个字体，排版引擎 "
+          f"{', '.join(e.name for e in layout_engines())})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
-from utils.memeapp import MemeApp
-
-
-if __name__ == "__main__":
-    app = MemeApp()
-    app.run()
+import multiprocessing  # 渲染进程用 spawn 启动，打包成 exe 后需要 freeze_support
+from utils.memeapp import MemeApp
+
+
+if __name__ == "__main__":
+    # 打包后的 exe 里，渲染子进程会重新运行本文件，这里让它直接进入子进程逻辑而不是再开一个界面
+    multiprocessing.freeze_support()
+    app = MemeApp()
+    app.run()
@@ -0,0 +1,88 @@
+import os  # 导入操作系统模块，用于文件路径
+import sys  # 导入系统模块，用于设置导入路径
+import time  # 模拟耗时的创建过程
+import threading  # 多线程同时查询缓存
+import unittest  # 标准库测试框架
+
+# 与 utils 里的脚本一样按平铺方式导入模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'utils'))
+
+from cache import LRUCache  # noqa: E402
+
+# ==========================================
+#  LRUCache.get_or_create 的并发行为: 不同 key 并行创建，同一个 key 只创建一次
+#  用法: python -m unittest discover tests
+# ==========================================
+
+
+def run_threads(count, target):
+    """同时启动 count 个线程执行 target(序号)，等待全部结束"""
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+
+class GetOrCreateTest(unittest.TestCase):
+    def test_different_keys_run_in_parallel(self):
+        cache = LRUCache()
+        barrier = threading.Barrier(4, timeout=5)
+        results = []
+
+        def slow(i):
+            # factory 在锁内执行时其他线程到不了 barrier，这里会超时抛 BrokenBarrierError
+            barrier.wait()
+            return i
+
+        run_threads(4, lambda i: results.append(cache.get_or_create(i, lambda: slow(i))))
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+
+    def test_same_key_created_once(self):
+        cache = LRUCache()
+        calls = []
+        results = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.2)
+            return object()
+
+        run_threads(8, lambda i: results.append(cache.get_or_create('k', create)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_failed_creation_is_retried_by_waiter(self):
+        cache = LRUCache()
+        started = threading.Event()
+        results = []
+
+        def fail():
+            started.set()
+            time.sleep(0.2)
+            raise RuntimeError("cancelled")
+
+        def first(_):
+            try:
+                cache.get_or_create('k', fail)
+            except RuntimeError:
+                results.append('failed')
+
+        def second(_):
+            started.wait(5)
+            results.append(cache.get_or_create('k', lambda: 'value'))
+
+        threads = [threading.Thread(target=first, args=(0,)), threading.Thread(target=second, args=(1,))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(sorted(results), ['failed', 'value'])
+        self.assertEqual(cache.get('k'), 'value')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import io  # 动图写进内存
+import os  # 导入操作系统模块，用于文件路径
+import sys  # 导入系统模块，用于设置导入路径
+import unittest  # 标准库测试框架
+from unittest import mock  # 模拟没有 WebP 动画编码器的 Pillow
+from PIL import Image  # 生成测试帧、读回结果
+
+# 与 utils 里的脚本一样按平铺方式导入模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'utils'))
+
+import encoder  # noqa: E402
+
+# ==========================================
+#  WebP 动图写出: 私有的 WebPAnimEncoder 与 Image.save(save_all=True) 兜底写出相同的帧数和时长
+#  用法: python -m unittest discover tests
+# ==========================================
+
+COLORS = [(255, 0, 0, 255), (0, 255, 0, 128), (0, 0, 255, 255)]
+
+
+def encode_webp():
+    """用 open_animation_writer 写出三帧 WebP 动图，返回 (writer 类型, 读回的图片)"""
+    fp = io.BytesIO()
+    writer = encoder.open_animation_writer(fp, 'webp', (64, 48), loop=0)
+    for color in COLORS:
+        writer.add(Image.new('RGBA', (64, 48), color), 80)
+    writer.close()
+    fp.seek(0)
+    return type(writer), Image.open(fp)
+
+
+class WebPWriterTest(unittest.TestCase):
+    def check(self, image):
+        self.assertEqual(image.n_frames, len(COLORS))
+        for i, color in enumerate(COLORS):
+            image.seek(i)
+            pixel = image.convert('RGBA').getpixel((32, 24))
+            self.assertEqual(image.info['duration'], 80)  # 帧解码后才有时长
+            for got, want in zip(pixel, color):
+                self.assertLessEqual(abs(got - want), 8)
+
+    @unittest.skipIf(encoder._webp_anim_encoder() is None, "Pillow 没有 WebPAnimEncoder")
+    def test_stream_writer(self):
+        kind, image = encode_webp()
+        self.assertIs(kind, encoder.WebPStreamWriter)
+        self.check(image)
+
+    def test_save_all_fallback(self):
+        with mock.patch.object(encoder, '_webp_anim_encoder', return_value=None):
+            kind, image = encode_webp()
+        self.assertIs(kind, encoder.WebPSaveAllWriter)
+        self.check(image)
+
+
+if __name__ == "__main__":
+    unittest.main()
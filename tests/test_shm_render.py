@@ -0,0 +1,74 @@
+import os  # 导入操作系统模块，用于文件路径和结束渲染进程
+import sys  # 导入系统模块，用于设置导入路径
+import signal  # 模拟渲染进程被杀
+import tempfile  # 测试背景放在临时目录里
+import threading  # 等待回调线程交回的帧
+import unittest  # 标准库测试框架
+from PIL import Image  # 生成测试背景
+
+# 与 utils 里的脚本一样按平铺方式导入模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'utils'))
+
+from shm_render import ShmRenderWorker  # noqa: E402
+
+# ==========================================
+#  共享内存帧环的测试: 交给界面的帧必须完全不透明，渲染进程被杀后预览还能继续更新
+#  用法: python -m unittest discover tests
+# ==========================================
+
+
+class ShmRenderWorkerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """生成需要缩放的背景 (JPEG 1200x900、PNG 600x600)，启动一个渲染进程"""
+        cls.tmp = tempfile.TemporaryDirectory(prefix="sherry-test-")
+        folder = cls.tmp.name
+        grad = Image.linear_gradient('L')
+        rgb = Image.merge('RGB', (grad, Image.radial_gradient('L'), grad.transpose(Image.Transpose.ROTATE_90)))
+        rgb.resize((1200, 900)).save(os.path.join(folder, 'a.jpg'), quality=90)
+        rgb.resize((600, 600)).save(os.path.join(folder, 'b.png'))
+        cls.worker = ShmRenderWorker(folder, folder)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.worker.stop()
+        cls.tmp.cleanup()
+
+    def settings(self, bg, text="测试 test"):
+        return {'text': text, 'font_file': '', 'font_size': 80, 'use_outline': True, 'outline_width': 3,
+                'outline_color': (0, 0, 0), 'text_color': (255, 255, 255),
+                'bg_path': os.path.join(self.tmp.name, bg)}
+
+    def render(self, settings, size, timeout=60):
+        """提交一次渲染并等待帧，返回 (图片模式, 各通道极值)"""
+        done = threading.Event()
+        result = []
+
+        def callback(frame, generation):
+            result.append((frame.image.mode, frame.image.getextrema()))
+            frame.release()
+            done.set()
+
+        self.worker.submit(settings, size, callback)
+        self.assertTrue(done.wait(timeout), "渲染超时")
+        return result[0]
+
+    def test_frames_are_opaque(self):
+        for bg in ('a.jpg', 'b.png'):
+            for size in (300, 900):
+                with self.subTest(bg=bg, size=size):
+                    mode, extrema = self.render(self.settings(bg), size)
+                    self.assertEqual(mode, 'RGBA')
+                    self.assertEqual(extrema[3], (255, 255))
+
+    def test_recovers_after_worker_killed(self):
+        self.render(self.settings('a.jpg'), 300)
+        for process in list(self.worker._pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+        mode, extrema = self.render(self.settings('b.png', "重新启动"), 300)
+        self.assertEqual(extrema[3], (255, 255))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import os  # 导入操作系统模块，用于读取文件修改时间
+import threading  # 保护动图判断的记忆表
+from PIL import Image  # 导入 Pillow 库
+
+# ==========================================
+#  动图背景: 逐帧解码 -> 按批并行合成文字 -> 逐帧交给编码器
+#  文字排版和蒙版只算一次，每帧只做缩放、两次贴色和 (GIF) 映射到调色板
+# ==========================================
+
+_animated = {}  # (绝对路径, 修改时间) -> 帧数
+_animated_lock = threading.Lock()
+
+
+def frame_count(path):
+    """背景文件的帧数 (按 (路径, 修改时间) 记忆)，文件不存在或无法识别时返回 0"""
+    try:
+        path = os.path.abspath(path)
+        key = (path, os.stat(path).st_mtime_ns)
+    except (OSError, TypeError, ValueError):
+        return 0
+    with _animated_lock:
+        count = _animated.get(key)
+    if count is None:
+        try:
+            with Image.open(path) as img:
+                count = getattr(img, 'n_frames', 1)
+        except Exception:
+            count = 0
+        with _animated_lock:
+            _animated[key] = count
+    return count
+
+
+def is_animated(path):
+    """背景是否为多帧动图 (GIF / WebP / APNG)"""
+    return frame_count(path) > 1
+
+
+def iter_frames(src):
+    """
+    按顺序逐帧解码，生成 (RGBA 帧, 毫秒)
+    GIF 的后续帧由 Pillow 合成为完整画面，这里拿到的都是完整帧 (缩放留给合成线程做)
+    """
+    default = src.info.get('duration') or 100
+    for index in range(getattr(src, 'n_frames', 1)):
+        src.seek(index)
+        yield src.convert('RGBA'), src.info.get('duration') or default
+
+
+def has_alpha(src):
+    """背景是否带透明通道或透明色"""
+    return src.mode in ('RGBA', 'LA', 'PA') or 'transparency' in src.info
+
+
+def batched(iterable, n):
+    """[辅助] 按 n 个一组切分 (最后一组可能不足 n 个)"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _blends(colors):
+    """[辅助] 文字色、描边色以及两者之间抗锯齿边缘常见的过渡色"""
+    colors = [tuple(c[:3]) for c in colors]
+    extra = list(colors)
+    if len(colors) == 2:
+        a, b = colors
+        for t in (0.25, 0.5, 0.75):
+            extra.append(tuple(round(a[k] * (1 - t) + b[k] * t) for k in range(3)))
+    return extra
+
+
+def _opaque_colors(frame, limit=256):
+    """[辅助] 帧里不透明像素用到的颜色集合，超过 limit 种时返回 None"""
+    colors = frame.getcolors(limit)
+    if colors is None:
+        return None
+    return {rgba[:3] for _, rgba in colors if rgba[3] >= 128}
+
+
+class GifPalette:
+    def __init__(self, entries, colors=(), transparency=None):
+        """
+        GIF 输出用的一张调色板
+        entries: 原有颜色 [(r, g, b), ...]，一个都不改，下标也不变
+        colors: 希望加入的颜色 (文字色、描边色)，有空位时连同过渡色一起补上，没有空位就映射到最接近的已有颜色
+        transparency: 透明索引 (None 为不透明)
+        """
+        entries = [tuple(c) for c in entries][:256]
+        if transparency is not None:
+            while len(entries) <= transparency:
+                entries.append((0, 0, 0))
+        for color in _blends(colors):
+            if len(entries) >= 256:
+                break
+            if color not in entries:
+                entries.append(color)
+        self.entries = entries
+        self.colors = set(entries)
+        self.transparency = transparency
+
+        self.image = Image.new('P', (1, 1))
+        self.image.putpalette([v for color in entries for v in color] + [0, 0, 0] * (256 - len(entries)))
+
+        # 量化时不能选中透明索引：把它换成另一个同色的索引 (没有同色的就换成最接近的)
+        self._lut = None
+        if transparency is not None:
+            t_color = entries[transparency]
+            others = [i for i in range(len(entries)) if i != transparency]
+            if others:
+                substitute = min(others, key=lambda i: (sum((a - b) ** 2 for a, b in zip(entries[i], t_color)), i))
+                self._lut = list(range(256))
+                self._lut[transparency] = substitute
+
+    @classmethod
+    def from_source(cls, src, colors=()):
+        """
+        背景第一帧的全局调色板 (保留原有颜色和透明索引)
+        背景不是调色板图 (如 WebP 动图) 时用第一帧自适应出 248 色，空位留给文字色、过渡色和透明色
+        src: 已打开的背景 (位于第 0 帧)
+        """
+        transparency = None
+        entries = None
+        if src.mode == 'P':
+            palette = src.getpalette('RGB') or []
+            entries = [tuple(palette[i:i + 3]) for i in range(0, len(palette) - 2, 3)]
+            transparency = src.info.get('transparency')
+            if not isinstance(transparency, int):
+                transparency = None
+        if not entries:
+            first = src.convert('RGB').quantize(248, method=Image.Quantize.FASTOCTREE)
+            palette = first.getpalette('RGB')
+            entries = [tuple(palette[i:i + 3]) for i in range(0, len(palette) - 2, 3)]
+            if has_alpha(src):
+                transparency = len(entries)
+        return cls(entries, colors, transparency)
+
+    def for_frame(self, frame, colors=()):
+        """
+        GIF 的每一帧都可以带自己的局部调色板：
+        frame (缩放前的 RGBA 帧) 用到的颜色都在这张调色板里时直接返回 self，
+        否则按这一帧重新生成一张 (不超过 256 色时颜色完全保留，否则自适应量化)
+        """
+        used = _opaque_colors(frame)
+        if used is not None and used <= self.colors:
+            return self
+        if used is None:
+            quantized = frame.convert('RGB').quantize(248, method=Image.Quantize.FASTOCTREE)
+            palette = quantized.getpalette('RGB')
+            used = [tuple(palette[i:i + 3]) for i in range(0, len(palette) - 2, 3)]
+        entries = sorted(used)
+        transparency = None
+        if self.transparency is not None:
+            # 末尾放一个占位色作为透明索引 (不会被量化选中)
+            entries = entries[:255]
+            transparency = len(entries)
+            entries.append((0, 0, 0))
+        return GifPalette(entries, colors, transparency)
+
+    def apply(self, frame):
+        """RGBA 帧 -> 使用该调色板的 P 模式帧 (不抖动，半透明以下的像素设为透明索引)"""
+        quantized = frame.convert('RGB').quantize(palette=self.image, dither=Image.Dither.NONE)
+        if self._lut is not None:
+            quantized = quantized.point(self._lut)
+        if self.transparency is not None:
+            alpha = frame.getchannel('A')
+            if alpha.getextrema()[0] < 128:
+                quantized.paste(self.transparency, mask=alpha.point(lambda a: 255 if a < 128 else 0))
+        return quantized
@@ -0,0 +1,264 @@
+import os  # 导入操作系统模块，用于文件路径和目录操作
+import sys  # 导入系统模块，用于输出进度
+import csv  # 读取 CSV 文案表
+import json  # 读取 JSONL 文案表
+import time  # 统计耗时和吞吐量
+import argparse  # 命令行参数解析
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait  # 进程池
+from generator import ImageGenerator
+from layout_store import LayoutStore
+from font_coverage import CoverageIndex
+from render_settings import settings_from_record, parse_color
+from encoder import FORMATS, ANIMATED_FORMATS, encode_image, normalize_options
+from stats import RenderStats
+from glyph_atlas import shared_glyph_atlas
+from resource_index import ResourceIndex, IMAGE_EXTENSIONS, FONT_EXTENSIONS
+from stroke import STROKE_ENGINES
+
+# ==========================================
+#  批量生成: 无界面，读取 CSV / JSONL 文案表，用进程池并行渲染
+#  用法: python utils/batch.py captions.csv --workers 8
+# ==========================================
+
+# 每个工作进程里常驻的渲染器 (字体/背景/排版缓存随进程一直保持热状态)
+_worker_generator = None
+
+
+def _init_worker(bg_folder, font_folder, glyph_atlas=False, stroke_engine='freetype', layout_store=True):
+    """
+    [工作进程] 初始化常驻渲染器 (glyph_atlas 为真时启用字形图集后端)
+    layout_store 为真时各进程共用磁盘排版缓存，新开的进程也能直接复用其他进程算过的排版
+    """
+    global _worker_generator
+    _worker_generator = ImageGenerator(bg_folder=bg_folder, font_folder=font_folder,
+                                       glyph_atlas=shared_glyph_atlas if glyph_atlas else None,
+                                       stroke_engine=stroke_engine,
+                                       layout_store=LayoutStore() if layout_store else None,
+                                       coverage_index=CoverageIndex())
+
+
+def _size_path(save_path, size):
+    """[辅助] 多尺寸输出的文件名: 名字_边长.扩展名"""
+    stem, ext = os.path.splitext(save_path)
+    return f"{stem}_{size}{ext}"
+
+
+def _render_task(index, settings, save_path, fmt='png', options=None, sizes=None):
+    """
+    [工作进程] 渲染一张图并直接写盘，只把结果摘要传回主进程
+    sizes: 输出边长列表 (给出时每个尺寸各写一个 名字_边长 文件，排版只算一次)
+    返回: (序号, 保存路径, 耗时秒数, 错误信息或 None, 各阶段耗时 trace)
+    """
+    start = time.perf_counter()
+    stats = _worker_generator.stats
+    with stats.trace() as trace:
+        try:
+            if sizes:
+                targets = [(size, _size_path(save_path, size)) for size in sizes]
+            else:
+                targets = [(_worker_generator.CANVAS_SIZE, save_path)]
+            animated = fmt in ANIMATED_FORMATS and _worker_generator.is_animated_background(settings)
+            images = {} if animated else _worker_generator.render_sizes(settings, [s for s, _ in targets])
+            for size, path in targets:
+                if animated:
+                    # 动图背景: 逐帧贴字输出动图 (帧在进程内按批并行合成)
+                    data, info = _worker_generator.render_animation(settings, fmt, options, size=size)
+                else:
+                    data, info = encode_image(images[size], fmt, options)
+                    stats.add('encode', info['encode_ms'] / 1000)
+                with stats.timer('write'):
+                    with open(path, 'wb') as f:
+                        f.write(data)
+            error = None
+        except Exception as e:
+            error = str(e)
+    return index, save_path, time.perf_counter() - start, error, trace
+
+
+def read_records(path):
+    """
+    逐条读取文案表 (按扩展名区分 .csv / .jsonl)，生成器，不会一次性读入内存
+    CSV 需要表头，列名与 settings 字段相同 (text, bg_file, font_file, font_size ...)
+    JSONL 每行一个对象；纯字符串行视为只有 text 字段
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                yield row
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                yield record if isinstance(record, dict) else {'text': str(record)}
+
+
+def run_batch(input_path, output_folder="output_images", bg_folder="background_images",
+              font_folder="Font", defaults=None, workers=None, max_pending=None,
+              progress_every=100, log=sys.stderr, fmt='png', options=None, stats=None,
+              glyph_atlas=False, stroke_engine='freetype', sizes=None, layout_store=True):
+    """
+    批量渲染主流程
+    fmt / options: 输出格式和编码参数 (见 encoder.DEFAULT_OPTIONS)
+    stats: 汇总各工作进程上报的阶段耗时 (RenderStats)，默认新建一份
+    glyph_atlas: 工作进程使用字形图集后端 (输出与整行绘制一致，长文案更快)
+    stroke_engine: 描边引擎 ('freetype' / 'dilate'，见 ImageGenerator)
+    sizes: 输出边长列表，如 [900, 512, 240]；给出时每条文案按各尺寸分别写出 名字_边长 文件
+    layout_store: 工作进程共用排版结果磁盘缓存 (cache/layouts.sqlite3)，再次运行时跳过字号试探
+    同时在途的任务数有上限 (max_pending)，读表、渲染、写盘流水进行，内存占用与总数量无关
+    返回: dict (total, failed, seconds, images_per_sec, stats)
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    options = normalize_options(fmt, options)
+    ext = FORMATS[fmt][0]
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    stats = stats if stats is not None else RenderStats(window=1024)
+    # 用资源索引核对文案表里引用的背景/字体 (缺失时渲染会退回默认值，这里每个名字只提示一次)
+    bg_index = ResourceIndex(bg_folder, IMAGE_EXTENSIONS, 'image')
+    font_index = ResourceIndex(font_folder, FONT_EXTENSIONS, 'font')
+    missing = set()
+
+    def check_resources(settings):
+        bg_path = settings.get('bg_path')
+        if bg_path and os.path.abspath(os.path.dirname(bg_path)) == os.path.abspath(bg_folder):
+            name = os.path.basename(bg_path)
+            if name not in bg_index and ('bg', name) not in missing:
+                missing.add(('bg', name))
+                print(f"找不到背景: {name}", file=log)
+        font_file = settings.get('font_file')
+        if font_file and font_file not in font_index and ('font', font_file) not in missing:
+            missing.add(('font', font_file))
+            print(f"找不到字体: {font_file} (将使用默认字体)", file=log)
+
+    done = 0
+    failed = 0
+    start = time.perf_counter()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        prefix = "完成" if final else "进度"
+        print(f"{prefix}: {done} 张 (失败 {failed})，耗时 {elapsed:.1f}s，{rate:.1f} 张/秒", file=log)
+
+    def collect(futures):
+        nonlocal done, failed
+        for future in futures:
+            index, save_path, _, error, trace = future.result()
+            stats.record(trace)
+            done += 1
+            if error:
+                failed += 1
+                print(f"第 {index} 条渲染失败: {error}", file=log)
+            if progress_every and done % progress_every == 0:
+                report()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(bg_folder, font_folder, glyph_atlas, stroke_engine, layout_store)) as pool:
+        pending = set()
+        for index, record in enumerate(read_records(input_path)):
+            try:
+                settings = settings_from_record(record, bg_folder, defaults)
+            except (ValueError, TypeError) as e:
+                done += 1
+                failed += 1
+                print(f"第 {index} 条参数错误: {e}", file=log)
+                continue
+            check_resources(settings)
+            filename = os.path.basename(record.get("filename") or "") or f"{index:06d}{ext}"
+            save_path = os.path.join(output_folder, filename)
+            pending.add(pool.submit(_render_task, index, settings, save_path, fmt, options, sizes))
+
+            # 在途任务太多时先等一部分完成，避免把整张表都堆进队列
+            if len(pending) >= max_pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+        finished, _ = wait(pending)
+        collect(finished)
+
+    report(final=True)
+    stages = stats.snapshot()['stages']
+    if stages:
+        summary = "，".join(f"{name} {st['p50_ms']:.1f}/{st['p90_ms']:.1f}" for name, st in stages.items())
+        print(f"阶段耗时 p50/p90 (ms): {summary}", file=log)
+    elapsed = time.perf_counter() - start
+    return {
+        'total': done,
+        'failed': failed,
+        'seconds': elapsed,
+        'images_per_sec': done / elapsed if elapsed > 0 else 0.0,
+        'stats': stats.snapshot(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="橘雪莉表情包批量生成 (无界面)")
+    parser.add_argument('input', help="文案表: .csv (带表头) 或 .jsonl")
+    parser.add_argument('-o', '--output', default="output_images", help="输出文件夹")
+    parser.add_argument('--bg-folder', default="background_images", help="背景图片文件夹")
+    parser.add_argument('--font-folder', default="Font", help="字体文件夹")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="进程数，默认等于 CPU 核数")
+    parser.add_argument('--progress-every', type=int, default=100, help="每完成多少张输出一次进度")
+    parser.add_argument('--stats', default=None, help="把各阶段耗时统计 (JSON) 写入该文件")
+    parser.add_argument('--glyph-atlas', action='store_true', help="使用字形图集后端 (缓存单字蒙版)")
+    parser.add_argument('--stroke-engine', default='freetype', choices=STROKE_ENGINES,
+                        help="描边引擎: freetype 逐行描轮廓 / dilate 文字蒙版膨胀 (宽描边、长文案更快)")
+    # 编码参数：用 CPU 换体积
+    parser.add_argument('--format', default='png', choices=sorted(FORMATS), help="输出格式")
+    parser.add_argument('--png-level', type=int, default=None, help="PNG compress_level (0-9)")
+    parser.add_argument('--quality', type=int, default=None, help="WebP/JPEG 画质")
+    parser.add_argument('--lossless', action='store_true', help="WebP 使用无损压缩")
+    parser.add_argument('--quantize', type=int, default=None, help="PNG/WebP 调色板颜色数 (0 为不量化)")
+    parser.add_argument('--no-layout-store', action='store_true',
+                        help="不使用排版结果磁盘缓存 (cache/layouts.sqlite3)")
+    parser.add_argument('--sizes', default=None,
+                        help="输出边长，逗号分隔，如 900,512,240 (每个尺寸各写一个 名字_边长 文件)")
+    # 以下为每条记录缺省时使用的默认值
+    parser.add_argument('--bg-file', default=None, help="默认背景文件名")
+    parser.add_argument('--font-file', default=None, help="默认字体文件名")
+    parser.add_argument('--font-size', type=int, default=None, help="默认最大字号")
+    parser.add_argument('--text-color', default=None, help="默认文字颜色，如 #ffffff 或 255,255,255")
+    parser.add_argument('--outline-color', default=None, help="默认描边颜色")
+    parser.add_argument('--outline-width', type=int, default=None, help="默认描边宽度")
+    parser.add_argument('--no-outline', action='store_true', help="默认不描边")
+    args = parser.parse_args(argv)
+
+    defaults = {}
+    if args.bg_file:
+        defaults['bg_path'] = os.path.join(args.bg_folder, args.bg_file)
+    if args.font_file:
+        defaults['font_file'] = args.font_file
+    if args.font_size:
+        defaults['font_size'] = args.font_size
+    if args.text_color:
+        defaults['text_color'] = parse_color(args.text_color)
+    if args.outline_color:
+        defaults['outline_color'] = parse_color(args.outline_color)
+    if args.outline_width is not None:
+        defaults['outline_width'] = args.outline_width
+    if args.no_outline:
+        defaults['use_outline'] = False
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()] if args.sizes else None
+
+    options = {
+        'compress_level': args.png_level,
+        'quality': args.quality,
+        'lossless': args.lossless or None,
+        'quantize': args.quantize,
+    }
+    result = run_batch(args.input, args.output, args.bg_folder, args.font_folder, defaults,
+                       workers=args.workers, progress_every=args.progress_every,
+                       fmt=args.format, options=options, glyph_atlas=args.glyph_atlas,
+                       stroke_engine=args.stroke_engine, sizes=sizes,
+                       layout_store=not args.no_layout_store)
+    if args.stats:
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os  # 导入操作系统模块，用于读取文件修改时间
+import threading  # 导入多线程模块，缓存会被预览线程和批处理线程同时访问
+from collections import OrderedDict  # 有序字典，用来实现 LRU 淘汰顺序
+from PIL import Image, ImageFont  # 导入 Pillow 图像和字体模块
+
+
+class LRUCache:
+    def __init__(self, max_items=64, max_cost=None, cost=None):
+        """
+        线程安全的 LRU 缓存，带命中/未命中/淘汰计数
+        max_items: 最多缓存条目数
+        max_cost: 可选的总开销上限 (例如字节数)，配合 cost(value) 函数使用
+        """
+        self.max_items = max_items
+        self.max_cost = max_cost
+        self._cost = cost
+        self._costs = {}
+        self.total_cost = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self._creating = {}  # 正在被某个线程创建的 key -> 创建结束时置位的 Event
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """[辅助] 查询缓存，命中时把条目移到最新位置"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """[辅助] 写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self.discard(key)
+            self._data[key] = value
+            if self._cost is not None:
+                self._costs[key] = self._cost(value)
+                self.total_cost += self._costs[key]
+            # 至少保留刚写入的这一条
+            while len(self._data) > 1 and (
+                    len(self._data) > self.max_items or
+                    (self.max_cost is not None and self.total_cost > self.max_cost)):
+                old_key, _ = self._data.popitem(last=False)
+                self.total_cost -= self._costs.pop(old_key, 0)
+                self.evictions += 1
+
+    def discard(self, key):
+        """[辅助] 删除一个条目 (不存在时忽略)"""
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+                self.total_cost -= self._costs.pop(key, 0)
+
+    def get_or_create(self, key, factory):
+        """
+        查询缓存，未命中时调用 factory() 生成并写入
+        factory 在锁外执行 (不同 key 的字体加载、蒙版栅格化可以并行)；
+        同一个 key 同时只有一个线程在创建，其他线程等它结束后重新查询 (创建失败或被取消时自己再创建)
+        """
+        while True:
+            with self._lock:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return self._data[key]
+                event = self._creating.get(key)
+                if event is None:
+                    self.misses += 1
+                    event = self._creating[key] = threading.Event()
+                    break
+            event.wait()
+        try:
+            value = factory()
+            self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._creating.pop(key, None)
+            event.set()
+
+    def keys(self):
+        """[辅助] 当前所有 key 的快照"""
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        """[辅助] 清空缓存 (计数器保留)"""
+        with self._lock:
+            self._data.clear()
+            self._costs.clear()
+            self.total_cost = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        返回缓存统计信息
+        Returns: dict (size, hits, misses, evictions, hit_rate)
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+                'cost': self.total_cost,
+            }
+
+
+class FontCache(LRUCache):
+    """
+    字体对象缓存，按 (字体路径, 字号) 缓存 FreeTypeFont
+    大号 CJK 字体 (如 SourceHanSerifSC.otf) 加载一次要解析十几 MB 文件，
+    缓存后同一字号只会被解析一次
+    """
+
+    def get_font(self, font_path, size, stats=None):
+        """
+        获取 (font_path, size) 对应的字体对象，未缓存时才真正加载
+        stats: 可选的 RenderStats，真正加载时记录 font_load 阶段耗时
+        """
+        def load():
+            if stats is None:
+                return ImageFont.truetype(font_path, size)
+            with stats.timer('font_load'):
+                return ImageFont.truetype(font_path, size)
+        return self.get_or_create((font_path, size), load)
+
+    def get_default(self):
+        """获取 Pillow 默认字体 (与字号无关，只缓存一份)"""
+        return self.get_or_create(('', 0), ImageFont.load_default)
+
+
+class BackgroundCache(LRUCache):
+    """
+    背景图缓存：缓存已解码、已转 RGB、已缩放到目标尺寸的背景
+    key = (绝对路径, 修改时间, 目标尺寸, 缩放算法)，文件被修改后自动失效
+    按图片占用的字节数限制总内存 (900x900 RGB 约 2.4 MB 一张)
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_items=256):
+        super().__init__(max_items=max_items, max_cost=max_bytes,
+                         cost=lambda img: img.width * img.height * len(img.getbands()))
+
+    def get_background(self, bg_path, size=(900, 900), resample=Image.Resampling.LANCZOS, base=None,
+                       draft=False):
+        """
+        获取规整后的背景图 (缓存中的共享对象，调用方需要先 copy() 再绘制)
+        base: 给出时先取 (或解码出) base 尺寸的背景，再从它缩放到 size，
+              多尺寸导出时各尺寸共用一次解码 (结果只取决于参数，与缓存里已有什么无关)
+        draft: JPEG 用 draft 模式按 1/2 ~ 1/8 缩小解码 (小图用，背景对比表一次要解几十上百张)
+        文件不存在或解码失败时返回 None
+        """
+        try:
+            path = os.path.abspath(bg_path)
+            mtime = os.stat(path).st_mtime_ns
+        except (OSError, TypeError, ValueError):
+            return None
+        key = (path, mtime, tuple(size), resample)
+        if base is not None and tuple(base) != tuple(size):
+            key += (tuple(base),)
+        elif draft:
+            key += ('draft',)
+        img = self.get(key)
+        if img is not None:
+            return img
+        if base is not None and tuple(base) != tuple(size):
+            source = self.get_background(bg_path, base, resample)
+            if source is None:
+                return None
+            img = source.resize(tuple(size), resample)
+            self.put(key, img)
+            return img
+
+        # 同一文件的旧版本 (修改时间不同) 已经没用了，顺手清掉
+        for old_key in self.keys():
+            if old_key[0] == path and old_key[1] != mtime:
+                self.discard(old_key)
+
+        try:
+            with Image.open(path) as src:
+                if draft and src.format == 'JPEG':
+                    src.draft('RGB', tuple(size))
+                img = src.convert('RGB')
+            if img.size != tuple(size):
+                img = img.resize(tuple(size), resample)
+        except Exception as e:
+            print(f"背景加载失败: {e}")
+            return None
+        self.put(key, img)
+        return img
+
+
+# 进程内共享的字体缓存：预览和批处理使用同一份
+shared_font_cache = FontCache(max_items=64)
+# 进程内共享的背景缓存
+shared_background_cache = BackgroundCache()
+# 进程内共享的排版缓存：key 为 (文字, 字体, 最大字号, 绘制区域)，value 为排版结果 dict
+shared_layout_cache = LRUCache(max_items=512)
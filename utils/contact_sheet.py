@@ -0,0 +1,158 @@
+import os  # 导入操作系统模块，用于文件路径
+import sys  # 输出进度
+import math  # 计算默认列数
+import time  # 统计耗时
+import argparse  # 命令行参数解析
+from PIL import Image, ImageDraw, ImageFont  # 导入 Pillow 库，拼接对比表
+from generator import ImageGenerator
+from layout_store import LayoutStore
+from font_coverage import CoverageIndex
+from render_settings import settings_from_record
+from encoder import encode_image, format_from_path
+from stroke import STROKE_ENGINES
+
+# ==========================================
+#  背景对比表: 同一条文案贴到所有 (或筛选出的) 背景上，拼成一张图方便挑背景
+#  用法: python utils/contact_sheet.py "文案" --filter 猫 -o sheet.png
+# ==========================================
+
+PAD = 8        # 格子间距
+LABEL_H = 20   # 格子下方文件名一行的高度
+
+
+def sheet_columns(count):
+    """[辅助] 默认列数: 接近正方形"""
+    return max(1, math.ceil(math.sqrt(count)))
+
+
+def label_font(font_cache=None, font_path=None, size=14):
+    """[辅助] 文件名标签用的字体: 优先用文案字体 (中文文件名也能显示)，否则用 Pillow 默认字体"""
+    if font_path and os.path.isfile(font_path):
+        try:
+            if font_cache is not None:
+                return font_cache.get_font(font_path, size)
+            return ImageFont.truetype(font_path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default()
+
+
+def _fit_label(draw, name, font, width):
+    """[辅助] 太长的文件名截掉中间部分 (保留开头和扩展名附近)"""
+    keep = len(name)
+    label = name
+    while keep > 2 and draw.textlength(label, font=font) > width:
+        keep -= 1
+        label = name[:keep // 2] + "…" + name[len(name) - (keep - keep // 2):]
+    return label
+
+
+def make_contact_sheet(tiles, names=None, columns=None, font=None, background=(244, 244, 244)):
+    """
+    把若干张同样大小的格子拼成一张对比表，每格下方写文件名
+    tiles: 图片列表 (还没渲染好 / 渲染失败的位置为 None，画成灰色占位)
+    names: 与 tiles 对应的文件名列表，为 None 时不写标签
+    columns: 每行格子数，默认接近正方形
+    返回: RGB 图片
+    """
+    tile = next((t.size for t in tiles if t is not None), (240, 240))
+    columns = columns or sheet_columns(len(tiles))
+    rows = max(1, math.ceil(len(tiles) / columns))
+    label_h = LABEL_H if names else 0
+    cell_w, cell_h = tile[0] + PAD, tile[1] + label_h + PAD
+    sheet = Image.new('RGB', (columns * cell_w + PAD, rows * cell_h + PAD), background)
+    draw = ImageDraw.Draw(sheet)
+    font = font or ImageFont.load_default()
+    for i, image in enumerate(tiles):
+        x = PAD + (i % columns) * cell_w
+        y = PAD + (i // columns) * cell_h
+        if image is None:
+            draw.rectangle((x, y, x + tile[0] - 1, y + tile[1] - 1), fill=(200, 200, 200))
+        else:
+            sheet.paste(image, (x, y))
+        if names:
+            name = _fit_label(draw, names[i], font, tile[0])
+            draw.text((x + tile[0] / 2, y + tile[1] + label_h / 2), name, fill=(40, 40, 40),
+                      font=font, anchor='mm')
+    return sheet
+
+
+def render_contact_sheet(generator, settings, bg_paths, tile=240, columns=None, workers=None,
+                         cancel=None, labels=True, on_tile=None):
+    """
+    渲染整张背景对比表 (排版只算一次，各背景在线程池里并行贴字，见 ImageGenerator.iter_contact_tiles)
+    on_tile(已完成数, 总数): 每完成一格调用一次，用于显示进度
+    返回: RGB 图片
+    """
+    tiles = [None] * len(bg_paths)
+    done = 0
+    for index, _, image in generator.iter_contact_tiles(settings, bg_paths, tile, workers, cancel):
+        tiles[index] = image
+        done += 1
+        if on_tile is not None:
+            on_tile(done, len(bg_paths))
+    names = [os.path.basename(p) for p in bg_paths] if labels else None
+    font_path = os.path.join(generator.font_folder, settings.get('font_file') or '')
+    font = label_font(generator.font_cache, font_path)
+    with generator.stats.timer('contact_sheet'):
+        return make_contact_sheet(tiles, names, columns, font)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="橘雪莉表情包背景对比表 (同一条文案 x 所有背景)")
+    parser.add_argument('text', help="文案")
+    parser.add_argument('-o', '--output', default="contact_sheet.png", help="输出文件 (.png / .jpg / .webp)")
+    parser.add_argument('--bg-folder', default="background_images", help="背景图片文件夹")
+    parser.add_argument('--font-folder', default="Font", help="字体文件夹")
+    parser.add_argument('--filter', default=None, help="只用文件名包含该字符串的背景")
+    parser.add_argument('--tile', type=int, default=240, help="每格边长")
+    parser.add_argument('--columns', type=int, default=None, help="每行格子数，默认接近正方形")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="线程数，默认等于 CPU 核数")
+    parser.add_argument('--stroke-engine', default='freetype', choices=STROKE_ENGINES,
+                        help="描边引擎: freetype 逐行描轮廓 / dilate 文字蒙版膨胀")
+    parser.add_argument('--font-file', default=None, help="字体文件名")
+    parser.add_argument('--font-size', type=int, default=None, help="最大字号")
+    parser.add_argument('--text-color', default=None, help="文字颜色，如 #ffffff 或 255,255,255")
+    parser.add_argument('--outline-color', default=None, help="描边颜色")
+    parser.add_argument('--outline-width', type=int, default=None, help="描边宽度")
+    parser.add_argument('--no-outline', action='store_true', help="不描边")
+    args = parser.parse_args(argv)
+
+    record = {
+        'text': args.text,
+        'font_file': args.font_file,
+        'font_size': args.font_size,
+        'text_color': args.text_color,
+        'outline_color': args.outline_color,
+        'outline_width': args.outline_width,
+        'use_outline': False if args.no_outline else None,
+    }
+    settings = settings_from_record(record, args.bg_folder)
+    generator = ImageGenerator(bg_folder=args.bg_folder, font_folder=args.font_folder, ensure_dirs=False,
+                               stroke_engine=args.stroke_engine, layout_store=LayoutStore(),
+                               coverage_index=CoverageIndex())
+    entries = generator.bg_index.find(text=args.filter, valid=True)
+    if not entries:
+        print("没有符合条件的背景", file=sys.stderr)
+        return 1
+    bg_paths = [os.path.join(args.bg_folder, e['name']) for e in entries]
+
+    start = time.perf_counter()
+
+    def progress(done, total):
+        if done == total or done % 50 == 0:
+            print(f"进度: {done}/{total}", file=sys.stderr)
+
+    sheet = render_contact_sheet(generator, settings, bg_paths, args.tile, args.columns, args.workers,
+                                 on_tile=progress)
+    fmt = format_from_path(args.output)
+    data, _ = encode_image(sheet, fmt)
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    print(f"已保存: {args.output} ({len(bg_paths)} 张背景，{sheet.width}x{sheet.height}，"
+          f"耗时 {time.perf_counter() - start:.1f}s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
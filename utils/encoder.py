@@ -0,0 +1,251 @@
+import io  # 内存字节流，用于编码图片
+import os  # 按文件扩展名判断格式
+import time  # 统计编码耗时
+from concurrent.futures import ThreadPoolExecutor  # 编码线程 (不占用 UI 主线程)
+from PIL import Image, GifImagePlugin  # 导入 Pillow 库 (GIF 插件用于逐帧写出动图)
+from render_settings import parse_bool
+
+# ==========================================
+#  编码阶段: 可选格式 + 可调参数，可以在后台线程里跑
+#  用 CPU 换体积的取舍交给各部署自己配置
+# ==========================================
+
+# 格式名 -> (扩展名, Pillow 格式)
+FORMATS = {
+    'png': ('.png', 'PNG'),
+    'webp': ('.webp', 'WEBP'),
+    'jpeg': ('.jpg', 'JPEG'),
+    'gif': ('.gif', 'GIF'),
+}
+
+# 可以输出动图的格式
+ANIMATED_FORMATS = ('gif', 'webp')
+
+
+def format_from_path(path, default='png'):
+    """按文件扩展名取格式名 (不区分大小写，.jpeg 与 .jpg 相同)，不认识的扩展名返回 default"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.jpeg':
+        ext = '.jpg'
+    return next((name for name, (e, _) in FORMATS.items() if e == ext), default)
+
+# 各格式的默认编码参数
+#   png:  compress_level 0 (最快) ~ 9 (最小)
+#   webp: lossless 为 True 时无损；quality 有损时为画质，无损时为压缩力度；method 0 (快) ~ 6 (小)
+#   jpeg: quality 1 ~ 95
+#   gif:  只能是调色板图，quantize 为静态图的颜色数 (动图沿用背景的调色板)
+#   quantize: 调色板颜色数 (0 为不量化)，表情包贴纸用 256/128 色能小很多
+DEFAULT_OPTIONS = {
+    'png': {'compress_level': 6, 'quantize': 0},
+    'webp': {'quality': 90, 'lossless': False, 'method': 4, 'quantize': 0},
+    'jpeg': {'quality': 90},
+    'gif': {'quantize': 256},
+}
+
+
+def normalize_options(fmt, options=None):
+    """
+    补全编码参数 (未给出的项用默认值，未知项丢弃)
+    返回的 dict 可以直接参与缓存键计算
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的格式: {fmt}")
+    merged = dict(DEFAULT_OPTIONS[fmt])
+    for key, value in (options or {}).items():
+        if key in merged and value is not None:
+            if isinstance(merged[key], bool):
+                merged[key] = parse_bool(value)
+            else:
+                merged[key] = type(merged[key])(value)
+    return merged
+
+
+def encode_image(image, fmt='png', options=None):
+    """
+    编码图片
+    返回: (编码后的字节, 信息 dict (format, bytes, encode_ms, options))
+    """
+    options = normalize_options(fmt, options)
+    start = time.perf_counter()
+
+    save_options = dict(options)
+    colors = save_options.pop('quantize', 0)
+    if colors:
+        # 调色板量化：FASTOCTREE 比 MEDIANCUT 快得多，对表情包这类色块图效果足够
+        image = image.quantize(colors=max(2, min(256, colors)), method=Image.Quantize.FASTOCTREE)
+    if fmt == 'png':
+        # compress_level 较高时顺便让 Pillow 尝试更优的过滤器
+        save_options['optimize'] = options['compress_level'] >= 9
+
+    buf = io.BytesIO()
+    image.save(buf, FORMATS[fmt][1], **save_options)
+    data = buf.getvalue()
+    info = {
+        'format': fmt,
+        'bytes': len(data),
+        'encode_ms': (time.perf_counter() - start) * 1000,
+        'options': options,
+    }
+    return data, info
+
+
+class GifStreamWriter:
+    def __init__(self, fp, loop=None):
+        """
+        逐帧写出 GIF 动图：每加一帧就压缩写入 fp，不需要先把所有帧攒在内存里
+        (Pillow 的 save_all 会先收集全部帧再写)
+        第一帧的调色板作为全局颜色表，调色板与它不同的帧另带局部颜色表
+        loop: 循环次数 (0 为无限循环，None 为不写循环扩展，即只播放一次)
+        """
+        self.fp = fp
+        self.loop = loop
+        self.frames = 0
+        self.local_palettes = 0  # 带局部颜色表的帧数
+        self._palette = None
+
+    def add(self, frame, duration, transparency=None, disposal=0):
+        """写入一帧 (P 模式)，duration 为毫秒"""
+        if self.frames == 0:
+            info = {'loop': self.loop}
+            if transparency is not None:
+                info['transparency'] = transparency
+            header, _ = GifImagePlugin.getheader(frame, None, info)
+            for chunk in header:
+                self.fp.write(chunk)
+            self._palette = frame.getpalette()
+        palette = frame.getpalette()
+        params = {'duration': duration, 'disposal': disposal}
+        if palette != self._palette:
+            params['include_color_table'] = True
+            self.local_palettes += 1
+        if transparency is not None:
+            params['transparency'] = transparency
+        for chunk in GifImagePlugin.getdata(frame, (0, 0), **params):
+            self.fp.write(chunk)
+        self.frames += 1
+
+    def close(self):
+        """写入文件结束标记"""
+        self.fp.write(b";")
+
+
+def _webp_anim_encoder():
+    """
+    [辅助] Pillow 自带的 libwebp 动画编码器 (PIL._webp.WebPAnimEncoder)
+    这是 Pillow 的私有接口，没有稳定性保证 (按 pyproject 锁定的 Pillow 10.x 写的)；
+    没有编译 libwebp 动画支持、或者以后的版本改了接口时返回 None，改用 Image.save(save_all=True)
+    """
+    try:
+        from PIL import _webp
+    except ImportError:
+        return None
+    return getattr(_webp, 'WebPAnimEncoder', None)
+
+
+class WebPStreamWriter:
+    def __init__(self, fp, size, loop=0, quality=90, lossless=False, method=4):
+        """
+        逐帧写出 WebP 动图：每加一帧就交给 libwebp 的动画编码器压缩，
+        原始帧用完即可释放 (与 Pillow WebP 插件使用同一个编码器接口)
+        依赖 Pillow 的私有接口 PIL._webp.WebPAnimEncoder，不可用时见 WebPSaveAllWriter
+        """
+        encoder = _webp_anim_encoder()
+        if encoder is None:
+            raise OSError("当前 Pillow 没有 WebP 动画编码器")
+        self.fp = fp
+        self.size = size
+        self.options = (bool(lossless), int(quality), 100, int(method))
+        self.timestamp = 0
+        self.frames = 0
+        # 参数依次为: 宽、高、背景色、循环次数、minimize_size、kmin、kmax、allow_mixed、verbose
+        kmin, kmax = (9, 17) if lossless else (3, 5)
+        self._encoder = encoder(size[0], size[1], 0, loop or 0, False, kmin, kmax, False, False)
+
+    def add(self, frame, duration, transparency=None, disposal=0):
+        """写入一帧 (RGB 或 RGBA)，duration 为毫秒"""
+        mode = 'RGBA' if frame.mode == 'RGBA' else 'RGBX'
+        if frame.mode not in ('RGB', 'RGBA'):
+            frame = frame.convert('RGBA')
+            mode = 'RGBA'
+        self._encoder.add(frame.tobytes('raw', mode), round(self.timestamp), frame.size[0], frame.size[1],
+                          mode, *self.options)
+        self.timestamp += duration
+        self.frames += 1
+
+    def close(self):
+        """结束编码并写出"""
+        lossless, quality, alpha_quality, _ = self.options
+        self._encoder.add(None, round(self.timestamp), 0, 0, "", lossless, quality, alpha_quality, 0)
+        data = self._encoder.assemble("", b"", "")
+        if data is None:
+            raise OSError("WebP 动图编码失败")
+        self.fp.write(data)
+
+
+class WebPSaveAllWriter:
+    def __init__(self, fp, size, loop=0, quality=90, lossless=False, method=4):
+        """
+        WebP 动图的兜底写法 (没有 WebPAnimEncoder 时使用)：先收集全部帧，
+        close() 时用公开接口 Image.save(save_all=True) 一次写出，内存里会同时保留所有帧
+        """
+        self.fp = fp
+        self.size = size
+        self.loop = loop or 0
+        self.options = {'quality': int(quality), 'lossless': bool(lossless), 'method': int(method)}
+        self.frames = 0
+        self._images = []
+        self._durations = []
+
+    def add(self, frame, duration, transparency=None, disposal=0):
+        """收下一帧 (RGB 或 RGBA)，duration 为毫秒"""
+        if frame.mode not in ('RGB', 'RGBA'):
+            frame = frame.convert('RGBA')
+        self._images.append(frame)
+        self._durations.append(round(duration))
+        self.frames += 1
+
+    def close(self):
+        """一次写出全部帧"""
+        if not self._images:
+            raise OSError("WebP 动图编码失败")
+        first, *rest = self._images
+        first.save(self.fp, 'WEBP', save_all=True, append_images=rest, duration=self._durations,
+                   loop=self.loop, **self.options)
+        self._images = []
+
+
+def open_animation_writer(fp, fmt, size, options=None, loop=None):
+    """
+    按格式创建逐帧写出的动图编码器 (add(帧, 毫秒) ... close())
+    loop: 背景的循环次数 (0 为无限循环，None 为只播放一次)
+    options: 编码参数 (WebP 的 quality / lossless / method)
+    """
+    if fmt not in ANIMATED_FORMATS:
+        raise ValueError(f"不支持输出动图的格式: {fmt}")
+    options = normalize_options(fmt, options)
+    if fmt == 'gif':
+        return GifStreamWriter(fp, loop)
+    # WebP 里 0 才是无限循环；背景 GIF 没有循环扩展时只播放一次
+    loop = 1 if loop is None else loop
+    writer = WebPStreamWriter if _webp_anim_encoder() is not None else WebPSaveAllWriter
+    return writer(fp, size, loop, options['quality'], options['lossless'], options['method'])
+
+
+class AsyncEncoder:
+    def __init__(self, workers=1):
+        """
+        后台编码器：编码/保存任务在独立线程里执行，UI 主线程不会被卡住
+        """
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encoder")
+
+    def encode(self, image, fmt='png', options=None):
+        """提交编码任务，返回 Future，结果为 (字节, 信息)"""
+        return self._pool.submit(encode_image, image, fmt, options)
+
+    def submit(self, func, *args, **kwargs):
+        """提交任意保存/导出任务 (例如 ImageGenerator.save_image)，返回 Future"""
+        return self._pool.submit(func, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """关闭编码线程"""
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,391 @@
+import os  # 导入操作系统模块，用于文件路径和修改时间
+import sys  # 判断字节序
+import struct  # 解析 TrueType/OpenType 二进制表
+import threading  # 保护字体链缓存
+from array import array  # 字符区间的紧凑存储
+from PIL import ImageFont  # 导入 Pillow 字体模块
+from cache import LRUCache  # 复用通用 LRU 缓存
+from render_cache import file_digest  # 字体内容哈希 (作为覆盖表磁盘缓存的文件名)
+
+# ==========================================
+#  字形覆盖表与缺字回退:
+#  从字体的 cmap 表读出它能显示哪些字符，选中的字体缺字时，
+#  把一行文字拆成若干段 (run)，每段交给 Font 文件夹里能显示这些字的字体
+# ==========================================
+
+_MAGIC = b'CMAP1\n'
+_PLANES = 0x110000  # Unicode 码位总数
+
+
+def _merge(ranges):
+    """[辅助] 排序并合并相邻/重叠的闭区间"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def _cmap_format4(data, pos):
+    """[辅助] cmap 格式 4 (BMP 分段映射)，返回映射到非 0 字形的码位区间"""
+    seg_x2 = struct.unpack_from('>H', data, pos + 6)[0]
+    ends = pos + 14
+    starts = ends + seg_x2 + 2
+    deltas = starts + seg_x2
+    offsets = deltas + seg_x2
+    ranges = []
+    for i in range(seg_x2 // 2):
+        end = struct.unpack_from('>H', data, ends + 2 * i)[0]
+        start = struct.unpack_from('>H', data, starts + 2 * i)[0]
+        delta = struct.unpack_from('>h', data, deltas + 2 * i)[0]
+        range_offset = struct.unpack_from('>H', data, offsets + 2 * i)[0]
+        if start > end or start == 0xFFFF:
+            continue
+        if range_offset == 0:
+            # 字形号 = (码位 + delta) mod 65536，只有一个码位可能落到 0 号字形 (.notdef)
+            hole = -delta & 0xFFFF
+            if start <= hole <= end:
+                if start < hole:
+                    ranges.append((start, hole - 1))
+                if hole < end:
+                    ranges.append((hole + 1, end))
+            else:
+                ranges.append((start, end))
+            continue
+        # 通过 glyphIdArray 间接查表，逐个码位检查
+        base = offsets + 2 * i + range_offset
+        run = None
+        for code in range(start, end + 1):
+            addr = base + 2 * (code - start)
+            glyph = struct.unpack_from('>H', data, addr)[0] if addr + 2 <= len(data) else 0
+            if glyph and (glyph + delta) & 0xFFFF:
+                if run is None:
+                    run = [code, code]
+                else:
+                    run[1] = code
+            elif run is not None:
+                ranges.append(tuple(run))
+                run = None
+        if run is not None:
+            ranges.append(tuple(run))
+    return ranges
+
+
+def _cmap_format12(data, pos):
+    """[辅助] cmap 格式 12 (分组的 32 位映射，覆盖 emoji 等 BMP 以外的字符)"""
+    groups = struct.unpack_from('>I', data, pos + 12)[0]
+    ranges = []
+    for i in range(groups):
+        start, end, glyph = struct.unpack_from('>III', data, pos + 16 + 12 * i)
+        if glyph == 0:
+            start += 1
+        if start <= end:
+            ranges.append((start, min(end, _PLANES - 1)))
+    return ranges
+
+
+def read_cmap_ranges(path, index=0):
+    """
+    读取字体文件的 Unicode 覆盖范围 (只解析 cmap 表，不加载字形)
+    优先使用格式 12 的完整 Unicode 子表，其次格式 4 的 BMP 子表 (与 FreeType 选择 Unicode 字符表的顺序一致)
+    返回: 合并后的码位闭区间列表 [(起, 止), ...]；没有可用的 Unicode 子表时返回 None
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    base = 0
+    if data[:4] == b'ttcf':
+        # 字体集合：取第 index 个字体
+        base = struct.unpack_from('>I', data, 12 + 4 * index)[0]
+    num_tables = struct.unpack_from('>H', data, base + 4)[0]
+    cmap = None
+    for i in range(num_tables):
+        tag, _, offset, _ = struct.unpack_from('>4sIII', data, base + 12 + 16 * i)
+        if tag == b'cmap':
+            cmap = offset
+            break
+    if cmap is None:
+        return None
+
+    best = None  # (优先级, 格式, 子表位置)
+    count = struct.unpack_from('>H', data, cmap + 2)[0]
+    for i in range(count):
+        platform, encoding, offset = struct.unpack_from('>HHI', data, cmap + 4 + 8 * i)
+        pos = cmap + offset
+        fmt = struct.unpack_from('>H', data, pos)[0]
+        unicode = platform == 0 or (platform == 3 and encoding in (1, 10))
+        if not unicode or fmt not in (4, 12):
+            continue
+        rank = 2 if fmt == 12 else 1
+        if best is None or rank > best[0]:
+            best = (rank, fmt, pos)
+    if best is None:
+        return None
+    _, fmt, pos = best
+    ranges = _cmap_format12(data, pos) if fmt == 12 else _cmap_format4(data, pos)
+    return _merge(ranges)
+
+
+class FontCoverage:
+    def __init__(self, ranges):
+        """
+        单个字体的字符覆盖表
+        ranges: 排序合并后的码位闭区间 (磁盘上只存这个)；
+        内存里另外展开成按码位寻址的位图 (约 136 KB)，查询一个字符是 O(1)
+        """
+        self.ranges = ranges
+        self.count = sum(end - start + 1 for start, end in ranges)
+        bits = bytearray(_PLANES >> 3)
+        for start, end in ranges:
+            # 区间两端不满一个字节的部分逐位设置，中间整字节直接填 0xFF
+            first = (start + 7) >> 3
+            last = (end + 1) >> 3
+            if first >= last:
+                for code in range(start, end + 1):
+                    bits[code >> 3] |= 1 << (code & 7)
+                continue
+            for code in range(start, first << 3):
+                bits[code >> 3] |= 1 << (code & 7)
+            bits[first:last] = b'\xff' * (last - first)
+            for code in range(last << 3, end + 1):
+                bits[code >> 3] |= 1 << (code & 7)
+        self.bits = bits
+
+    def covers(self, char):
+        """字体里是否有这个字符的字形"""
+        code = ord(char)
+        return code < _PLANES and bool(self.bits[code >> 3] & (1 << (code & 7)))
+
+    def missing(self, text):
+        """text 里本字体显示不了的字符集合 (控制字符不算)"""
+        bits = self.bits
+        return {c for c in set(text)
+                if ord(c) >= 0x20 and not bits[ord(c) >> 3] & (1 << (ord(c) & 7))}
+
+
+class CoverageIndex:
+    def __init__(self, folder="cache/coverage", max_items=128):
+        """
+        字体覆盖表的两级缓存：内存里按 (路径, 大小, 修改时间)，
+        磁盘上按字体内容哈希存一份区间表 (每个字体只需要解析一次 cmap)
+        folder 为 None 时只用内存缓存，不读写磁盘
+        """
+        self.folder = folder
+        self._memory = LRUCache(max_items=max_items)
+        self.parsed = 0  # 实际解析 cmap 的次数
+
+    def _disk_path(self, digest):
+        return os.path.join(self.folder, digest + '.bin')
+
+    def _read(self, digest):
+        """[辅助] 读取磁盘缓存的区间表"""
+        try:
+            with open(self._disk_path(digest), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(_MAGIC):
+            return None
+        flat = array('I')
+        flat.frombytes(data[len(_MAGIC):])
+        if sys.byteorder != 'little':
+            flat.byteswap()
+        return list(zip(flat[0::2], flat[1::2]))
+
+    def _write(self, digest, ranges):
+        """[辅助] 写入磁盘缓存 (小端 uint32 的 起,止 序列)"""
+        flat = array('I', [v for r in ranges for v in r])
+        if sys.byteorder != 'little':
+            flat.byteswap()
+        path = self._disk_path(digest)
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(_MAGIC + flat.tobytes())
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"覆盖表缓存写入失败: {e}")
+
+    def get(self, font_path):
+        """
+        获取字体的覆盖表
+        文件不存在或没有 Unicode cmap (如符号字体) 时返回 None，表示"覆盖情况未知"
+        """
+        try:
+            path = os.path.abspath(font_path)
+            st = os.stat(path)
+        except (OSError, TypeError, ValueError):
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        def load():
+            digest = file_digest(path) if self.folder else None
+            ranges = self._read(digest) if digest else None
+            if ranges is None:
+                try:
+                    ranges = read_cmap_ranges(path)
+                except (OSError, struct.error, IndexError):
+                    ranges = None
+                self.parsed += 1
+                if ranges is None:
+                    return None
+                if digest:
+                    self._write(digest, ranges)
+            return FontCoverage(ranges)
+
+        return self._memory.get_or_create((path, st.st_size, st.st_mtime_ns), load)
+
+
+class FontChain:
+    def __init__(self, fonts, coverages):
+        """
+        回退字体链：fonts[0] 为主字体，其余按顺序作为缺字时的候选
+        对外提供排版用到的字体接口 (getlength / getbbox / size / layout_engine)，
+        换行、居中等代码可以像使用单个字体一样使用它
+        """
+        self.fonts = fonts
+        self.coverages = coverages
+        self.font = fonts[0]
+        self.size = getattr(self.font, 'size', 0)
+        basic = all(getattr(f, 'layout_engine', None) == ImageFont.Layout.BASIC for f in fonts)
+        self.layout_engine = ImageFont.Layout.BASIC if basic else ImageFont.Layout.RAQM
+        # 各字体按基线对齐：ImageDraw 以上缘 (ascender) 为锚点，换算成相对主字体的竖直偏移
+        ascent = fonts[0].getmetrics()[0]
+        self.offsets = [ascent - f.getmetrics()[0] for f in fonts]
+        self._choice = {}  # 字符 -> 字体序号
+
+    def font_index(self, char):
+        """[辅助] 负责显示 char 的字体序号 (每个字符只判断一次)"""
+        index = self._choice.get(char)
+        if index is None:
+            index = 0
+            if ord(char) >= 0x20:
+                for i, coverage in enumerate(self.coverages):
+                    if coverage is None or coverage.covers(char):
+                        index = i
+                        break
+            self._choice[char] = index
+        return index
+
+    def runs(self, text):
+        """把一行文字拆成连续同字体的段: [(字体序号, 文字), ...]"""
+        runs = []
+        start = 0
+        current = None
+        for i, char in enumerate(text):
+            index = self.font_index(char)
+            if index != current:
+                if current is not None:
+                    runs.append((current, text[start:i]))
+                current = index
+                start = i
+        if current is not None:
+            runs.append((current, text[start:]))
+        return runs
+
+    def place(self, text):
+        """逐段排布: [(字体, 文字, x 偏移, y 偏移), ...]"""
+        placed = []
+        x = 0.0
+        for index, run in self.runs(text):
+            font = self.fonts[index]
+            placed.append((font, run, x, self.offsets[index]))
+            x += font.getlength(run)
+        return placed
+
+    def getlength(self, text, *args, **kwargs):
+        """整行宽度 = 各段宽度之和 (不同字体的字之间没有字距修正)"""
+        return sum(self.fonts[index].getlength(run, *args, **kwargs) for index, run in self.runs(text))
+
+    def getbbox(self, text, *args, **kwargs):
+        """行高等度量沿用主字体"""
+        return self.font.getbbox(text, *args, **kwargs)
+
+    def getmetrics(self):
+        return self.font.getmetrics()
+
+
+class FontFallback:
+    def __init__(self, font_index, font_cache, coverage=None, max_chains=64, max_plans=256):
+        """
+        缺字回退：为 (文字, 主字体) 挑出能补全缺字的候选字体，并按字号组装 FontChain
+        候选来自字体资源索引 (Font 文件夹)，按文件名顺序
+        coverage: 覆盖表缓存 (CoverageIndex)，默认使用进程内共享、只在内存里的 shared_coverage_index
+        """
+        self.font_index = font_index
+        self.font_cache = font_cache
+        self.coverage = coverage if coverage is not None else shared_coverage_index
+        self._chains = LRUCache(max_items=max_chains)
+        self._plans = LRUCache(max_items=max_plans)
+
+    def plan(self, text, font_path):
+        """
+        返回回退方案: ((字体路径, 修改时间), ...)，第一个是主字体 (主字体文件不存在时为第一个候选)
+        主字体能显示全部文字、或者没有候选能补上缺字时返回 None (按原来的单字体绘制)
+        结果按 (文字, 主字体, 主字体和 Font 文件夹各字体的 (大小, 修改时间)) 记在内存里，
+        排版和计算内容地址时反复查询同一条文案不再逐个字体比对覆盖表
+        """
+        try:
+            st = os.stat(font_path)
+            primary = (st.st_size, st.st_mtime_ns)
+        except (OSError, TypeError, ValueError):
+            primary = None
+        fonts = tuple((e['name'], e['size'], e['mtime_ns']) for e in self.font_index.find(valid=True))
+        return self._plans.get_or_create((text, font_path, primary, fonts), lambda: self._plan(text, font_path))
+
+    def _plan(self, text, font_path):
+        """[辅助] 逐个字体比对覆盖表，挑出回退方案 (见 plan)"""
+        primary = self.coverage.get(font_path)
+        if primary is not None:
+            missing = primary.missing(text)
+        elif os.path.isfile(font_path):
+            # 主字体存在但读不出覆盖表，只能相信它
+            return None
+        else:
+            missing = {c for c in set(text) if ord(c) >= 0x20}
+        if not missing:
+            return None
+
+        chain = [font_path] if primary is not None else []
+        for entry in self.font_index.find(valid=True):
+            path = os.path.join(self.font_index.folder, entry['name'])
+            if os.path.abspath(path) == os.path.abspath(font_path):
+                continue
+            coverage = self.coverage.get(path)
+            if coverage is None:
+                continue
+            covered = {c for c in missing if coverage.covers(c)}
+            if covered:
+                chain.append(path)
+                missing -= covered
+                if not missing:
+                    break
+        if not chain or (primary is not None and len(chain) < 2):
+            return None
+        plan = []
+        for path in chain:
+            try:
+                plan.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                return None
+        return tuple(plan)
+
+    def font(self, plan, size, stats=None):
+        """按回退方案和字号取字体链 (同一方案同一字号只组装一次，字宽表随之复用)"""
+        def build():
+            fonts = [self.font_cache.get_font(path, size, stats) for path, _ in plan]
+            return FontChain(fonts, [self.coverage.get(path) for path, _ in plan])
+        return self._chains.get_or_create((plan, size), build)
+
+    def clear(self):
+        """清空已组装的字体链和回退方案 (覆盖表保留)"""
+        self._chains.clear()
+        self._plans.clear()
+
+
+# 进程内共享的覆盖表缓存 (只在内存里；需要跨进程、跨会话复用时由调用方传入带磁盘目录的 CoverageIndex)
+shared_coverage_index = CoverageIndex(folder=None)
@@ -0,0 +1,607 @@
+import os  # 导入操作系统模块，用于拼接背景路径
+import threading  # 背景对比表在后台线程里渲染
+from concurrent.futures import ThreadPoolExecutor  # 背景对比窗口常驻的贴字线程池
+from collections import OrderedDict  # 有序字典，限制已转换的缩略图数量
+import tkinter as tk  # 导入 tkinter，Python 标准 GUI 库
+from tkinter import ttk, filedialog, messagebox  # 导入 tkinter 的高级组件和弹窗工具
+from PIL import ImageTk  # 把缩略图转换为 tkinter 能显示的格式
+from encoder import encode_image, format_from_path
+from contact_sheet import render_contact_sheet
+
+
+class BackgroundGallery(tk.Toplevel):
+    # 每个格子的尺寸: 缩略图 + 文件名一行
+    PAD = 8
+    LABEL_H = 18
+    # 已转换成 PhotoImage 的缩略图上限 (只在主线程里使用)
+    MAX_PHOTOS = 300
+
+    def __init__(self, master, index, thumbnails, on_select, selected=None):
+        """
+        Description:
+            背景图库窗口：按网格显示缩略图，只为可见的格子 (及下一行) 请求缩略图，
+            几千张背景也能立即打开；滚动后不再可见的请求会被取消。
+            Background gallery window: a virtualized thumbnail grid that only requests
+            thumbnails for visible cells, so folders with thousands of images open instantly.
+
+        Args:
+            master (tk.Misc): 父窗口.
+            index (ResourceIndex): 背景资源索引.
+            thumbnails (ThumbnailCache): 缩略图缓存.
+            on_select (callable): 选中背景时调用 on_select(文件名).
+            selected (str): 当前选中的背景文件名. Defaults to None.
+
+        Returns:
+            None
+
+        Examples:
+            >>> BackgroundGallery(root, generator.bg_index, ThumbnailCache(), self._on_gallery_select)
+        """
+        super().__init__(master)
+        self.title("背景图库")
+        self.geometry("760x560")
+        self.index = index
+        self.thumbnails = thumbnails
+        self.on_select = on_select
+        self.selected = selected
+        self.cell_w = thumbnails.size + self.PAD * 2
+        self.cell_h = thumbnails.size + self.LABEL_H + self.PAD * 2
+        self._entries = []          # 当前显示的背景元数据 (已按搜索词过滤)
+        self._photos = OrderedDict()  # 文件名 -> PhotoImage
+        self._failed = set()          # 无法生成缩略图的文件名 (不再重复请求)
+        self._redraw_job = None
+
+        # 搜索框：按文件名过滤
+        self.var_filter = tk.StringVar()
+        top = ttk.Frame(self)
+        top.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(top, text="搜索:").pack(side=tk.LEFT)
+        entry = ttk.Entry(top, textvariable=self.var_filter)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.lbl_count = ttk.Label(top, text="")
+        self.lbl_count.pack(side=tk.RIGHT)
+        self.var_filter.trace_add('write', lambda *_: self._apply_filter())
+
+        # 缩略图网格：Canvas + 滚动条，只绘制可见区域
+        body = ttk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.canvas = tk.Canvas(body, background="#f4f4f4", highlightthickness=0)
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self._on_scroll)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind('<Configure>', lambda e: self._schedule_redraw())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<Double-Button-1>', lambda e: self.destroy())
+        # 鼠标滚轮 (Windows/macOS 用 MouseWheel，X11 用 Button-4/5)
+        self.canvas.bind('<MouseWheel>', lambda e: self._on_scroll('scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.canvas.bind('<Button-4>', lambda e: self._on_scroll('scroll', -1, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self._on_scroll('scroll', 1, 'units'))
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+
+        self._apply_filter()
+        entry.focus_set()
+
+    def _apply_filter(self):
+        """
+        Description:
+            按搜索词从索引里筛选背景 (只查内存中的索引，不访问图片)。
+            Filter backgrounds by the search text using the in-memory index.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._apply_filter()
+        """
+        self._entries = self.index.find(text=self.var_filter.get().strip() or None)
+        self.lbl_count.config(text=f"{len(self._entries)} 张")
+        self.canvas.yview_moveto(0)
+        self._schedule_redraw()
+
+    def _columns(self):
+        """[辅助] 当前窗口宽度下每行的格子数"""
+        return max(1, self.canvas.winfo_width() // self.cell_w)
+
+    def _on_scroll(self, *args):
+        """
+        Description:
+            滚动条/滚轮事件：滚动画布并重绘可见格子。
+            Scroll the canvas and redraw the visible cells.
+
+        Args:
+            *args: 传给 Canvas.yview 的参数.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._on_scroll('moveto', 0.5)
+        """
+        self.canvas.yview(*args)
+        self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        """[辅助] 合并短时间内的多次重绘请求"""
+        if self._redraw_job is None:
+            self._redraw_job = self.after_idle(self._redraw)
+
+    def _redraw(self):
+        """
+        Description:
+            重绘可见区域的格子，并为还没有缩略图的格子请求缩略图 (多预取一行)。
+            Redraw visible cells and request missing thumbnails (prefetching one extra row).
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._redraw()
+        """
+        self._redraw_job = None
+        if not self.winfo_exists():
+            return
+        cols = self._columns()
+        rows = (len(self._entries) + cols - 1) // cols
+        width = self.canvas.winfo_width()
+        self.canvas.configure(scrollregion=(0, 0, width, max(rows * self.cell_h, 1)))
+
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = int(top // self.cell_h) * cols
+        last = min(len(self._entries), (int(bottom // self.cell_h) + 2) * cols)
+
+        self.canvas.delete('cell')
+        size = self.thumbnails.size
+        wanted = []
+        for i in range(first, last):
+            entry = self._entries[i]
+            name = entry['name']
+            x = (i % cols) * self.cell_w + self.PAD
+            y = (i // cols) * self.cell_h + self.PAD
+            if name == self.selected:
+                self.canvas.create_rectangle(x - 4, y - 4, x + size + 4, y + size + self.LABEL_H + 2,
+                                             outline="#3b82f6", width=2, tags='cell')
+            photo = self._photos.get(name)
+            if photo is not None:
+                self._photos.move_to_end(name)
+                self.canvas.create_image(x + size // 2, y + size // 2, image=photo, tags='cell')
+            else:
+                self.canvas.create_rectangle(x, y, x + size, y + size, fill="#e0e0e0", outline="", tags='cell')
+                if name not in self._failed:
+                    wanted.append(entry)
+            label = name if len(name) <= 18 else name[:8] + "…" + name[-8:]
+            self.canvas.create_text(x + size // 2, y + size + self.LABEL_H // 2 + 2, text=label,
+                                    font=("TkDefaultFont", 8), tags='cell')
+
+        # 滚出可见区域的请求不再需要，只保留这一屏的
+        paths = [os.path.join(self.index.folder, e['name']) for e in wanted]
+        self.thumbnails.cancel_pending(keep=paths)
+        for entry, path in zip(wanted, paths):
+            self.thumbnails.request(path, entry,
+                                    lambda _, image, name=entry['name']: self._post_thumbnail(name, image))
+
+    def _post_thumbnail(self, name, image):
+        """[工作线程] 缩略图就绪，交回主线程显示"""
+        try:
+            self.after(0, self._on_thumbnail, name, image)
+        except (RuntimeError, tk.TclError):
+            # 窗口已关闭
+            pass
+
+    def _on_thumbnail(self, name, image):
+        """
+        Description:
+            [主线程] 把缩略图转换为 PhotoImage 并安排重绘。
+            [Main Thread] Convert the thumbnail to a PhotoImage and schedule a redraw.
+
+        Args:
+            name (str): 背景文件名.
+            image (Image): 缩略图，生成失败时为 None.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._on_thumbnail('1.png', thumb)
+        """
+        if not self.winfo_exists() or name in self._photos:
+            return
+        if image is None:
+            self._failed.add(name)
+            return
+        self._photos[name] = ImageTk.PhotoImage(image)
+        while len(self._photos) > self.MAX_PHOTOS:
+            self._photos.popitem(last=False)
+        self._schedule_redraw()
+
+    def _on_click(self, event):
+        """
+        Description:
+            点击格子选中对应的背景。
+            Select the background under the mouse.
+
+        Args:
+            event (tk.Event): 鼠标事件.
+
+        Returns:
+            None
+
+        Examples:
+            >>> # Bound to <Button-1>
+        """
+        cols = self._columns()
+        col = int(event.x // self.cell_w)
+        row = int(self.canvas.canvasy(event.y) // self.cell_h)
+        i = row * cols + col
+        if col >= cols or not 0 <= i < len(self._entries):
+            return
+        self.selected = self._entries[i]['name']
+        self.on_select(self.selected)
+        self._schedule_redraw()
+
+    def destroy(self):
+        """关闭窗口时取消所有还没开始的缩略图任务"""
+        self.thumbnails.cancel_pending()
+        if self._redraw_job is not None:
+            self.after_cancel(self._redraw_job)
+            self._redraw_job = None
+        super().destroy()
+
+
+class ContactSheetWindow(tk.Toplevel):
+    PAD = 8
+    LABEL_H = 18
+    MAX_PHOTOS = 300
+
+    def __init__(self, master, generator, get_settings, on_select, selected=None, tile=200):
+        """
+        Description:
+            背景对比窗口：把当前文案贴到所有 (或按文件名筛选出的) 背景上，渲染好一格显示一格；
+            排版只算一次，各背景在线程池里并行贴字，可导出为一张对比图；
+            只保留可见格子的 PhotoImage，滚回来时重新贴字 (背景走 tile_cache)，几千张背景也不会占满内存。
+            Contact-sheet window: renders the current caption on every (filtered) background in parallel,
+            fills the grid progressively and exports the whole grid as a single image.
+
+        Args:
+            master (tk.Misc): 父窗口.
+            generator (ImageGenerator): 渲染器.
+            get_settings (callable): 返回当前界面参数 (settings) 的函数.
+            on_select (callable): 点击格子时调用 on_select(文件名).
+            selected (str): 当前选中的背景文件名. Defaults to None.
+            tile (int): 每格边长. Defaults to 200.
+
+        Returns:
+            None
+
+        Examples:
+            >>> ContactSheetWindow(root, self.generator, self._collect_settings, self._on_gallery_select)
+        """
+        super().__init__(master)
+        self.title("背景对比")
+        self.geometry("900x640")
+        self.generator = generator
+        self.get_settings = get_settings
+        self.on_select = on_select
+        self.selected = selected
+        self.tile = tile
+        self.cell_w = tile + self.PAD * 2
+        self.cell_h = tile + self.LABEL_H + self.PAD * 2
+        self._entries = []            # 当前显示的背景元数据 (已按搜索词过滤)
+        self._index = {}              # 文件名 -> 在 _entries 里的序号
+        self._done = set()            # 这一轮已渲染完成的文件名 (格子本身不保留)
+        self._requested = set()       # 滚回可见区域后重新请求、还没回来的文件名
+        self._visible = (0, 0)        # 当前可见的格子序号范围 [first, last)
+        self._photos = OrderedDict()  # 文件名 -> PhotoImage (只保留最近可见的)
+        self._settings = None         # 这一轮渲染用的参数
+        self._generation = 0          # 每次重新渲染加一，旧一轮的结果直接丢弃
+        self._redraw_job = None
+        self._filter_job = None
+        # 贴字线程池 (整轮渲染和滚回来时的补渲染共用，关闭窗口时停掉)
+        self._pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="contact")
+
+        # 搜索框 + 刷新 / 导出按钮
+        self.var_filter = tk.StringVar()
+        top = ttk.Frame(self)
+        top.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(top, text="搜索:").pack(side=tk.LEFT)
+        entry = ttk.Entry(top, textvariable=self.var_filter)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.btn_export = ttk.Button(top, text="导出对比图...", command=self._export, state=tk.DISABLED)
+        self.btn_export.pack(side=tk.RIGHT)
+        ttk.Button(top, text="用当前文案刷新", command=self.refresh).pack(side=tk.RIGHT, padx=5)
+        self.lbl_count = ttk.Label(top, text="")
+        self.lbl_count.pack(side=tk.RIGHT, padx=5)
+        self.var_filter.trace_add('write', lambda *_: self._schedule_filter())
+
+        body = ttk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.canvas = tk.Canvas(body, background="#f4f4f4", highlightthickness=0)
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self._on_scroll)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind('<Configure>', lambda e: self._schedule_redraw())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<MouseWheel>', lambda e: self._on_scroll('scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.canvas.bind('<Button-4>', lambda e: self._on_scroll('scroll', -1, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self._on_scroll('scroll', 1, 'units'))
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+
+        self.refresh()
+        entry.focus_set()
+
+    def _schedule_filter(self):
+        """[辅助] 搜索词停止变化 300ms 后再重新渲染"""
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(300, self.refresh)
+
+    def refresh(self):
+        """
+        Description:
+            [主线程] 按搜索词筛选背景，用当前文案开始新一轮渲染 (上一轮未完成的部分作废)。
+            [Main Thread] Filter backgrounds and start a new render pass with the current caption.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> self.refresh()
+        """
+        self._filter_job = None
+        self._generation += 1
+        generation = self._generation
+        self._entries = self.generator.bg_index.find(text=self.var_filter.get().strip() or None, valid=True)
+        self._settings = self.get_settings()
+        self._index = {e['name']: i for i, e in enumerate(self._entries)}
+        self._done.clear()
+        self._requested.clear()
+        self._photos.clear()
+        self.btn_export.config(state=tk.DISABLED)
+        self._update_count()
+        self.canvas.yview_moveto(0)
+        self._schedule_redraw()
+
+        paths = [os.path.join(self.generator.bg_folder, e['name']) for e in self._entries]
+        names = [e['name'] for e in self._entries]
+        threading.Thread(target=self._render_task, args=(self._settings, paths, names, generation),
+                         daemon=True).start()
+
+    def _render_task(self, settings, paths, names, generation):
+        """[后台线程] 逐格渲染，完成一格交回主线程一格；窗口关闭或开始新一轮时停止"""
+        def cancel():
+            return generation != self._generation
+
+        try:
+            for index, _, image in self.generator.iter_contact_tiles(settings, paths, self.tile, cancel=cancel,
+                                                                     pool=self._pool):
+                self.after(0, self._on_tile, generation, names[index], image)
+        except Exception as e:
+            # 取消 (RenderCancelled) 或窗口已关闭
+            if not cancel():
+                print(f"背景对比渲染失败: {e}")
+
+    def _on_tile(self, generation, name, image):
+        """
+        Description:
+            [主线程] 一格渲染完成：可见时转成 PhotoImage，不可见时直接丢弃 (滚动到时再重新贴字)，
+            全部完成后允许导出。
+            [Main Thread] A tile is ready; keep it as a PhotoImage only if its cell is visible.
+
+        Args:
+            generation (int): 渲染轮次.
+            name (str): 背景文件名.
+            image (Image): 渲染好的格子.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._on_tile(1, '1.png', tile)
+        """
+        if generation != self._generation or not self.winfo_exists():
+            return
+        self._requested.discard(name)
+        first, last = self._visible
+        if first <= self._index.get(name, -1) < last:
+            self._photos[name] = ImageTk.PhotoImage(image)
+            while len(self._photos) > self.MAX_PHOTOS:
+                self._photos.popitem(last=False)
+        if name not in self._done:
+            self._done.add(name)
+            self._update_count()
+            if len(self._done) == len(self._entries):
+                self.btn_export.config(state=tk.NORMAL)
+        self._schedule_redraw()
+
+    def _update_count(self):
+        """[辅助] 显示渲染进度"""
+        total = len(self._entries)
+        done = len(self._done)
+        self.lbl_count.config(text=f"{total} 张" if done == total else f"{done}/{total}")
+
+    def _columns(self):
+        """[辅助] 当前窗口宽度下每行的格子数"""
+        return max(1, self.canvas.winfo_width() // self.cell_w)
+
+    def _on_scroll(self, *args):
+        """[辅助] 滚动画布并重绘可见格子"""
+        self.canvas.yview(*args)
+        self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        """[辅助] 合并短时间内的多次重绘请求"""
+        if self._redraw_job is None:
+            self._redraw_job = self.after_idle(self._redraw)
+
+    def _redraw(self):
+        """
+        Description:
+            重绘可见区域的格子，还没渲染好的格子显示灰色占位；
+            已渲染过但 PhotoImage 已被丢弃的格子重新请求贴字。
+            Redraw visible cells; tiles that are not ready yet are shown as grey placeholders,
+            tiles whose PhotoImage was dropped are rendered again.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._redraw()
+        """
+        self._redraw_job = None
+        if not self.winfo_exists():
+            return
+        cols = self._columns()
+        rows = (len(self._entries) + cols - 1) // cols
+        width = self.canvas.winfo_width()
+        self.canvas.configure(scrollregion=(0, 0, width, max(rows * self.cell_h, 1)))
+
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = int(top // self.cell_h) * cols
+        last = min(len(self._entries), (int(bottom // self.cell_h) + 1) * cols)
+        self._visible = (first, last)
+
+        self.canvas.delete('cell')
+        size = self.tile
+        missing = []
+        for i in range(first, last):
+            name = self._entries[i]['name']
+            x = (i % cols) * self.cell_w + self.PAD
+            y = (i // cols) * self.cell_h + self.PAD
+            if name == self.selected:
+                self.canvas.create_rectangle(x - 4, y - 4, x + size + 4, y + size + self.LABEL_H + 2,
+                                             outline="#3b82f6", width=2, tags='cell')
+            photo = self._photos.get(name)
+            if photo is None and name in self._done and name not in self._requested:
+                missing.append(name)
+            if photo is not None:
+                self._photos.move_to_end(name)
+                self.canvas.create_image(x + size // 2, y + size // 2, image=photo, tags='cell')
+            else:
+                self.canvas.create_rectangle(x, y, x + size, y + size, fill="#e0e0e0", outline="", tags='cell')
+            label = name if len(name) <= 24 else name[:11] + "…" + name[-11:]
+            self.canvas.create_text(x + size // 2, y + size + self.LABEL_H // 2 + 2, text=label,
+                                    font=("TkDefaultFont", 8), tags='cell')
+        if missing:
+            self._requested.update(missing)
+            generation = self._generation
+            for name in missing:
+                path = os.path.join(self.generator.bg_folder, name)
+                future = self._pool.submit(self.generator.contact_tile, self._settings, path, self.tile,
+                                           lambda: generation != self._generation)
+                future.add_done_callback(lambda f, name=name: self._post_tile(f, generation, name))
+
+    def _post_tile(self, future, generation, name):
+        """[线程池] 补渲染的一格完成后交回主线程 (取消或窗口已关闭时丢弃)"""
+        if future.cancelled() or generation != self._generation:
+            return
+        try:
+            image = future.result()
+            self.after(0, self._on_tile, generation, name, image)
+        except Exception as e:
+            # 取消 (RenderCancelled) 或窗口已关闭
+            if generation == self._generation:
+                print(f"背景对比渲染失败: {e}")
+
+    def _on_click(self, event):
+        """
+        Description:
+            点击格子选中对应的背景 (主窗口切换到该背景)。
+            Select the background under the mouse.
+
+        Args:
+            event (tk.Event): 鼠标事件.
+
+        Returns:
+            None
+
+        Examples:
+            >>> # Bound to <Button-1>
+        """
+        cols = self._columns()
+        col = int(event.x // self.cell_w)
+        row = int(self.canvas.canvasy(event.y) // self.cell_h)
+        i = row * cols + col
+        if col >= cols or not 0 <= i < len(self._entries):
+            return
+        self.selected = self._entries[i]['name']
+        self.on_select(self.selected)
+        self._schedule_redraw()
+
+    def _export(self):
+        """
+        Description:
+            把这一轮的所有背景重新贴字拼成一张对比图并保存 (在后台线程里进行；
+            排版和文字蒙版命中缓存，界面不保留全部格子)。
+            Re-render all tiles of the current pass in the background and save them as one image.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> # Triggered by the export button
+        """
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".png", initialfile="contact_sheet.png",
+                                            filetypes=[("PNG", "*.png"), ("JPEG", "*.jpg *.jpeg"), ("WebP", "*.webp")])
+        if not path:
+            return
+        settings = self._settings
+        paths = [os.path.join(self.generator.bg_folder, e['name']) for e in self._entries]
+        fmt = format_from_path(path)
+        self.btn_export.config(state=tk.DISABLED)
+
+        def task():
+            try:
+                sheet = render_contact_sheet(self.generator, settings, paths, self.tile)
+                data, _ = encode_image(sheet, fmt)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                result = None
+            except Exception as e:
+                result = e
+            try:
+                self.after(0, self._on_export_done, path, result)
+            except (RuntimeError, tk.TclError):
+                pass
+
+        threading.Thread(target=task, daemon=True).start()
+
+    def _on_export_done(self, path, error):
+        """[主线程] 导出完成后弹窗提示"""
+        if not self.winfo_exists():
+            return
+        self.btn_export.config(state=tk.NORMAL)
+        if error is not None:
+            messagebox.showerror("导出失败", str(error), parent=self)
+        else:
+            messagebox.showinfo("导出成功", f"对比图已保存至:\n{path}", parent=self)
+
+    def destroy(self):
+        """关闭窗口时让后台渲染停下来"""
+        self._generation += 1
+        for job in (self._redraw_job, self._filter_job):
+            if job is not None:
+                self.after_cancel(job)
+        self._redraw_job = self._filter_job = None
+        # 不等正在贴的格子 (它们会在下一个检查点发现代号已变而放弃)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
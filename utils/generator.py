@@ -1,17 +1,99 @@
 import os  # 导入操作系统模块，用于文件路径和目录操作
-from PIL import Image, ImageDraw, ImageFont, ImageTk  # 导入 Pillow 库，用于强大的图像处理
+import math  # 数学模块，用于拆分亚像素坐标
+import io  # 内存字节流，用于写出动图
+import time  # 统计各阶段耗时
+from concurrent.futures import ThreadPoolExecutor, as_completed  # 动图按批并行合成 / 背景对比并行出图
+from PIL import Image, ImageDraw  # 导入 Pillow 库，用于强大的图像处理 (不依赖 tkinter，可无界面运行)
+from cache import LRUCache, BackgroundCache, shared_font_cache, shared_background_cache, shared_layout_cache  # 缓存
+from wrapping import get_advance_table, wrap_text  # 线性时间换行引擎
+from render_cache import RenderCache, file_digest  # 内容寻址的渲染结果磁盘缓存；回退字体参与内容地址
+from encoder import FORMATS, ANIMATED_FORMATS, encode_image, normalize_options, open_animation_writer  # 可调参数的图片编码
+from stats import RenderStats  # 各阶段耗时与计数器
+from resource_index import ResourceIndex, IMAGE_EXTENSIONS, FONT_EXTENSIONS  # 背景/字体资源索引
+from font_coverage import FontChain, FontFallback  # 缺字时按字符覆盖表回退到其他字体
+from stroke import STROKE_ENGINES, stroke_from_fill  # 由文字蒙版膨胀得到描边
+from animation import GifPalette, batched, has_alpha, is_animated, iter_frames  # 动图背景的逐帧处理
+
+class RenderCancelled(Exception):
+    """渲染被更新的请求取代时抛出 (由 cancel 回调触发)"""
+
+
+def _check_cancel(cancel):
+    """[辅助] 检查点：cancel() 为真时中止渲染"""
+    if cancel is not None and cancel():
+        raise RenderCancelled()
+
+
+def _masks_cost(masks):
+    """[辅助] 估算一组蒙版占用的字节数"""
+    total = 0
+    for mask, _ in filter(None, masks):
+        if mask is not None:
+            total += mask.width * mask.height
+    return total
 
 class ImageGenerator:
-    def __init__(self, bg_folder="background_images", font_folder="Font"):
+    # 画布与文本绘制区域设定 (排版都在这张参考画布上算，其他输出尺寸按比例换算，见 render_sizes)
+    CANVAS_SIZE = 900
+    DRAW_AREA_W = 800         # 左右各留 50 边距
+    DRAW_AREA_BOTTOM_Y = 880  # 留底边距
+    DRAW_AREA_LIMIT_H = 300   # 限制文字只在下半部分区域
+    MIN_FONT_SIZE = 20
+
+    def __init__(self, bg_folder="background_images", font_folder="Font",
+                 font_cache=None, background_cache=None, layout_cache=None, render_cache=None,
+                 stats=None, glyph_atlas=None, index_folder="cache/index", ensure_dirs=True,
+                 stroke_engine='freetype', layout_store=None, coverage_index=None):
         """
         初始化图片渲染器
+        font_cache: 字体缓存，默认使用进程内共享的 shared_font_cache
+        background_cache: 背景缓存，默认使用进程内共享的 shared_background_cache
+        layout_cache: 排版缓存，默认使用进程内共享的 shared_layout_cache
+        render_cache: 可选的编码结果磁盘缓存 (RenderCache)，默认不启用 (不在工作目录下写 cache/renders)，
+                      由服务等需要跨请求复用编码结果的调用方传入
+        stats: 各阶段耗时统计 (RenderStats)，默认每个渲染器一份
+        glyph_atlas: 可选的字形图集 (GlyphAtlas)，给出时按单字蒙版拼贴文字，不再逐次让 FreeType 栅格化整行
+        index_folder: 背景/字体资源索引的保存位置
+        ensure_dirs: 是否立即创建资源/输出文件夹；为 False 时由调用方稍后调用 prepare_dirs() (界面启动时放到后台)
+        stroke_engine: 描边引擎，'freetype' 为逐行描轮廓 (与 draw.text(stroke_width=...) 一致)，
+                       'dilate' 为文字蒙版膨胀 (宽描边、长文案快得多，边角略有不同)；
+                       settings 里的 'stroke_engine' 可以按次覆盖 (界面里的"快速描边"选项)
+        layout_store: 可选的排版结果磁盘缓存 (LayoutStore)，给出时二分查找字号的结果跨会话、跨进程复用；
+                      默认不启用 (不在工作目录下自动建数据库)，由界面/批处理/服务按需传入
+        coverage_index: 字体覆盖表缓存 (CoverageIndex)，默认只在内存里 (不写 cache/coverage)；
+                        传入带磁盘目录的 CoverageIndex 时 cmap 解析结果跨会话、跨进程复用
         """
+        if stroke_engine not in STROKE_ENGINES:
+            raise ValueError(f"不支持的描边引擎: {stroke_engine}")
         self.bg_folder = bg_folder
         self.font_folder = font_folder
+        self.font_cache = font_cache if font_cache is not None else shared_font_cache
+        self.background_cache = background_cache if background_cache is not None else shared_background_cache
+        self.layout_cache = layout_cache if layout_cache is not None else shared_layout_cache
+        self.render_cache = render_cache
+        self.layout_store = layout_store
+        self.stats = stats if stats is not None else RenderStats()
+        self.glyph_atlas = glyph_atlas
+        self.stroke_engine = stroke_engine
+        # 背景/字体文件夹的持久化索引 (首次查询时才读取，之后增量更新)
+        self.bg_index = ResourceIndex(bg_folder, IMAGE_EXTENSIONS, 'image', index_folder)
+        self.font_index = ResourceIndex(font_folder, FONT_EXTENSIONS, 'font', index_folder)
+        # 缺字回退：主字体显示不了的字符交给 Font 文件夹里能显示它的字体
+        self.fallback = FontFallback(self.font_index, self.font_cache, coverage_index)
+        # 文字/描边蒙版缓存 (按字节数限制，单张 900x900 蒙版约 0.8 MB)
+        self.mask_cache = LRUCache(max_items=64, max_cost=64 * 1024 * 1024, cost=_masks_cost)
+        # 背景对比表用的小尺寸背景 (单独缓存，一次几百张也不会把预览用的背景挤出去)
+        self.tile_cache = BackgroundCache(max_bytes=64 * 1024 * 1024, max_items=1024)
+        # 最近一次排版结果 (字号、行、坐标、探测次数)，方便调试和性能对比
+        self.last_fit = None
         
-        # 自动创建文件夹
-        self._ensure_dir(bg_folder)
-        self._ensure_dir(font_folder)
+        if ensure_dirs:
+            self.prepare_dirs()
+
+    def prepare_dirs(self):
+        """自动创建背景、字体、输出文件夹"""
+        self._ensure_dir(self.bg_folder)
+        self._ensure_dir(self.font_folder)
         self._ensure_dir("output_images")
 
     def _ensure_dir(self, path):
@@ -21,7 +103,10 @@ class ImageGenerator:
             print(f"已创建目录: {path}")
 
     def get_files(self, folder, extensions):
-        """[辅助] 获取指定后缀的文件列表"""
+        """[辅助] 获取指定后缀的文件列表 (背景/字体文件夹直接查索引，按名称排序)"""
+        for index in (self.bg_index, self.font_index):
+            if os.path.abspath(folder) == os.path.abspath(index.folder):
+                return index.names(extensions)
         if not os.path.exists(folder):
             return []
         return [f for f in os.listdir(folder) if f.lower().endswith(extensions)]
@@ -31,127 +116,594 @@ class ImageGenerator:
         [辅助] 计算自动换行
         返回: (处理后的行列表, 总高度, 单行高度)
         """
-        lines = []
-        try:
-            # 获取单行高度 (bbox返回 left, top, right, bottom)
-            # 使用 'Ay' 这种比较高的字符来定高
-            bbox = font.getbbox("Ay") 
-            line_height = bbox[3] - bbox[1] + 10 # 额外加点行间距
-        except:
-            line_height = 30 # 兜底默认值
-
-        # 暴力换行算法
-        for paragraph in text.split('\n'):
-            current_line = ""
-            for char in paragraph:
-                test_line = current_line + char
-                # 计算这一行现在的宽度
-                w = font.getlength(test_line)
-                if w <= max_width:
-                    current_line = test_line
-                else:
-                    lines.append(current_line)
-                    current_line = char
-            if current_line:
-                lines.append(current_line)
-        
+        # 单遍换行：每个字宽按 (字体, 字号) 只测量一次，见 wrapping.py
+        table = get_advance_table(font)
+        calls = table.calls
+        with self.stats.timer('wrap'):
+            line_height = table.line_height()
+            lines = wrap_text(text, font, max_width)
+        self.stats.count('getlength', table.calls - calls)
+
         total_height = len(lines) * line_height
         return lines, total_height, line_height
 
-    def render_image(self, settings):
+    def fit_text(self, text, font_path, max_size, max_width, max_height, min_size=20, cancel=None,
+                 fallback=None):
+        """
+        [辅助] 字号自适应：在 [min_size, max_size] 内二分查找能放进区域的最大字号 (精度 1pt)
+        假设字号越小文字块越矮 (单调)，探测次数约为 log2(字号范围)
+        cancel: 可选的取消检查函数，每次探测前调用
+        fallback: 缺字回退方案 (FontFallback.plan)，给出时用回退字体链排版
+        返回: dict (font, size, lines, line_height, probes)，最小字号也放不下时返回 None
+        """
+        use_default = not fallback and not os.path.exists(font_path)
+        max_size = int(max_size)
+        probes = 0
+
+        def probe(size):
+            # 用指定字号排版一次，返回 (是否放得下, 字体, 行列表, 行高)
+            nonlocal probes
+            _check_cancel(cancel)
+            probes += 1
+            try:
+                if use_default:
+                    font = self.font_cache.get_default() # 兜底
+                elif fallback:
+                    font = self.fallback.font(fallback, size, self.stats)
+                else:
+                    font = self.font_cache.get_font(font_path, size, self.stats)
+                lines, h, line_h = self._calculate_wrapped_text(None, text, font, max_width)
+                return h <= max_height, font, lines, line_h
+            except Exception as e:
+                print(f"字体计算错误: {e}")
+                return False, None, [], 0
+
+        def result(size, font, lines, line_h):
+            return {'font': font, 'size': size, 'lines': lines,
+                    'line_height': line_h, 'probes': probes}
+
+        if max_size < min_size:
+            return None
+
+        # 大多数短文案在最大字号就能放下，先试一次
+        ok, font, lines, line_h = probe(max_size)
+        if ok:
+            return result(max_size, font, lines, line_h)
+        if use_default:
+            # 默认字体与字号无关，再试也没有意义
+            return None
+
+        best = None
+        lo, hi = min_size, max_size - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            ok, font, lines, line_h = probe(mid)
+            if ok:
+                best = (mid, font, lines, line_h)
+                lo = mid + 1
+            else:
+                hi = mid - 1
+
+        if best is None:
+            return None
+        return result(*best)
+
+    def layout_text(self, text, font_file, max_font_size, cancel=None):
+        """
+        [辅助] 计算文字排版 (字号、换行、行高、每行坐标)，结果按
+        (文字, 字体文件, 字体修改时间, 最大字号, 绘制区域) 缓存
+        只改颜色/描边/背景时不需要重新排版；内存未命中时再查磁盘排版缓存 (layout_store)，命中时 probes 为 0
+        返回: dict (key, font_path, size, use_default, lines, line_height, positions, probes)
+        """
+        font_path = os.path.join(self.font_folder, font_file or '')
+        try:
+            font_mtime = os.stat(font_path).st_mtime_ns
+        except OSError:
+            font_mtime = None
+        # 主字体缺字 (或字体文件不存在) 时的回退方案，按字符查覆盖位图，不需要逐字试画
+        fallback = self.fallback.plan(text, font_path)
+        key = (text, font_path, font_mtime, fallback, int(max_font_size),
+               self.CANVAS_SIZE, self.DRAW_AREA_W, self.DRAW_AREA_BOTTOM_Y, self.DRAW_AREA_LIMIT_H)
+        layout = self.layout_cache.get(key)
+        if layout is not None:
+            self.stats.count('layout_cache_hits')
+            return layout
+        self.stats.count('layout_cache_misses')
+
+        # 内存里没有时查磁盘缓存 (按字体内容哈希，其他会话/进程算过的排版直接复用)
+        store_key = None
+        if self.layout_store is not None:
+            store_key = self._layout_store_key(text, font_path, fallback, max_font_size)
+            stored = self.layout_store.get(store_key)
+            if stored is not None:
+                self.stats.count('layout_store_hits')
+                layout = {
+                    'key': key,
+                    'font_path': font_path,
+                    'size': stored['size'],
+                    'use_default': stored['use_default'],
+                    'fallback': fallback if stored['fallback'] else None,
+                    'lines': stored['lines'],
+                    'line_height': stored['line_height'],
+                    'positions': [tuple(p) for p in stored['positions']],
+                    'probes': 0,
+                }
+                self.layout_cache.put(key, layout)
+                return layout
+            self.stats.count('layout_store_misses')
+
+        # 自适应字体大小：二分查找能放进绘制区域的最大字号
+        with self.stats.timer('fit'):
+            fit = self.fit_text(text, font_path, max_font_size, self.DRAW_AREA_W,
+                                self.DRAW_AREA_LIMIT_H, self.MIN_FONT_SIZE, cancel, fallback)
+        if fit is not None:
+            font = fit['font']
+            lines = fit['lines']
+            line_h = fit['line_height']
+            size = fit['size']
+            probes = fit['probes']
+            self.stats.count('fits')
+            self.stats.count('fit_probes', probes)
+            if fallback:
+                self.stats.count('fallback_layouts')
+        else:
+            # 如果最小字号都放不下，就用默认字体兜底
+            font = self.font_cache.get_default()
+            lines = [text]
+            line_h = 20
+            size = 0
+            probes = 0
+            fallback = None
+        use_default = font is self.font_cache.get_default()
+
+        # 计算每行坐标：水平居中，整体底部对齐
+        total_h = len(lines) * line_h
+        start_y = self.DRAW_AREA_BOTTOM_Y - total_h
+        positions = []
+        for i, line in enumerate(lines):
+            line_w = font.getlength(line)
+            self.stats.count('getlength')
+            positions.append(((self.CANVAS_SIZE - line_w) // 2, start_y + i * line_h))
+
+        layout = {
+            'key': key,
+            'font_path': font_path,
+            'size': size,
+            'use_default': use_default,
+            'fallback': fallback,
+            'lines': lines,
+            'line_height': line_h,
+            'positions': positions,
+            'probes': probes,
+        }
+        self.layout_cache.put(key, layout)
+        if store_key is not None:
+            self.layout_store.put(store_key, {
+                'size': size,
+                'use_default': use_default,
+                'fallback': fallback is not None,
+                'lines': lines,
+                'line_height': line_h,
+                'positions': positions,
+            })
+        return layout
+
+    def _layout_store_key(self, text, font_path, fallback, max_font_size):
+        """[辅助] 排版结果在磁盘缓存里的 key (字体按内容哈希，改名/挪位置也能命中)"""
+        fallback_digests = [file_digest(path) for path, _ in fallback] if fallback else None
+        area = (self.CANVAS_SIZE, self.DRAW_AREA_W, self.DRAW_AREA_BOTTOM_Y,
+                self.DRAW_AREA_LIMIT_H, self.MIN_FONT_SIZE)
+        return self.layout_store.key(text, file_digest(font_path), fallback_digests, max_font_size, area)
+
+    def _layout_font(self, layout):
+        """[辅助] 取回排版结果对应的字体对象 (走字体缓存)"""
+        return self._layout_font_at(layout, layout['size'])
+
+    def _layout_font_at(self, layout, size):
+        """[辅助] 排版结果在指定字号下的字体 (默认字体 / 回退字体链 / 主字体)"""
+        if layout['use_default']:
+            return self.font_cache.get_default()
+        if layout.get('fallback'):
+            return self.fallback.font(layout['fallback'], size, self.stats)
+        return self.font_cache.get_font(layout['font_path'], size, self.stats)
+
+    def render_image(self, settings, cancel=None):
         """
         核心渲染函数
         Args:
             settings: 包含所有绘图参数的字典 (text, bg_path, font_name, size, color 等)
+            cancel: 可选的取消检查函数，返回 True 时在下一个检查点抛出 RenderCancelled
         Returns:
             PIL.Image 对象
         """
-        # 1. 加载背景
-        bg_path = settings.get('bg_path')
-        if not bg_path or not os.path.exists(bg_path):
-            # 如果没背景，创建一个灰色的空背景防止报错
-            img = Image.new('RGB', (900, 900), color='gray')
+        return self._render(settings, self.CANVAS_SIZE, Image.Resampling.LANCZOS, cancel)
+
+    def render_sizes(self, settings, sizes, cancel=None):
+        """
+        多尺寸导出：排版 (字号搜索 + 换行) 只在 900x900 的参考画布上做一次 (走排版缓存)，
+        每个尺寸把排版按比例换算后直接在该尺寸上栅格化文字，而不是把 900 的成品缩小 (小图文字更清晰)
+        背景按各尺寸分别高质量缩放 (走背景缓存)；多出的每个尺寸只多一次蒙版栅格化和合成
+        sizes: 输出边长列表，如 [900, 512, 240]
+        返回: {边长: PIL.Image}
+        """
+        images = {}
+        for size in sizes:
+            size = max(1, int(size))
+            if size not in images:
+                images[size] = self._render(settings, size, Image.Resampling.LANCZOS, cancel, stage='export')
+        return images
+
+    def render_bytes(self, settings, fmt='png', image=None, options=None, size=None):
+        """
+        渲染并编码，启用 render_cache 时结果按内容地址缓存在磁盘上 (同样的参数+背景+字体直接返回缓存字节)
+        image: 已经渲染好的图 (可选)，未命中缓存时直接编码它而不是重新渲染
+        背景是动图且格式为 GIF / WebP 时输出动图 (见 render_animation)，忽略 image
+        options: 编码参数，见 encoder.DEFAULT_OPTIONS
+        size: 输出边长 (默认 900，其他尺寸见 render_sizes)
+        返回: (编码后的字节, 内容地址 key, 信息 dict (format, bytes, encode_ms, cached))
+        """
+        size = max(1, int(size)) if size else self.CANVAS_SIZE
+        key = self._render_key(settings, fmt, options, size)
+        data = self.render_cache.get(key, fmt) if self.render_cache is not None else None
+        if data is not None:
+            self.stats.count('render_cache_hits')
+            return data, key, {'format': fmt, 'bytes': len(data), 'encode_ms': 0.0, 'cached': True}
+        if fmt in ANIMATED_FORMATS and self.is_animated_background(settings):
+            # 动图背景输出动图 (每一帧都贴上文字)，而不是只取第一帧
+            data, info = self.render_animation(settings, fmt, options, size=size)
         else:
-            try:
-                img = Image.open(bg_path).convert('RGB')
-                if img.size != (900, 900):
-                    img = img.resize((900, 900), Image.Resampling.LANCZOS)
-            except Exception as e:
-                print(f"背景加载失败: {e}")
-                img = Image.new('RGB', (900, 900), color='gray')
+            if image is None:
+                image = self.render_image(settings) if size == self.CANVAS_SIZE else self.render_sizes(settings, [size])[size]
+            data, info = encode_image(image, fmt, options)
+            self.stats.add('encode', info['encode_ms'] / 1000)
+        info['cached'] = False
+        if self.render_cache is not None:
+            self.render_cache.put(key, data, fmt)
+        return data, key, info
 
-        draw = ImageDraw.Draw(img)
-        text = settings.get('text', '')
-        if not text:
-            return img
+    def save_image(self, settings, folder="output_images", fmt='png', image=None, options=None, size=None):
+        """
+        保存到 folder，文件名取内容地址，同样的图只会存一份 (非 900 的尺寸在文件名后加 _边长)
+        返回: (保存路径, 是否新写入, 信息 dict)
+        """
+        size = max(1, int(size)) if size else self.CANVAS_SIZE
+        key = self._render_key(settings, fmt, options, size)
+        suffix = f"_{size}" if size != self.CANVAS_SIZE else ""
+        path = os.path.join(folder, key[:16] + suffix + FORMATS[fmt][0])
+        if os.path.exists(path):
+            return path, False, {'format': fmt, 'bytes': os.path.getsize(path), 'encode_ms': 0.0, 'cached': True}
+        data, _, info = self.render_bytes(settings, fmt, image, options, size)
+        self._ensure_dir(folder)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return path, True, info
+
+    def save_sizes(self, settings, sizes, folder="output_images", fmt='png', options=None):
+        """
+        按多个尺寸保存同一张图 (排版只算一次，见 render_sizes)
+        返回: {边长: (保存路径, 是否新写入, 信息 dict)}
+        """
+        return {size: self.save_image(settings, folder, fmt, options=options, size=size)
+                for size in dict.fromkeys(max(1, int(s)) for s in sizes)}
 
-        # 2. 加载字体
+    def is_animated_background(self, settings):
+        """背景是否为多帧动图 (按 (路径, 修改时间) 记忆，不重复打开文件)"""
+        bg_path = settings.get('bg_path')
+        return bool(bg_path) and is_animated(bg_path)
+
+    def render_animation(self, settings, fmt='gif', options=None, batch_size=8, workers=None, cancel=None,
+                         size=None):
+        """
+        动图背景逐帧出图：排版和文字蒙版只算一次；背景按顺序逐帧解码，
+        每批 batch_size 帧在线程池里并行缩放、贴字 (GIF 再映射到调色板)，再按原顺序逐帧交给编码器，
+        内存里同时只有一批帧；帧时长、循环次数、GIF 的调色板 (全局 + 各帧局部) 和透明色都沿用背景
+        size: 输出边长 (默认 900)
+        返回: (编码后的字节, 信息 dict (format, bytes, frames, encode_ms, options))
+        """
+        start = time.perf_counter()
+        edge = max(1, int(size)) if size else self.CANVAS_SIZE
+        size = (edge, edge)
+        caption = self._caption(settings, edge, cancel)
+        buf = io.BytesIO()
+        with Image.open(settings['bg_path']) as src:
+            palette = colors = None
+            disposal = 0
+            if fmt == 'gif':
+                colors = [c[:3] for c in caption[:2]] if caption is not None else []
+                palette = GifPalette.from_source(src, colors)
+                # 每帧都是完整画面：有透明色时先清空上一帧，否则直接覆盖
+                disposal = 2 if palette.transparency is not None else 1
+            alpha = has_alpha(src)
+            writer = open_animation_writer(buf, fmt, size, options, src.info.get('loop'))
+
+            def compose(item):
+                index, (frame, duration) = item
+                # GIF: 第一帧用全局调色板，之后颜色超出它的帧用自己的局部调色板
+                frame_palette = palette if index == 0 or palette is None else palette.for_frame(frame, colors)
+                if frame.size != size:
+                    frame = frame.resize(size, Image.Resampling.LANCZOS)
+                if caption is not None:
+                    self._paste_caption(frame, caption)
+                if frame_palette is not None:
+                    return frame_palette.apply(frame), duration, frame_palette.transparency
+                return (frame if alpha else frame.convert('RGB')), duration, None
+
+            workers = workers or min(batch_size, os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame") as pool:
+                for batch in batched(enumerate(iter_frames(src)), batch_size):
+                    _check_cancel(cancel)
+                    for frame, duration, transparency in pool.map(compose, batch):
+                        writer.add(frame, duration, transparency, disposal)
+            writer.close()
+
+        data = buf.getvalue()
+        elapsed = time.perf_counter() - start
+        self.stats.add('animation', elapsed)
+        self.stats.count('animation_frames', writer.frames)
+        info = {
+            'format': fmt,
+            'bytes': len(data),
+            'frames': writer.frames,
+            'encode_ms': elapsed * 1000,
+            'options': normalize_options(fmt, options),
+        }
+        return data, info
+
+    def contact_tile(self, settings, bg_path, tile=240, cancel=None, caption=None):
+        """
+        背景对比的一格：背景按 tile 边长缩小解码 (tile_cache，JPEG 用 draft 模式) 后贴上文字
+        caption: 已算好的文字图层 (见 _caption)，为 None 时现算 (排版和蒙版命中缓存)
+        """
+        _check_cancel(cancel)
+        tile = max(1, int(tile))
+        if caption is None:
+            caption = self._caption(settings, tile, cancel)
+        bg = None
+        if bg_path and os.path.exists(bg_path):
+            bg = self.tile_cache.get_background(bg_path, (tile, tile), Image.Resampling.BILINEAR, draft=True)
+        img = Image.new('RGB', (tile, tile), color='gray') if bg is None else bg.copy()
+        if caption is not None:
+            self._paste_caption(img, caption)
+        return img
+
+    def iter_contact_tiles(self, settings, bg_paths, tile=240, workers=None, cancel=None, pool=None):
+        """
+        背景对比：同一条文案贴到多张背景上，按完成顺序逐张产出 (序号, 背景路径, 图)
+        排版和文字蒙版按 tile 边长只算一次，每张背景只做 解码缩放 + 贴字，在线程池里并行
+        (解码、缩放、贴图时 Pillow 会释放 GIL)；JPEG 背景用 draft 模式缩小解码
+        cancel() 为真时停止产出，还没开始的背景不再渲染
+        pool: 调用方常驻的线程池 (如对比窗口)，为 None 时临时开一个 workers 个线程的池
+        """
+        start = time.perf_counter()
+        tile = max(1, int(tile))
+        caption = self._caption(settings, tile, cancel)
+        own = pool is None
+        if own:
+            pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="contact")
+        futures = {pool.submit(self.contact_tile, settings, path, tile, cancel, caption): (i, path)
+                   for i, path in enumerate(bg_paths)}
+        try:
+            for future in as_completed(futures):
+                _check_cancel(cancel)
+                index, path = futures[future]
+                self.stats.count('contact_tiles')
+                yield index, path, future.result()
+        finally:
+            # 提前结束 (取消或调用方不再迭代) 时丢掉排队中的背景
+            for future in futures:
+                future.cancel()
+            if own:
+                pool.shutdown()
+        self.stats.add('contact', time.perf_counter() - start)
+
+    def _render_key(self, settings, fmt, options=None, size=None):
+        """[辅助] 渲染结果的内容地址"""
         font_path = os.path.join(self.font_folder, settings.get('font_file', ''))
-        max_font_size = settings.get('font_size', 100)
-        
-        # 简单的自适应字体大小逻辑
-        # 从最大字号开始尝试，如果高度超了就减小
-        current_size = max_font_size
-        min_size = 20
-        final_font = None
-        final_lines = []
-        final_line_h = 0
-        
-        # 文本绘制区域设定
-        draw_area_w = 800
-        draw_area_bottom_y = 880 # 留底边距
-        draw_area_limit_h = 300  # 限制文字只在下半部分区域
+        # 用到的回退字体也参与内容地址 (往 Font 文件夹加字体后，缺字的图会重新渲染)
+        fallback = self.fallback.plan(settings.get('text', ''), font_path)
+        extra = [file_digest(path) for path, _ in fallback] if fallback else []
+        if fmt in ANIMATED_FORMATS and self.is_animated_background(settings):
+            extra.append('animated')
+        engine = self._stroke_engine(settings)
+        if engine != 'freetype' and settings.get('use_outline', False):
+            extra.append('stroke:' + engine)
+        if size and size != self.CANVAS_SIZE:
+            extra.append(f'size:{size}')
+        # 引擎已经按实际效果记在 extra 里 (默认的 freetype 不记)，不再让 settings 里的写法影响地址
+        settings = {k: v for k, v in settings.items() if k != 'stroke_engine'}
+        return RenderCache.key(settings, font_path, fmt, options, extra)
 
-        while current_size >= min_size:
-            try:
-                # 尝试加载字体
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, current_size)
-                else:
-                    font = ImageFont.load_default() # 兜底
-                
-                # 计算换行
-                lines, h, line_h = self._calculate_wrapped_text(draw, text, font, draw_area_w)
-                
-                if h <= draw_area_limit_h:
-                    # 找到了合适的大小
-                    final_font = font
-                    final_lines = lines
-                    final_line_h = line_h
-                    break
-            except Exception as e:
-                print(f"字体计算错误: {e}")
-            
-            current_size -= 5 # 缩小字号重试
-        
-        if final_font is None:
-            # 如果循环完了还没找到，就用最小的
-            final_font = ImageFont.load_default()
-            final_lines = [text]
-            final_line_h = 20
-
-        # 3. 绘制文字
-        # 计算起始Y坐标（底部对齐）
-        total_h = len(final_lines) * final_line_h
-        start_y = draw_area_bottom_y - total_h
-        
-        text_color = settings.get('text_color', (255, 255, 255))
-        use_outline = settings.get('use_outline', False)
-        outline_w = settings.get('outline_width', 2)
-
-        for i, line in enumerate(final_lines):
-            # 水平居中
-            line_w = final_font.getlength(line)
-            x = (900 - line_w) // 2
-            y = start_y + i * final_line_h
-
-            # 描边 (在上下左右偏移绘制黑色)
-            if use_outline:
-                # PIL 新版可以用 stroke_width, 但为了兼容旧逻辑我们手动画或者用参数
-                # 这里使用 PIL 原生 stroke 参数更高效
-                draw.text((x, y), line, font=final_font, fill=text_color, 
-                          stroke_width=outline_w, stroke_fill=(0,0,0))
+    def render_preview(self, settings, size, cancel=None):
+        """
+        草稿渲染：直接按预览尺寸 (size x size) 出图，用于打字时的快速预览
+        排版仍按 900x900 画布计算 (复用排版缓存，断行与高清图一致)，
+        字号和坐标按比例缩小后直接在小图上栅格化，背景用更便宜的 BILINEAR 缩放
+        """
+        size = max(1, min(int(size), self.CANVAS_SIZE))
+        return self._render(settings, size, Image.Resampling.BILINEAR, cancel)
+
+    def _render(self, settings, size, resample, cancel=None, stage=None):
+        """[辅助] 按指定输出边长渲染 (size == CANVAS_SIZE 时即高清原图)，总耗时记为 render / preview / export 阶段"""
+        stage = stage or ('render' if size == self.CANVAS_SIZE else 'preview')
+        start = time.perf_counter()
+        img = self._compose(settings, size, resample, cancel, derive=stage == 'export')
+        self.stats.add(stage, time.perf_counter() - start)
+        self.stats.count(stage + 's')
+        return img
+
+    def _compose(self, settings, size, resample, cancel=None, derive=False):
+        """
+        [辅助] 渲染流程：背景 -> 排版 -> 蒙版 -> 合成
+        derive: 比画布小的背景从画布尺寸的背景缩放得到 (多尺寸导出时只解码一次原图)
+        """
+        canvas = (size, size)
+        base = (self.CANVAS_SIZE, self.CANVAS_SIZE) if derive and size < self.CANVAS_SIZE else None
+        # 1. 加载背景 (缓存里是解码并缩放好的背景图，这里只做一次廉价的 copy)
+        with self.stats.timer('background'):
+            bg_path = settings.get('bg_path')
+            bg = None
+            if bg_path and os.path.exists(bg_path):
+                bg = self.background_cache.get_background(bg_path, canvas, resample, base)
+            if bg is None:
+                # 如果没背景 (或加载失败)，创建一个灰色的空背景防止报错
+                img = Image.new('RGB', canvas, color='gray')
             else:
-                draw.text((x, y), line, font=final_font, fill=text_color)
+                img = bg.copy()
 
+        caption = self._caption(settings, size, cancel)
+        if caption is not None:
+            with self.stats.timer('composite'):
+                self._paste_caption(img, caption)
         return img
+
+    def _caption(self, settings, size, cancel=None):
+        """
+        [辅助] 排版 -> 蒙版 (都走缓存)，背景无关，动图的每一帧共用同一份
+        返回: (文字色, 描边色, (文字蒙版, 区域), (描边蒙版, 区域) 或 None)；没有文字时返回 None
+        """
+        text = settings.get('text', '')
+        if not text:
+            return None
+        _check_cancel(cancel)
+
+        # 2. 排版 (走排版缓存)
+        with self.stats.timer('layout'):
+            layout = self.layout_text(text, settings.get('font_file', ''), settings.get('font_size', 100), cancel)
+        self.last_fit = layout
+
+        # 3. 合成文字：文字蒙版和描边蒙版只在排版/描边宽度变化时栅格化一次，
+        #    改颜色、换背景只需要按蒙版贴两次纯色
+        text_color = tuple(settings.get('text_color', (255, 255, 255)))
+        outline_color = tuple(settings.get('outline_color', (0, 0, 0)))
+        use_outline = settings.get('use_outline', False)
+        stroke_w = int(settings.get('outline_width', 2)) if use_outline else 0
+
+        _check_cancel(cancel)
+        fill, stroke = self._text_masks(layout, stroke_w, size, cancel, self._stroke_engine(settings))
+        return text_color, outline_color, fill, stroke
+
+    def _stroke_engine(self, settings):
+        """[辅助] 本次渲染使用的描边引擎 (settings 里给出时优先，否则用渲染器的默认值)"""
+        engine = settings.get('stroke_engine') or self.stroke_engine
+        if engine not in STROKE_ENGINES:
+            raise ValueError(f"不支持的描边引擎: {engine}")
+        return engine
+
+    def _paste_caption(self, img, caption):
+        """[辅助] 按蒙版把描边色、文字色贴到 img 上"""
+        text_color, outline_color, (fill_mask, fill_box), stroke = caption
+        if stroke is not None:
+            stroke_mask, stroke_box = stroke
+            img.paste(outline_color, stroke_box, stroke_mask)
+        if fill_mask is not None:
+            img.paste(text_color, fill_box, fill_mask)
+
+    def _scaled_layout(self, layout, size, stroke_width=0):
+        """
+        [辅助] 把 900x900 画布上的排版结果换算到 size x size 的输出
+        返回: (字体, [(行, (x, y)), ...], 描边宽度)；size 为画布尺寸时原样返回
+        """
+        font = self._layout_font(layout)
+        if size == self.CANVAS_SIZE:
+            return font, list(zip(layout['lines'], layout['positions'])), stroke_width
+
+        scale = size / self.CANVAS_SIZE
+        if not layout['use_default']:
+            font = self._layout_font_at(layout, max(1, round(layout['size'] * scale)))
+        if stroke_width > 0:
+            stroke_width = max(1, round(stroke_width * scale))
+        placed = []
+        for line, (_, y) in zip(layout['lines'], layout['positions']):
+            # 用缩放后字体的实际行宽重新居中，避免字宽取整误差导致偏移
+            x = (size - font.getlength(line)) // 2
+            self.stats.count('getlength')
+            placed.append((line, (x, y * scale)))
+        return font, placed, stroke_width
+
+    def _draw_mask_line(self, draw, xy, text, font, stroke_width=0):
+        """
+        [辅助] 在灰度蒙版上画一行文字 (或只画描边轮廓带)
+        与 ImageDraw.text 内部的单次绘制相同：亚像素起点 + getmask2 + draw_bitmap
+        启用字形图集时改为按单字蒙版拼贴 (结果一致)
+        回退字体链按段分别绘制，各段基线对齐
+        """
+        if isinstance(font, FontChain):
+            for run_font, run, dx, dy in font.place(text):
+                self._draw_mask_line(draw, (xy[0] + dx, xy[1] + dy), run, run_font, stroke_width)
+            return
+        if self.glyph_atlas is not None and self.glyph_atlas.supports(font, text):
+            self.glyph_atlas.draw_line(draw, xy, text, font, stroke_width)
+            return
+        coord = [int(xy[0]), int(xy[1])]
+        start = [math.modf(xy[0])[0], math.modf(xy[1])[0]]
+        bitmap, offset = font.getmask2(text, draw.fontmode, stroke_width=stroke_width, start=start)
+        draw.draw.draw_bitmap((coord[0] + offset[0], coord[1] + offset[1]), bitmap, 255)
+
+    def _text_masks(self, layout, stroke_width=0, size=None, cancel=None, engine=None):
+        """
+        [辅助] 把排版结果栅格化为灰度蒙版 (按 (排版, 描边宽度, 输出尺寸, 描边引擎) 缓存)
+        engine: 描边引擎，默认用渲染器的 stroke_engine
+        返回: ((文字蒙版, 区域), (描边蒙版, 区域) 或 None)，蒙版已裁剪到有内容的区域
+        """
+        size = size or self.CANVAS_SIZE
+        engine = engine or self.stroke_engine
+
+        def render():
+            font, placed, width = self._scaled_layout(layout, size, stroke_width)
+            canvas = (size, size)
+
+            def rasterize(width):
+                mask = Image.new('L', canvas, 0)
+                draw = ImageDraw.Draw(mask)
+                for line, (x, y) in placed:
+                    _check_cancel(cancel)
+                    parts = line.split('\n')
+                    if len(parts) > 1:
+                        # 兜底排版时整段文字是一行，按 Pillow 多行文字的行距逐行画
+                        spacing = font.getbbox("A", stroke_width=width)[3] + width + 4
+                    for k, part in enumerate(parts):
+                        self._draw_mask_line(draw, (x, y + k * spacing if k else y), part, font, width)
+                box = mask.getbbox()
+                if box is None:
+                    return None, None
+                return mask.crop(box), box
+
+            self.stats.count('mask_renders')
+            with self.stats.timer('glyphs'):
+                fill = rasterize(0)
+            stroke = None
+            if width > 0:
+                with self.stats.timer('stroke'):
+                    if engine == 'dilate':
+                        # 描边蒙版：文字蒙版按描边宽度膨胀，不再重新栅格化
+                        stroke = stroke_from_fill(fill, width)
+                    else:
+                        # 描边蒙版：只包含 FreeType 描出的轮廓带，与 draw.text(stroke_width=...) 一致
+                        stroke = rasterize(width)
+                if stroke is not None and stroke[0] is None:
+                    stroke = None
+            return fill, stroke
+
+        return self.mask_cache.get_or_create((layout['key'], stroke_width, size, engine if stroke_width else None),
+                                             render)
+
+    def stats_snapshot(self):
+        """各阶段耗时分位数、计数器和各级缓存命中率 (调试面板 / 批处理 / 服务 /metrics 共用)"""
+        data = self.stats.snapshot()
+        data['caches'] = {
+            'font': self.font_cache.stats(),
+            'background': self.background_cache.stats(),
+            'layout': self.layout_cache.stats(),
+            'mask': self.mask_cache.stats(),
+            'tile': self.tile_cache.stats(),
+        }
+        data['indexes'] = {'background': self.bg_index.stats(), 'font': self.font_index.stats()}
+        if self.glyph_atlas is not None:
+            data['caches']['glyph'] = self.glyph_atlas.stats()
+        if self.render_cache is not None:
+            data['caches']['render'] = self.render_cache.stats()
+        if self.layout_store is not None:
+            data['caches']['layout_store'] = self.layout_store.stats()
+        return data
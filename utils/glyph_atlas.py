@@ -0,0 +1,94 @@
+import math  # 数学模块，用于计算字形落点
+from PIL import Image, ImageFont  # 导入 Pillow 库
+from cache import LRUCache  # 复用通用 LRU 缓存
+from wrapping import get_advance_table  # 字宽/字距表 (与换行共用测量结果)
+
+
+def _glyph_cost(glyph):
+    """[辅助] 单个字形蒙版占用的字节数"""
+    image = glyph[0]
+    return image.width * image.height if image is not None else 0
+
+
+def _font_key(font):
+    """[辅助] 字体对象的缓存标识：有文件路径时按 (路径, 字号, 序号)，否则 (如默认字体) 按对象本身"""
+    path = getattr(font, 'path', None)
+    if isinstance(path, str):
+        return (path, font.size, font.index)
+    return font
+
+
+class GlyphAtlas(LRUCache):
+    """
+    字形蒙版图集：按 (字体, 字号, 描边宽度, 字符) 缓存栅格化好的单字蒙版
+    表情包文案反复出现同一批假名/汉字，每个字 (连同描边轮廓) 只需要让 FreeType 栅格化一次，
+    之后按字宽表的排版位置直接拼贴，结果与 Pillow 整行绘制逐像素一致
+
+    只用于 BASIC 布局的 FreeType 字体 (无连字/复杂整形)；其他情况由调用方退回整行绘制
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_items=16384):
+        super().__init__(max_items=max_items, max_cost=max_bytes, cost=_glyph_cost)
+
+    @staticmethod
+    def supports(font, text):
+        """是否可以用图集拼出这一行 (BASIC 布局的 FreeType 字体，且是单行文字)"""
+        return (isinstance(font, ImageFont.FreeTypeFont)
+                and font.layout_engine == ImageFont.Layout.BASIC
+                and '\n' not in text)
+
+    def glyph(self, font, char, stroke_width=0, mode='L'):
+        """
+        取单字蒙版 (未缓存时才栅格化)
+        返回: (蒙版或 None (空白字符), 相对原点的偏移)
+        """
+        def rasterize():
+            bitmap, offset = font.getmask2(char, mode, stroke_width=stroke_width)
+            if not bitmap.size[0] or not bitmap.size[1]:
+                return None, offset
+            return Image.frombytes('L', bitmap.size, bytes(bitmap)), offset
+
+        return self.get_or_create((_font_key(font), char, stroke_width, mode), rasterize)
+
+    def draw_line(self, draw, xy, text, font, stroke_width=0):
+        """
+        用图集拼出一行文字并画到灰度蒙版上，等价于 ImageDraw.text 的单次绘制：
+        笔位按 26.6 定点累加字宽和字距，每个字形落在 PIXEL(笔位 + 起点小数部分) 上，
+        字形之间重叠处按 alpha 叠加 (与 FreeType 整行渲染相同)，最后整行一次性贴到蒙版
+        """
+        table = get_advance_table(font)
+        coord = (int(xy[0]), int(xy[1]))
+        # 起点的小数部分换成 26.6 定点 (与 Pillow 内部一样截断取整)
+        start_x = int(math.modf(xy[0])[0] * 64)
+        start_y = int(math.modf(xy[1])[0] * 64)
+        # 竖直方向在 FreeType 坐标系 (y 向上) 里取整，正好半像素时舍去
+        py = -((32 - start_y) >> 6)
+
+        placed = []
+        pen = 0
+        prev = None
+        for char in text:
+            if prev is not None:
+                pen += round(table.pair(prev, char) * 64)
+            image, offset = self.glyph(font, char, stroke_width, draw.fontmode)
+            if image is not None:
+                px = (pen + start_x + 32) >> 6
+                placed.append((image, px + offset[0], py + offset[1]))
+            pen += round(table.advance(char) * 64)
+            prev = char
+        if not placed:
+            return
+
+        left = min(x for _, x, _ in placed)
+        top = min(y for _, _, y in placed)
+        right = max(x + image.width for image, x, _ in placed)
+        bottom = max(y + image.height for image, _, y in placed)
+        line = Image.new('L', (right - left, bottom - top), 0)
+        for image, x, y in placed:
+            # 按字形蒙版贴纯白：重叠处 out = src + dst * (255 - src) / 255，与 FreeType 整行合成的取整一致
+            line.paste(255, (x - left, y - top), image)
+        draw.draw.draw_bitmap((coord[0] + left, coord[1] + top), line.im, 255)
+
+
+# 进程内共享的字形图集 (界面、批处理、服务按需启用)
+shared_glyph_atlas = GlyphAtlas()
@@ -0,0 +1,170 @@
+import os  # 导入操作系统模块，用于文件路径和进程号
+import json  # 排版结果按 JSON 保存
+import time  # 记录最近使用时间
+import hashlib  # 计算排版 key
+import sqlite3  # 单文件数据库，WAL 模式下多进程可以同时读写
+import threading  # 每个线程各用一个数据库连接
+from PIL import Image, ImageFont, features  # 字体度量与 Pillow / FreeType / Raqm 版本有关
+
+# ==========================================
+#  排版结果持久化: 自适应字号的二分查找结果写进 SQLite，
+#  界面重启、批处理新开的工作进程直接读取，不再重新试字号
+# ==========================================
+
+# 影响字体度量的环境 (换了 Pillow/FreeType 或排版引擎后旧结果不再可信)
+_ENGINE = (Image.__version__, getattr(ImageFont.core, 'freetype2_version', None),
+           bool(features.check('raqm')))
+
+# 同一条目的"最近使用时间"最多隔这么久更新一次，避免每次读取都写库
+_TOUCH_INTERVAL = 60.0
+# 本进程每写入这么多条重新查询一次总大小 (其他进程的写入只有查询时才能看到)
+_RESCAN_WRITES = 64
+
+
+class LayoutStore:
+    def __init__(self, path="cache/layouts.sqlite3", max_bytes=64 * 1024 * 1024, timeout=5.0):
+        """
+        磁盘上的排版缓存 (SQLite，WAL 模式)
+        key = sha256(文字 + 字体内容哈希 + 回退字体内容哈希 + 最大字号 + 绘制区域 + 字体引擎版本)，
+        value = 排版结果 (字号、行、行高、坐标) 的 JSON
+        多个进程/线程可同时读写 (写入互斥由 SQLite 加锁，等锁最多 timeout 秒)，
+        总大小超过 max_bytes 时按最近使用时间淘汰
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._total = None  # 当前数据总字节数 (首次写入时查询，之后本进程写入累加、定期重新查询)
+        self._unscanned = 0  # 上次查询总大小之后本进程写入的条数
+        self._failed = False  # 数据库打不开时只提示一次，之后直接跳过
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text, font_digest, fallback_digests, max_size, area):
+        """
+        计算排版结果的 key
+        font_digest: 主字体内容哈希 (字体不存在时为 None)
+        fallback_digests: 回退字体链的内容哈希列表 (没有回退时为 None)
+        area: 画布与绘制区域的几何参数 (元组)
+        """
+        values = [text, font_digest, fallback_digests, int(max_size), list(area), list(_ENGINE)]
+        raw = json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _connect(self):
+        """[辅助] 当前线程的数据库连接 (fork 出来的子进程不沿用父进程的连接)"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._total = None
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        if self._failed:
+            return None
+        try:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS layouts ("
+                         "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                         "bytes INTEGER NOT NULL, used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS layouts_used ON layouts (used)")
+        except (OSError, sqlite3.Error) as e:
+            print(f"排版缓存打开失败: {e}")
+            self._failed = True
+            return None
+        self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """读取排版结果 (dict)，未命中返回 None"""
+        conn = self._connect()
+        row = None
+        if conn is not None:
+            try:
+                row = conn.execute("SELECT value, used FROM layouts WHERE key = ?", (key,)).fetchone()
+                if row is not None and time.time() - row[1] > _TOUCH_INTERVAL:
+                    conn.execute("UPDATE layouts SET used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error as e:
+                print(f"排版缓存读取失败: {e}")
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """写入排版结果 (可 JSON 序列化的 dict)，超出容量时淘汰最久未使用的条目"""
+        conn = self._connect()
+        if conn is None:
+            return
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        size = len(key) + len(data.encode('utf-8'))
+        try:
+            conn.execute("INSERT OR REPLACE INTO layouts (key, value, bytes, used) VALUES (?, ?, ?, ?)",
+                         (key, data, size, time.time()))
+            with self._lock:
+                self.writes += 1
+                self._unscanned += 1
+                if self._total is None or self._unscanned >= _RESCAN_WRITES:
+                    self._total = self._scan_total(conn)
+                    self._unscanned = 0
+                else:
+                    self._total += size
+                if self._total > self.max_bytes:
+                    self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"排版缓存写入失败: {e}")
+
+    def _scan_total(self, conn):
+        """[辅助] 查询数据总字节数 (其他进程也在写，淘汰前会重新查询)"""
+        return conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM layouts").fetchone()[0]
+
+    def _evict(self, conn):
+        """[辅助] 按最近使用时间从旧到新删除，直到降到容量的 90%"""
+        total = self._scan_total(conn)
+        target = self.max_bytes * 0.9
+        while total > target:
+            # 每轮删掉最旧的一批 (一条 DELETE 一个事务，不会长时间占着写锁)
+            cur = conn.execute("DELETE FROM layouts WHERE key IN "
+                               "(SELECT key FROM layouts ORDER BY used LIMIT 256)")
+            if cur.rowcount <= 0:
+                break
+            self.evictions += cur.rowcount
+            total = self._scan_total(conn)
+        self._total = total
+
+    def clear(self):
+        """清空排版缓存"""
+        conn = self._connect()
+        if conn is None:
+            return
+        try:
+            conn.execute("DELETE FROM layouts")
+        except sqlite3.Error as e:
+            print(f"排版缓存清空失败: {e}")
+        with self._lock:
+            self._total = 0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'bytes': self._total,
+            }
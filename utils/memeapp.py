@@ -1,16 +1,36 @@
 import os  # 导入操作系统模块，用于文件路径和目录操作
-import time  # 导入时间模块，用于生成时间戳文件名
-import threading  # 导入多线程模块，用于后台生成图片，防止界面卡死
+import time  # 统计启动各阶段耗时
+import threading  # 资源索引和字体预热在后台线程里进行
+import shutil  # 复制动图背景文件
 import tkinter as tk  # 导入 tkinter，Python 标准 GUI 库
 from tkinter import ttk, filedialog, messagebox, colorchooser  # 导入 tkinter 的高级组件和弹窗工具
 from PIL import Image, ImageTk  # 导入 Pillow 库，用于强大的图像处理
 from generator import ImageGenerator
+from shm_render import ShmRenderWorker
+from encoder import AsyncEncoder
+from glyph_atlas import shared_glyph_atlas
+from layout_store import LayoutStore
+from font_coverage import CoverageIndex
+from render_cache import RenderCache
+from render_settings import SETTING_RANGES
+from thumbnails import ThumbnailCache
+from gallery import BackgroundGallery, ContactSheetWindow
 
 # ==========================================
 #  UI 交互层: 负责显示和用户输入
 #  (View/Controller Layer: Handles UI)
 # ==========================================
 class MemeApp:
+    # 保存格式预设: 显示名 -> (格式, 编码参数)；贴纸预设用 256 色调色板，体积小很多
+    SAVE_PRESETS = {
+        "PNG": ('png', {}),
+        "PNG 贴纸 (256色)": ('png', {'quantize': 256, 'compress_level': 9}),
+        "WebP": ('webp', {}),
+        "JPEG": ('jpeg', {}),
+        # 背景是动图时输出动图 (WebP 同样支持)，静态背景为 256 色 GIF
+        "GIF 动图": ('gif', {}),
+    }
+
     def __init__(self):
         """
         Description:
@@ -27,6 +47,11 @@ class MemeApp:
             >>> app = MemeApp()
             >>> app.run()
         """
+        # 启动计时起点，各阶段耗时记在 self.startup_timings (阶段 -> 毫秒)
+        self._startup_t0 = time.perf_counter()
+        self._startup_last = self._startup_t0
+        self.startup_timings = {}
+
         # 创建 tkinter 主窗口
         self.root = tk.Tk()
         # 设置窗口标题
@@ -34,42 +59,170 @@ class MemeApp:
         # 设置窗口初始大小 (宽x高)
         self.root.geometry("1000x700") 
         
-        # 初始化我们上面定义的图片渲染器
-        self.generator = ImageGenerator()
+        # 初始化我们上面定义的图片渲染器 (启用字形图集：打字时同一批字不再重复栅格化)
+        # 创建文件夹等磁盘操作推迟到后台启动阶段，窗口先出来
+        # 描边引擎默认 FreeType (与之前的输出一致)，"快速描边"选项按次切换为蒙版膨胀
+        self.generator = ImageGenerator(glyph_atlas=shared_glyph_atlas, ensure_dirs=False, layout_store=LayoutStore(),
+                                        coverage_index=CoverageIndex(), render_cache=RenderCache())
+        # 渲染进程：最新请求优先，旧请求会被取消；像素写在共享内存帧环里，界面直接包装不复制，
+        # 渲染再重也不会占住界面线程的 GIL
+        self.render_worker = ShmRenderWorker(self.generator.bg_folder, self.generator.font_folder,
+                                             max_size=self.generator.CANVAS_SIZE, stats=self.generator.stats,
+                                             glyph_atlas=True, layout_store=True, coverage_index=True)
+        # 编码/保存线程：压缩在后台进行，点击保存不会卡住界面
+        self.encoder = AsyncEncoder()
         
         # --- 定义绑定到 UI 控件的变量 ---
         # 文字颜色，默认白色
         self.var_text_color = (255, 255, 255) 
+        # 描边颜色，默认黑色
+        self.var_outline_color = (0, 0, 0)
         # 字体大小，绑定到滑块
         self.var_font_size = tk.IntVar(value=100)
         # 是否描边，绑定到复选框
         self.var_use_outline = tk.BooleanVar(value=True)
         # 描边宽度，绑定到滑块
         self.var_outline_width = tk.IntVar(value=3)
+        # 快速描边 (文字蒙版膨胀，宽描边、长文案更快，边角与 FreeType 略有差别)，默认关闭
+        self.var_fast_stroke = tk.BooleanVar(value=False)
         # 背景文件名，绑定到下拉框
         self.var_bg_file = tk.StringVar()
         # 字体文件名，绑定到下拉框
         self.var_font_file = tk.StringVar()
+        # 保存格式，绑定到下拉框 (见 SAVE_PRESETS)
+        self.var_save_format = tk.StringVar(value="PNG")
         
         # --- 内部状态变量 ---
-        # 用于缓存当前生成的高清大图 (用于保存)
+        # 用于缓存当前生成的高清大图 (用于保存)，它引用帧环里的槽位，换图时释放
         self.current_image_obj = None 
+        self._current_frame = None
         # 用于防抖动的定时器任务 ID
         self._preview_job = None 
+        # 草稿显示后，计划中的高清渲染任务 ID
+        self._refine_job = None
+        # 背景图库窗口和缩略图缓存 (第一次打开图库时才创建)
+        self._gallery = None
+        self._contact_sheet = None
+        self.thumbnails = None
+        # 最近一次收集的参数 / 当前高清图对应的参数 (用于判断高清图是否过期)
+        self._latest_settings = None
+        self._full_settings = None
 
         # 构建界面布局
         self._setup_ui()
-        # 加载下拉框的资源数据
-        self._load_resources()
-        
-        # 程序启动时，手动触发一次预览更新
+        self._mark_startup("窗口")
+
+        # 分阶段启动：窗口先显示，资源索引、字体预热在后台进行，下拉框就绪一个填一个，
+        # 字体就绪后才触发第一次预览
+        self._startup_done = False
+        self._first_preview_shown = False
+        self.root.after(0, self._start_background_startup)
+
+    def _mark_startup(self, stage):
+        """
+        Description:
+            记录一个启动阶段的耗时 (距上一个阶段结束)。
+            Record the duration of a startup stage (since the previous mark).
+
+        Args:
+            stage (str): 阶段名称.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._mark_startup("窗口")
+        """
+        now = time.perf_counter()
+        self.startup_timings[stage] = (now - self._startup_last) * 1000
+        self._startup_last = now
+
+    def _start_background_startup(self):
+        """
+        Description:
+            [主线程] 窗口已经进入事件循环，启动后台加载线程。
+            [Main Thread] The window is up; start the background loading thread.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> self.root.after(0, self._start_background_startup)
+        """
+        self._mark_startup("窗口显示")
+        # tkinter 变量只能在主线程读取，先取出预热用的字号
+        thread = threading.Thread(target=self._startup_task, args=(self.var_font_size.get(),),
+                                  name="startup-loader")
+        # 设置为守护线程，启动期间关闭窗口不会被它拖住
+        thread.daemon = True
+        thread.start()
+
+    def _startup_task(self, font_size):
+        """
+        Description:
+            [后台线程] 依次完成: 创建文件夹 -> 背景索引 -> 字体索引 -> 字体预热，
+            每一步完成后把结果交回主线程填充界面。
+            [Background Thread] Prepare folders, index backgrounds and fonts, warm up the font,
+            handing each result back to the main thread.
+
+        Args:
+            font_size (int): 预热字体时使用的字号.
+
+        Returns:
+            None
+
+        Examples:
+            >>> # Runs in the startup-loader thread
+        """
+        try:
+            self.generator.prepare_dirs()
+            self._mark_startup("文件夹")
+            bgs = self.generator.bg_index.names()
+            self._mark_startup("背景索引")
+            self.root.after(0, self._populate_backgrounds, bgs)
+            fonts = self.generator.font_index.names()
+            self._mark_startup("字体索引")
+            self.root.after(0, self._populate_fonts, fonts)
+
+            # 预热默认选中的字体：解析字体文件和字符覆盖表 (大号 CJK 字体这一步最慢)
+            # 渲染进程同时启动并预热自己的那一份 (不等待)
+            self.render_worker.warm(fonts[0] if fonts else '', font_size)
+            if fonts:
+                font_path = os.path.join(self.generator.font_folder, fonts[0])
+                self.generator.font_cache.get_font(font_path, font_size, self.generator.stats)
+                self.generator.fallback.coverage.get(font_path)
+            self._mark_startup("字体预热")
+        except Exception as e:
+            print(f"启动加载失败: {e}")
+        # 资源 (无论成功与否) 都处理完了，开始第一次预览
+        self.root.after(0, self._on_startup_loaded)
+
+    def _on_startup_loaded(self):
+        """
+        Description:
+            [主线程] 后台加载完成，触发第一次预览。
+            [Main Thread] Background loading finished; trigger the first preview.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> self.root.after(0, self._on_startup_loaded)
+        """
+        self._startup_done = True
         self._trigger_preview_update()
 
-    def _load_resources(self):
+    def _report_startup(self):
         """
         Description:
-            读取文件夹内容并更新下拉框选项。
-            Load file lists from folders and update combobox values.
+            [主线程] 第一张预览显示后，输出启动各阶段耗时。
+            [Main Thread] Report startup stage timings once the first preview is shown.
 
         Args:
             None
@@ -78,24 +231,79 @@ class MemeApp:
             None
 
         Examples:
-            >>> self._load_resources()
+            >>> self._report_startup()
+        """
+        self._first_preview_shown = True
+        self._mark_startup("首次预览")
+        total = (time.perf_counter() - self._startup_t0) * 1000
+        summary = "，".join(f"{stage} {ms:.0f}" for stage, ms in self.startup_timings.items())
+        print(f"启动耗时 {total:.0f} ms (各阶段 ms: {summary})")
+        self.lbl_latency.config(text=f"启动 {total:.0f} ms")
+
+    def _populate_backgrounds(self, bgs):
+        """
+        Description:
+            [主线程] 填充背景下拉框，默认选中第 1 个。
+            [Main Thread] Fill the background combobox and select the first item.
+
+        Args:
+            bgs (list): 背景文件名列表.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._populate_backgrounds(['1.png'])
         """
-        # 从渲染器获取背景图片列表
-        bgs = self.generator.get_files(self.generator.bg_folder, ('.png', '.jpg', '.jpeg'))
         # 设置下拉框的值
         self.combo_bg['values'] = bgs
-        # 如果列表不为空，默认选中第 1 个
-        if bgs:
+        self.combo_bg.config(state="readonly")
+        # 如果列表不为空，默认选中第 1 个 (加载期间用户已经选过的保留)
+        if bgs and self.var_bg_file.get() not in bgs:
             self.combo_bg.current(0)
-        
-        # 从渲染器获取字体文件列表
-        fonts = self.generator.get_files(self.generator.font_folder, ('.ttf', '.otf'))
+
+    def _populate_fonts(self, fonts):
+        """
+        Description:
+            [主线程] 填充字体下拉框，默认选中第 1 个。
+            [Main Thread] Fill the font combobox and select the first item.
+
+        Args:
+            fonts (list): 字体文件名列表.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._populate_fonts(['SourceHanSerifSC.otf'])
+        """
         # 设置下拉框的值
         self.combo_font['values'] = fonts
+        self.combo_font.config(state="readonly")
         # 如果列表不为空，默认选中第 1 个
-        if fonts:
+        if fonts and self.var_font_file.get() not in fonts:
             self.combo_font.current(0)
 
+    def _load_resources(self):
+        """
+        Description:
+            读取文件夹内容并更新下拉框选项。
+            Load file lists from folders and update combobox values.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._load_resources()
+        """
+        # 从资源索引获取背景图片列表 (只增量检查变化，不再每次完整扫描文件夹)
+        self._populate_backgrounds(self.generator.bg_index.names())
+        # 从资源索引获取字体文件列表
+        self._populate_fonts(self.generator.font_index.names())
+
     def _setup_ui(self):
         """
         Description:
@@ -140,6 +348,9 @@ class MemeApp:
         # 颜色选择按钮
         self.btn_color = tk.Button(group_style, text="点击修改文字颜色", bg="white", command=self._choose_color)
         self.btn_color.pack(fill=tk.X, padx=5, pady=5)
+        self.btn_outline_color = tk.Button(group_style, text="点击修改描边颜色", bg="black", fg="white",
+                                           command=self._choose_outline_color)
+        self.btn_outline_color.pack(fill=tk.X, padx=5, pady=(0, 5))
 
         # 滑块容器
         frame_sliders = ttk.Frame(group_style)
@@ -148,14 +359,19 @@ class MemeApp:
         # 字体大小滑块
         ttk.Label(frame_sliders, text="最大字号:").grid(row=0, column=0, sticky='w')
         # 绑定 command 到 _on_input_change，拖动滑块时实时刷新
-        s1 = ttk.Scale(frame_sliders, from_=20, to=200, variable=self.var_font_size, command=self._on_input_change)
+        s1 = ttk.Scale(frame_sliders, from_=SETTING_RANGES['font_size'][0], to=SETTING_RANGES['font_size'][1],
+                       variable=self.var_font_size, command=self._on_input_change)
         s1.grid(row=0, column=1, sticky='ew')
         
         # 描边复选框
         ttk.Checkbutton(frame_sliders, text="启用描边", variable=self.var_use_outline, command=self._on_input_change).grid(row=1, column=0, sticky='w')
         # 描边宽度滑块
-        s2 = ttk.Scale(frame_sliders, from_=0, to=10, variable=self.var_outline_width, command=self._on_input_change)
+        s2 = ttk.Scale(frame_sliders, from_=SETTING_RANGES['outline_width'][0], to=SETTING_RANGES['outline_width'][1],
+                       variable=self.var_outline_width, command=self._on_input_change)
         s2.grid(row=1, column=1, sticky='ew')
+        # 快速描边复选框
+        ttk.Checkbutton(frame_sliders, text="快速描边 (边角略有差别)", variable=self.var_fast_stroke,
+                        command=self._on_input_change).grid(row=2, column=0, columnspan=2, sticky='w')
 
         # --- 区域 3. 资源选择区 ---
         group_res = ttk.LabelFrame(left_frame, text="3. 资源选择")
@@ -163,22 +379,34 @@ class MemeApp:
 
         # 背景选择下拉框
         ttk.Label(group_res, text="背景图片:").pack(anchor='w', padx=5)
-        self.combo_bg = ttk.Combobox(group_res, textvariable=self.var_bg_file, state="readonly")
+        # 资源列表在后台加载，就绪前先禁用
+        self.combo_bg = ttk.Combobox(group_res, textvariable=self.var_bg_file, state="disabled")
         self.combo_bg.pack(fill=tk.X, padx=5, pady=2)
         # 绑定选中事件，切换图片时刷新预览
         self.combo_bg.bind("<<ComboboxSelected>>", self._on_input_change)
         
-        # 添加背景按钮
-        btn_add_bg = ttk.Button(group_res, text="+ 添加新背景", command=self._add_background)
-        btn_add_bg.pack(anchor='e', padx=5, pady=2)
+        # 浏览图库 / 添加背景按钮
+        frame_bg_buttons = ttk.Frame(group_res)
+        frame_bg_buttons.pack(fill=tk.X)
+        btn_add_bg = ttk.Button(frame_bg_buttons, text="+ 添加新背景", command=self._add_background)
+        btn_add_bg.pack(side=tk.RIGHT, padx=5, pady=2)
+        btn_gallery = ttk.Button(frame_bg_buttons, text="浏览图库...", command=self._open_gallery)
+        btn_gallery.pack(side=tk.RIGHT, padx=5, pady=2)
+        btn_contact = ttk.Button(frame_bg_buttons, text="背景对比...", command=self._open_contact_sheet)
+        btn_contact.pack(side=tk.RIGHT, padx=5, pady=2)
 
         # 字体选择下拉框
         ttk.Label(group_res, text="字体文件:").pack(anchor='w', padx=5, pady=(10, 0))
-        self.combo_font = ttk.Combobox(group_res, textvariable=self.var_font_file, state="readonly")
+        self.combo_font = ttk.Combobox(group_res, textvariable=self.var_font_file, state="disabled")
         self.combo_font.pack(fill=tk.X, padx=5, pady=2)
         self.combo_font.bind("<<ComboboxSelected>>", self._on_input_change)
 
-        # --- 区域 4. 保存按钮 ---
+        # --- 区域 4. 保存格式与保存按钮 ---
+        ttk.Label(left_frame, text="保存格式:").pack(anchor='w', padx=5, pady=(10, 0))
+        self.combo_save_format = ttk.Combobox(left_frame, textvariable=self.var_save_format,
+                                              values=list(self.SAVE_PRESETS), state="readonly")
+        self.combo_save_format.pack(fill=tk.X, padx=5, pady=2)
+
         self.btn_save = ttk.Button(left_frame, text="保存图片 (Save)", command=self._save_image)
         # 设置 padding 把它撑大一点
         self.btn_save.pack(fill=tk.X, pady=20, ipady=10)
@@ -187,6 +415,10 @@ class MemeApp:
         right_frame = ttk.Frame(main_paned)
         main_paned.add(right_frame)
 
+        # 渲染耗时读数 (先放在底部，窗口缩小时不会被预览图挤掉)
+        self.lbl_latency = ttk.Label(right_frame, text="", anchor="e", foreground="#666666")
+        self.lbl_latency.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+
         # 预览图标签 (Label)
         self.lbl_preview = ttk.Label(right_frame, text="预览区域", anchor="center", background="#e0e0e0")
         self.lbl_preview.pack(fill=tk.BOTH, expand=True)
@@ -219,6 +451,29 @@ class MemeApp:
             # 触发预览刷新
             self._trigger_preview_update()
 
+    def _choose_outline_color(self):
+        """
+        Description:
+            打开系统颜色选择器，更新描边颜色。
+            Open system color picker and update outline color.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> # Triggered by button click
+        """
+        colors = colorchooser.askcolor(initialcolor='#%02x%02x%02x' % self.var_outline_color)
+        if colors[0]:
+            self.var_outline_color = tuple(map(int, colors[0]))
+            # 按钮文字颜色随背景深浅切换，保证看得清
+            r, g, b = self.var_outline_color
+            self.btn_outline_color.config(bg=colors[1], fg="black" if r * 0.299 + g * 0.587 + b * 0.114 > 128 else "white")
+            self._trigger_preview_update()
+
     def _add_background(self):
         """
         Description:
@@ -235,7 +490,7 @@ class MemeApp:
             >>> # Triggered by button click
         """
         # 打开文件选择框
-        path = filedialog.askopenfilename(filetypes=[("Images", "*.png;*.jpg;*.jpeg")])
+        path = filedialog.askopenfilename(filetypes=[("Images", "*.png;*.jpg;*.jpeg;*.gif;*.webp")])
         if path:
             try:
                 # 打开图片
@@ -245,8 +500,14 @@ class MemeApp:
                 # 构造目标路径
                 target = os.path.join(self.generator.bg_folder, filename)
                 # 保存到项目的 background_images 文件夹
-                img.save(target)
-                # 重新加载资源列表
+                if getattr(img, 'n_frames', 1) > 1:
+                    # 动图原样复制 (img.save 只会保存第一帧)
+                    img.close()
+                    shutil.copyfile(path, target)
+                else:
+                    img.save(target)
+                # 文件夹刚变过，让索引立即检查，再重新加载资源列表
+                self.generator.bg_index.refresh(force=True)
                 self._load_resources() 
                 # 自动选中刚添加的图片
                 self.combo_bg.set(filename)
@@ -256,6 +517,69 @@ class MemeApp:
             except Exception as e:
                 messagebox.showerror("错误", f"无法添加图片: {e}")
 
+    def _open_gallery(self):
+        """
+        Description:
+            打开背景图库窗口 (已经打开时提到最前)。
+            Open the background gallery window (or raise it if already open).
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> # Triggered by button click
+        """
+        if self._gallery is not None and self._gallery.winfo_exists():
+            self._gallery.lift()
+            return
+        if self.thumbnails is None:
+            self.thumbnails = ThumbnailCache()
+        self._gallery = BackgroundGallery(self.root, self.generator.bg_index, self.thumbnails,
+                                          self._on_gallery_select, self.var_bg_file.get())
+
+    def _open_contact_sheet(self):
+        """
+        Description:
+            打开背景对比窗口：当前文案贴到所有背景上并排显示 (已经打开时用当前文案刷新)。
+            Open the contact-sheet window showing the current caption on every background.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> # Triggered by button click
+        """
+        if self._contact_sheet is not None and self._contact_sheet.winfo_exists():
+            self._contact_sheet.lift()
+            self._contact_sheet.refresh()
+            return
+        self._contact_sheet = ContactSheetWindow(self.root, self.generator, self._collect_settings,
+                                                 self._on_gallery_select, self.var_bg_file.get())
+
+    def _on_gallery_select(self, filename):
+        """
+        Description:
+            [主线程] 图库里选中了背景：同步到下拉框并刷新预览。
+            [Main Thread] A background was picked in the gallery; sync the combobox and refresh.
+
+        Args:
+            filename (str): 背景文件名.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._on_gallery_select('1.png')
+        """
+        self.combo_bg.set(filename)
+        self._on_input_change()
+
     def _on_input_change(self, event=None):
         """
         Description:
@@ -274,49 +598,135 @@ class MemeApp:
         # 如果之前已经有计划执行的任务，先取消它
         if self._preview_job:
             self.root.after_cancel(self._preview_job)
-        # 设置新的定时任务：300毫秒后执行 _trigger_preview_update
-        # 如果在这 300ms 内用户又打字了，这个任务会被上面的 cancel 取消掉
-        self._preview_job = self.root.after(300, self._trigger_preview_update)
+        # 设置新的定时任务：100毫秒后执行 _trigger_preview_update
+        # 草稿预览很便宜，所以防抖时间可以比整图渲染短得多
+        # 如果在这 100ms 内用户又打字了，这个任务会被上面的 cancel 取消掉
+        self._preview_job = self.root.after(100, self._trigger_preview_update)
 
-    def _trigger_preview_update(self):
+    def _collect_settings(self):
         """
         Description:
-            收集所有 UI 参数，并在后台线程启动生成任务。
-            Gather UI params and start generation task in background thread.
+            [主线程] 从界面控件收集绘图参数字典。
+            [Main Thread] Gather drawing settings from UI widgets.
 
         Args:
             None
 
         Returns:
-            None
+            dict: 绘图参数.
 
         Examples:
-            >>> self._trigger_preview_update()
+            >>> settings = self._collect_settings()
         """
-        # 1. 收集参数字典
-        settings = {
+        return {
             # 获取文本框内容，从第一行第0列到结尾，并去除首尾空格
             'text': self.text_input.get("1.0", tk.END).strip(),
             'text_color': self.var_text_color,
+            'outline_color': self.var_outline_color,
             'font_size': self.var_font_size.get(),
             'use_outline': self.var_use_outline.get(),
             'outline_width': self.var_outline_width.get(),
+            'stroke_engine': 'dilate' if self.var_fast_stroke.get() else 'freetype',
             # 构造背景图完整路径
             'bg_path': os.path.join(self.generator.bg_folder, self.var_bg_file.get()) if self.var_bg_file.get() else None,
             'font_file': self.var_font_file.get()
         }
 
-        # 2. 启动新线程生成 (避免卡死 UI 主线程)
-        thread = threading.Thread(target=self._generate_task, args=(settings,))
-        # 设置为守护线程，这样主程序关闭时线程也会自动关闭
-        thread.daemon = True
-        thread.start()
+    def _preview_size(self):
+        """
+        Description:
+            [主线程] 计算预览标签能容纳的正方形边长 (Contain 模式)。
+            [Main Thread] Compute the square edge that fits the preview label.
+
+        Args:
+            None
+
+        Returns:
+            int: 预览边长，窗口还没初始化好时返回 0.
+
+        Examples:
+            >>> size = self._preview_size()
+        """
+        # 获取预览标签当前的宽高
+        win_w = self.lbl_preview.winfo_width()
+        win_h = self.lbl_preview.winfo_height()
+        # 如果窗口还没初始化好(太小)，返回 0
+        if win_w < 10 or win_h < 10:
+            return 0
+        return min(win_w, win_h)
+
+    def _trigger_preview_update(self):
+        """
+        Description:
+            收集所有 UI 参数，并在后台线程启动草稿预览任务。
+            Gather UI params and start the draft preview task in background thread.
+
+        Args:
+            None
+
+        Returns:
+            None
 
-    def _generate_task(self, settings):
+        Examples:
+            >>> self._trigger_preview_update()
+        """
+        # 1. 收集参数字典，并记为"最新参数"
+        settings = self._collect_settings()
+        self._latest_settings = settings
+        # 参数变了，之前计划的高清渲染作废
+        if self._refine_job:
+            self.root.after_cancel(self._refine_job)
+            self._refine_job = None
+
+        # 2. 交给渲染进程 (避免卡死 UI 主线程)
+        #    同一时间只跑一个渲染，新提交会取代/取消还没完成的旧任务
+        #    草稿渲染：字号按比例缩小，直接在预览尺寸上画字；窗口未就绪 (0) 时直接渲染高清图
+        preview_size = self._preview_size() or self.generator.CANVAS_SIZE
+        self.render_worker.submit(
+            settings, preview_size,
+            lambda frame, generation: self.root.after(0, self._on_draft_ready, frame, settings, generation))
+
+    def _on_draft_ready(self, frame, settings, generation):
+        """
+        Description:
+            [主线程] 显示草稿图 (显示后立即归还帧环槽位)，并在空闲一段时间后安排高清渲染。
+            [Main Thread] Show the draft, release its ring slot, then schedule a full-res render when idle.
+
+        Args:
+            frame (SharedFrame): 预览尺寸的草稿帧 (frame.image 直接引用共享内存).
+            settings (dict): 草稿对应的绘图参数.
+            generation (int): 渲染任务代号.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._on_draft_ready(frame, settings, generation)
+        """
+        # 排队期间又有新任务提交了，这张已经过期，直接丢掉
+        if not self.render_worker.is_current(generation):
+            frame.release()
+            return
+        if frame.image.size == (self.generator.CANVAS_SIZE, self.generator.CANVAS_SIZE):
+            # 窗口未就绪时直接渲染的就是高清图
+            self._update_preview_ui(frame, settings, generation)
+            return
+        # PhotoImage 会把像素拷进 Tk，之后槽位就可以归还了
+        self._show_preview(frame.image)
+        frame.release()
+        self._update_latency_label()
+        if self._startup_done and not self._first_preview_shown:
+            self._report_startup()
+        # 用户停手 500ms 后才开始渲染高清图
+        if self._refine_job:
+            self.root.after_cancel(self._refine_job)
+        self._refine_job = self.root.after(500, self._start_refine, settings)
+
+    def _start_refine(self, settings):
         """
         Description:
-            [线程内部] 调用渲染器生成图片，完成后通知主线程。
-            [Thread Internal] Call renderer, then notify main thread.
+            [主线程] 把高清图渲染任务交给渲染进程。
+            [Main Thread] Submit full-resolution rendering to the render process.
 
         Args:
             settings (dict): 绘图参数.
@@ -325,19 +735,74 @@ class MemeApp:
             None
 
         Examples:
-            >>> # Called by thread
+            >>> self._start_refine(settings)
         """
-        # 调用核心渲染逻辑
-        image = self.generator.render_image(settings)
-        # 渲染耗时操作结束后，通过 root.after 把更新 UI 的工作排队给主线程
-        # 注意：tkinter 的 UI 操作必须在主线程进行
-        self.root.after(0, self._update_preview_ui, image)
+        self._refine_job = None
+        self.render_worker.submit(
+            settings, self.generator.CANVAS_SIZE,
+            lambda frame, generation: self.root.after(0, self._update_preview_ui, frame, settings, generation))
+
+    def _update_preview_ui(self, frame, settings=None, generation=None):
+        """
+        Description:
+            [主线程] 记录生成的高清图 (持有其帧环槽位，直到被下一张高清图替换)，并显示在界面上。
+            [Main Thread] Keep the generated full-res frame (holding its ring slot) and display it on UI.
+
+        Args:
+            frame (SharedFrame): 高清图所在的帧 (frame.image 直接引用共享内存).
+            settings (dict): 该图对应的绘图参数. Defaults to None.
+            generation (int): 渲染任务代号，已过期的结果会被丢弃. Defaults to None.
+
+        Returns:
+            None
+
+        Examples:
+            >>> self._update_preview_ui(frame, settings, generation)
+        """
+        # 过期的结果不能覆盖 current_image_obj，否则可能把旧图保存下来
+        if generation is not None and not self.render_worker.is_current(generation):
+            frame.release()
+            return
+        # 保存一份原始高清图引用，用于稍后保存到硬盘；上一张高清图的槽位归还帧环
+        if self._current_frame is not None:
+            self._current_frame.release()
+        self._current_frame = frame
+        self.current_image_obj = frame.image 
+        self._full_settings = settings
+        self._update_latency_label()
+        self._show_preview(frame.image)
+        if self._startup_done and not self._first_preview_shown:
+            self._report_startup()
+
+    def _update_latency_label(self):
+        """
+        Description:
+            [主线程] 刷新预览下方的渲染耗时读数 (最近一次草稿/高清耗时及高清 p50/p90)。
+            [Main Thread] Refresh the latency readout under the preview.
+
+        Args:
+            None
+
+        Returns:
+            None
 
-    def _update_preview_ui(self, pil_image):
+        Examples:
+            >>> self._update_latency_label()
+        """
+        stages = self.generator.stats.snapshot()['stages']
+        parts = []
+        if 'preview' in stages:
+            parts.append(f"草稿 {stages['preview']['last_ms']:.0f} ms")
+        if 'render' in stages:
+            render = stages['render']
+            parts.append(f"高清 {render['last_ms']:.0f} ms (p50 {render['p50_ms']:.0f} / p90 {render['p90_ms']:.0f})")
+        self.lbl_latency.config(text="  ·  ".join(parts))
+
+    def _show_preview(self, pil_image):
         """
         Description:
-            [主线程] 将生成的图片显示在界面上。
-            [Main Thread] Display the generated image on UI.
+            [主线程] 把图片按预览区域大小显示出来 (草稿图尺寸正好时不再缩放)。
+            [Main Thread] Display an image scaled to the preview area.
 
         Args:
             pil_image (Image): Pillow 的图像对象.
@@ -346,26 +811,18 @@ class MemeApp:
             None
 
         Examples:
-            >>> self._update_preview_ui(img_obj)
+            >>> self._show_preview(img_obj)
         """
-        # 保存一份原始高清图引用，用于稍后保存到硬盘
-        self.current_image_obj = pil_image 
-        
-        # 获取预览标签当前的宽高
-        win_w = self.lbl_preview.winfo_width()
-        win_h = self.lbl_preview.winfo_height()
-        
+        size = self._preview_size()
         # 如果窗口还没初始化好(太小)，暂不渲染
-        if win_w < 10 or win_h < 10: return 
+        if not size:
+            return
 
-        # 计算缩放比例：保持图片比例适应窗口 (Contain模式)
-        ratio = min(win_w / 900, win_h / 900)
-        # 计算新的缩放尺寸
-        new_size = (int(900 * ratio), int(900 * ratio))
-        
         try:
-            # 高质量缩放图片用于预览
-            preview_img = pil_image.resize(new_size, Image.Resampling.LANCZOS)
+            preview_img = pil_image
+            if pil_image.size != (size, size):
+                # 高质量缩放图片用于预览
+                preview_img = pil_image.resize((size, size), Image.Resampling.LANCZOS)
             # 转换为 tkinter 能显示的格式
             tk_img = ImageTk.PhotoImage(preview_img)
             # 更新标签图片
@@ -390,10 +847,13 @@ class MemeApp:
         Examples:
             >>> # Triggered by window resize
         """
-        # 如果当前已经有生成好的图片
-        if self.current_image_obj:
+        # 如果当前的高清图就是最新参数生成的
+        if self.current_image_obj and self._full_settings is self._latest_settings:
             # 直接复用该图片进行缩放显示，不需要重新运行渲染文字的逻辑
-            self._update_preview_ui(self.current_image_obj)
+            self._show_preview(self.current_image_obj)
+        elif self._latest_settings is not None:
+            # 还只有草稿图，按新尺寸重新出一张草稿
+            self._on_input_change()
 
     def _save_image(self):
         """
@@ -410,24 +870,61 @@ class MemeApp:
         Examples:
             >>> # Triggered by Save button
         """
-        # 如果还没生成图片，直接返回
-        if not self.current_image_obj:
-            return
-        
-        # 生成时间戳文件名 (e.g., 20231001120000.png)
-        timestamp = time.strftime("%Y%m%d%H%M%S")
-        filename = f"{timestamp}.png"
-        # 拼接保存路径
-        save_path = os.path.join("output_images", filename)
-        
+        # 以界面上当前的参数为准 (可能还在防抖等待中)
+        settings = self._collect_settings()
+        # 当前高清图就是这组参数生成的，可以直接编码；否则由渲染器补渲染 (或命中缓存)
+        frame = self._current_frame if self._full_settings == settings else None
+        fmt, options = self.SAVE_PRESETS.get(self.var_save_format.get(), self.SAVE_PRESETS["PNG"])
+        if frame is not None:
+            # 保存期间可能出新的高清图，先多持有一次槽位，编码完再释放
+            frame.retain()
+
+        def save():
+            try:
+                # 帧环里是 RGBA 像素 (alpha 恒为 255)，转回 RGB 再编码 (在编码线程里转，不占用界面线程)
+                image = frame.image.convert('RGB') if frame is not None else None
+                return self.generator.save_image(settings, "output_images", fmt, image, options)
+            finally:
+                if frame is not None:
+                    frame.release()
+
+        # 编码和写盘交给后台线程，完成后回到主线程弹窗
+        self.btn_save.config(state=tk.DISABLED)
+        future = self.encoder.submit(save)
+        future.add_done_callback(lambda f: self.root.after(0, self._on_save_done, f))
+
+    def _on_save_done(self, future):
+        """
+        Description:
+            后台保存完成后的回调（在主线程执行），弹窗提示结果。
+            Callback after background save finishes (runs on main thread), shows the result.
+
+        Args:
+            future (Future): 保存任务的 Future，结果为 (保存路径, 是否新写入, 信息)。
+                             Future of the save task, resolving to (path, created, info).
+
+        Returns:
+            None
+
+        Examples:
+            >>> # Scheduled by _save_image via root.after
+        """
+        self.btn_save.config(state=tk.NORMAL)
         try:
-            # 保存文件
-            self.current_image_obj.save(save_path)
-            # 弹窗提示成功
-            messagebox.showinfo("保存成功", f"图片已保存至:\n{save_path}")
+            # 按内容地址保存：同样的图只存一份，重复保存直接返回已有文件
+            save_path, created, info = future.result()
         except Exception as e:
             # 弹窗提示失败
             messagebox.showerror("保存失败", str(e))
+            return
+        detail = f"{save_path}\n大小: {info['bytes'] / 1024:.1f} KB"
+        if info.get('frames'):
+            detail += f"，{info['frames']} 帧"
+        # 弹窗提示成功
+        if created:
+            messagebox.showinfo("保存成功", f"图片已保存至:\n{detail}，编码耗时 {info['encode_ms']:.0f} ms")
+        else:
+            messagebox.showinfo("保存成功", f"同样的图片已经保存过:\n{detail}")
 
     def run(self):
         """
@@ -444,4 +941,12 @@ class MemeApp:
         Examples:
             >>> app.run()
         """
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            # 先归还界面持有的帧，再停掉渲染进程、释放共享内存
+            if self._current_frame is not None:
+                self._current_frame.release()
+                self._current_frame = None
+                self.current_image_obj = None
+            self.render_worker.stop()
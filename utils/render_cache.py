@@ -0,0 +1,157 @@
+import os  # 导入操作系统模块，用于文件路径和目录操作
+import hashlib  # 计算内容哈希
+import threading  # 保护哈希记忆表和容量统计
+from render_settings import settings_digest
+from encoder import FORMATS, normalize_options
+
+_digests = {}  # (绝对路径, 大小, 修改时间) -> sha256
+_digests_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    文件内容的 sha256 (按 (路径, 大小, 修改时间) 记忆，文件不变就不会重复读取)
+    文件不存在时返回 None
+    """
+    try:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    if not os.path.isfile(path):
+        return None
+    key = (path, st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+    return digest
+
+
+def remember_digest(path, size, mtime_ns, digest):
+    """记下已知的内容哈希 (如资源索引里保存的)，之后 file_digest 不用再读文件"""
+    key = (os.path.abspath(path), size, mtime_ns)
+    with _digests_lock:
+        _digests[key] = digest
+
+
+class RenderCache:
+    def __init__(self, folder="cache/renders", max_bytes=512 * 1024 * 1024):
+        """
+        内容寻址的渲染结果磁盘缓存
+        key = sha256(规范化参数 + 背景内容哈希 + 字体内容哈希 + 输出格式和编码参数)，
+        文件按 key 存放，超出容量时按最近使用时间 (文件 mtime) 淘汰
+        写入用 "临时文件 + os.replace"，多个进程同时读写也不会读到半个文件
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None  # 当前占用字节数 (首次写入时扫描一次)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(settings, font_path, fmt='png', options=None, extra=()):
+        """
+        计算渲染结果的内容地址 (与缓存目录无关，不启用磁盘缓存时也用它给输出文件命名)
+        extra: 其他影响结果的值 (如回退字体的内容哈希)
+        """
+        values = [fmt, normalize_options(fmt, options),
+                  file_digest(settings.get('bg_path')), file_digest(font_path)]
+        values.extend(extra)
+        return settings_digest(settings, values)
+
+    def path_for(self, key, fmt='png'):
+        """[辅助] key 对应的缓存文件路径 (按前两位分子目录，避免单个目录文件过多)"""
+        return os.path.join(self.folder, key[:2], key + FORMATS[fmt][0])
+
+    def get(self, key, fmt='png'):
+        """读取缓存的编码结果，未命中返回 None"""
+        path = self.path_for(key, fmt)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # 更新 mtime 作为"最近使用时间"
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data, fmt='png'):
+        """写入编码结果，超出容量时淘汰最久未使用的文件"""
+        path = self.path_for(key, fmt)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"渲染缓存写入失败: {e}")
+            return
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan_total()
+            else:
+                self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _scan_total(self):
+        """[辅助] 统计缓存目录当前占用"""
+        total = 0
+        for _, _, size in self._entries():
+            total += size
+        return total
+
+    def _entries(self):
+        """[辅助] 列出缓存文件 (路径, mtime, 大小)"""
+        if not os.path.isdir(self.folder):
+            return
+        for sub in os.scandir(self.folder):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                yield entry.path, st.st_mtime, st.st_size
+
+    def _evict(self):
+        """[辅助] 按 mtime 从旧到新删除，直到降到容量的 90%"""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'bytes': self._total,
+            }
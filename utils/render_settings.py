@@ -0,0 +1,115 @@
+import os  # 导入操作系统模块，用于拼接背景路径
+import json  # 参数规范化序列化
+import hashlib  # 计算参数指纹
+
+# ==========================================
+#  参数解析: 把 CSV / JSONL / URL 里的字符串字段
+#  转成 ImageGenerator.render_image 需要的 settings 字典
+# ==========================================
+
+# 默认绘图参数 (与 MemeApp 界面的初始值一致)
+DEFAULT_SETTINGS = {
+    'text': '',
+    'text_color': (255, 255, 255),
+    'font_size': 100,
+    'use_outline': True,
+    'outline_width': 3,
+    'outline_color': (0, 0, 0),
+    'bg_path': None,
+    'font_file': '',
+}
+
+# 数值参数的取值范围 (与界面滑块一致)，服务按它拒绝过大的字号/描边宽度
+SETTING_RANGES = {
+    'font_size': (20, 200),
+    'outline_width': (0, 10),
+}
+
+
+def parse_color(value):
+    """
+    解析颜色: 支持 (r, g, b) 序列、'#rrggbb' / '#rgb'、'r,g,b' 三种写法
+    不是正好 3 个 0~255 的分量时抛出 ValueError
+    """
+    if isinstance(value, (list, tuple)):
+        parts = [int(v) for v in value]
+    else:
+        text = str(value).strip()
+        if text.startswith('#'):
+            text = text[1:]
+            if len(text) == 3:
+                text = ''.join(c * 2 for c in text)
+            if len(text) != 6:
+                raise ValueError(f"颜色格式无效: {value!r}")
+            parts = [int(text[i:i + 2], 16) for i in (0, 2, 4)]
+        else:
+            parts = [int(v) for v in text.split(',')]
+    if len(parts) != 3 or not all(0 <= v <= 255 for v in parts):
+        raise ValueError(f"颜色需要 3 个 0~255 的分量: {value!r}")
+    return tuple(parts)
+
+
+def parse_bool(value):
+    """解析布尔值: 1/true/yes/on 为真"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on', 'y')
+
+
+def settings_from_record(record, bg_folder, defaults=None):
+    """
+    把一条记录 (dict，值可以是字符串) 转成 settings 字典
+    背景可以用 bg_file (背景文件夹里的文件名) 或 bg_path (完整路径) 指定
+    空字段沿用 defaults
+    """
+    settings = dict(DEFAULT_SETTINGS)
+    if defaults:
+        settings.update(defaults)
+    record = {k: v for k, v in record.items() if v is not None and v != ''}
+
+    if 'text' in record:
+        # CSV 里没法直接写换行，支持用字面量 \n 表示
+        settings['text'] = str(record['text']).replace('\\n', '\n')
+    if 'font_file' in record:
+        settings['font_file'] = str(record['font_file'])
+    if 'font_size' in record:
+        settings['font_size'] = int(float(record['font_size']))
+    if 'use_outline' in record:
+        settings['use_outline'] = parse_bool(record['use_outline'])
+    if 'outline_width' in record:
+        settings['outline_width'] = int(float(record['outline_width']))
+    for key in ('text_color', 'outline_color'):
+        if key in record:
+            settings[key] = parse_color(record[key])
+    if 'bg_path' in record:
+        settings['bg_path'] = str(record['bg_path'])
+    elif 'bg_file' in record:
+        settings['bg_path'] = os.path.join(bg_folder, str(record['bg_file']))
+    return settings
+
+
+def settings_digest(settings, extra=()):
+    """
+    参数指纹：把 settings 规范化 (排序键、元组转列表) 后做 sha256
+    extra: 额外参与计算的值 (如输出格式、文件修改时间)
+    相同参数得到相同指纹，可用作 ETag / 缓存键
+    """
+    def normalize(value):
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        return value
+
+    payload = json.dumps([normalize(settings), normalize(list(extra))],
+                         sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_signature(path):
+    """[辅助] 文件的 (大小, 修改时间)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return [st.st_size, st.st_mtime_ns]
@@ -0,0 +1,227 @@
+import os  # 导入操作系统模块，用于扫描文件夹和读取文件信息
+import json  # 索引文件的读写
+import hashlib  # 由文件夹路径生成索引文件名
+import time  # 限制检查频率
+import threading  # 保护索引数据
+from PIL import Image, ImageFont  # 读取图片尺寸、字体名称
+from render_cache import file_digest, remember_digest  # 内容哈希 (与渲染缓存共用记忆表)
+
+# 资源类型 -> 默认后缀
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+FONT_EXTENSIONS = ('.ttf', '.otf')
+
+INDEX_VERSION = 2
+
+
+def _image_info(path):
+    """[辅助] 图片尺寸和帧数 (只读文件头，不解码像素)"""
+    with Image.open(path) as img:
+        return {'width': img.width, 'height': img.height, 'format': img.format,
+                'frames': getattr(img, 'n_frames', 1)}
+
+
+def _font_info(path):
+    """[辅助] 字体的家族名和样式名"""
+    family, style = ImageFont.truetype(path, 10).getname()
+    return {'family': family, 'style': style}
+
+
+class ResourceIndex:
+    def __init__(self, folder, extensions, kind='image', index_folder="cache/index", min_interval=1.0):
+        """
+        资源文件夹的持久化索引：记录每个文件的大小、修改时间、内容哈希，
+        图片另记宽高，字体另记家族名/样式名
+        索引保存在 index_folder 下的 JSON 文件里，启动时直接读入；
+        refresh() 先比较文件夹的修改时间 (增删改名才会变)，再逐个比较文件的 (大小, 修改时间)，
+        只有新增或被修改的文件才重新读取元数据和计算哈希
+        kind: 'image' 或 'font'
+        min_interval: 两次检查之间的最短间隔 (秒)，期间的查询直接使用内存中的索引
+        """
+        self.folder = folder
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.kind = kind
+        tag = hashlib.sha1(os.path.abspath(folder).encode('utf-8')).hexdigest()[:12]
+        self.index_path = os.path.join(index_folder, f"{kind}-{tag}.json")
+        self._lock = threading.RLock()
+        self._entries = None     # 文件名 -> 元数据 dict
+        self._dir_mtime = None   # 上次完整扫描时文件夹的修改时间
+        self.min_interval = min_interval
+        self._checked = None     # 上次检查的时间 (time.monotonic)
+        self.scans = 0           # 完整扫描 (listdir) 次数
+        self.updated = 0         # 重新读取元数据的文件数
+
+    # ---------- 读写索引文件 ----------
+
+    def _load(self):
+        """[辅助] 读入磁盘上的索引 (版本、文件夹或后缀不符时丢弃)"""
+        self._entries = {}
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (data.get('version') != INDEX_VERSION or data.get('folder') != os.path.abspath(self.folder)
+                or data.get('extensions') != list(self.extensions)):
+            return
+        self._entries = data.get('entries', {})
+        self._dir_mtime = data.get('dir_mtime')
+        # 已知的内容哈希交给渲染缓存，不用再读一遍文件
+        for name, entry in self._entries.items():
+            if entry.get('sha256'):
+                remember_digest(os.path.join(self.folder, name), entry['size'], entry['mtime_ns'],
+                                entry['sha256'])
+
+    def _save(self):
+        """[辅助] 写回索引 (临时文件 + os.replace，多个进程同时写也不会写坏)"""
+        data = {
+            'version': INDEX_VERSION,
+            'folder': os.path.abspath(self.folder),
+            'extensions': list(self.extensions),
+            'dir_mtime': self._dir_mtime,
+            'entries': self._entries,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            print(f"资源索引写入失败: {e}")
+
+    # ---------- 增量更新 ----------
+
+    def _describe(self, path, st):
+        """[辅助] 读取单个文件的元数据"""
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': file_digest(path)}
+        try:
+            entry.update(_image_info(path) if self.kind == 'image' else _font_info(path))
+            entry['ok'] = True
+        except Exception:
+            # 损坏或无法识别的文件仍然列出 (与原来的后缀过滤一致)，只是没有尺寸/字体名
+            entry['ok'] = False
+        self.updated += 1
+        return entry
+
+    def refresh(self, force=False):
+        """
+        增量更新索引，返回是否有变化
+        文件夹修改时间没变时只 stat 已知文件 (发现原地修改)；变了才重新列目录
+        force: 忽略 min_interval，立即检查 (如刚往文件夹里添加了文件)
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (not force and self._checked is not None
+                    and now - self._checked < self.min_interval):
+                return False
+            self._checked = now
+            if self._entries is None:
+                self._load()
+            try:
+                dir_mtime = os.stat(self.folder).st_mtime_ns
+            except OSError:
+                changed = bool(self._entries)
+                self._entries = {}
+                self._dir_mtime = None
+                return changed
+
+            if dir_mtime == self._dir_mtime:
+                names = list(self._entries)
+            else:
+                self.scans += 1
+                names = [f for f in os.listdir(self.folder) if f.lower().endswith(self.extensions)]
+
+            entries = {}
+            changed = dir_mtime != self._dir_mtime
+            for name in names:
+                path = os.path.join(self.folder, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    changed = True
+                    continue
+                old = self._entries.get(name)
+                if old is not None and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+                    entries[name] = old
+                else:
+                    entries[name] = self._describe(path, st)
+                    changed = True
+            if len(entries) != len(self._entries):
+                changed = True
+            self._entries = entries
+            self._dir_mtime = dir_mtime
+            if changed:
+                self._save()
+            return changed
+
+    # ---------- 查询 ----------
+
+    def names(self, extensions=None):
+        """文件名列表 (按名称排序)，可以再按后缀过滤"""
+        self.refresh()
+        with self._lock:
+            names = sorted(self._entries)
+        if extensions:
+            extensions = tuple(e.lower() for e in extensions)
+            names = [n for n in names if n.lower().endswith(extensions)]
+        return names
+
+    def get(self, name):
+        """单个文件的元数据 (不存在时返回 None)"""
+        self.refresh()
+        with self._lock:
+            entry = self._entries.get(name)
+            return dict(entry, name=name) if entry is not None else None
+
+    def __contains__(self, name):
+        self.refresh()
+        with self._lock:
+            return name in self._entries
+
+    def find(self, text=None, family=None, min_width=None, min_height=None, valid=None):
+        """
+        按条件筛选，返回元数据列表 (按名称排序)
+        text: 文件名或字体名包含该字符串 (不区分大小写)
+        family: 字体家族名 (不区分大小写，完全匹配)
+        min_width / min_height: 图片最小尺寸
+        valid: 只要能正常读取 (True) / 只要读取失败 (False) 的文件
+        """
+        self.refresh()
+        text = text.lower() if text else None
+        family = family.lower() if family else None
+        results = []
+        with self._lock:
+            items = sorted(self._entries.items())
+        for name, entry in items:
+            if text and text not in name.lower() and text not in entry.get('family', '').lower():
+                continue
+            if family and entry.get('family', '').lower() != family:
+                continue
+            if min_width and entry.get('width', 0) < min_width:
+                continue
+            if min_height and entry.get('height', 0) < min_height:
+                continue
+            if valid is not None and entry.get('ok', False) != valid:
+                continue
+            results.append(dict(entry, name=name))
+        return results
+
+    def duplicates(self):
+        """内容完全相同的文件分组 [[文件名, ...], ...]"""
+        self.refresh()
+        groups = {}
+        with self._lock:
+            for name, entry in sorted(self._entries.items()):
+                if entry.get('sha256'):
+                    groups.setdefault(entry['sha256'], []).append(name)
+        return [names for names in groups.values() if len(names) > 1]
+
+    def stats(self):
+        """返回索引统计信息"""
+        with self._lock:
+            return {
+                'items': len(self._entries or {}),
+                'scans': self.scans,
+                'updated': self.updated,
+                'index_path': self.index_path,
+            }
@@ -0,0 +1,325 @@
+import os  # 导入操作系统模块，用于文件路径
+import json  # 解析请求体、输出 /metrics
+import time  # 统计耗时
+import threading  # 保护统计计数器
+import argparse  # 命令行参数解析
+from urllib.parse import urlsplit, parse_qs  # 解析 URL 查询参数
+from concurrent.futures import ThreadPoolExecutor  # 渲染工作线程池
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # 标准库 HTTP 服务
+from generator import ImageGenerator
+from cache import LRUCache
+from render_settings import settings_from_record, settings_digest, file_signature, SETTING_RANGES
+from encoder import normalize_options
+from glyph_atlas import GlyphAtlas
+from layout_store import LayoutStore
+from render_cache import RenderCache
+from font_coverage import CoverageIndex
+from stroke import STROKE_ENGINES
+
+# ==========================================
+#  本地 HTTP 渲染服务 (仅标准库)
+#  用法: python utils/server.py --port 8765
+#  GET  /render?text=你好&font_file=SourceHanSerifSC.otf&bg_file=1.png&format=webp  (format: png / webp / jpeg / gif，动图背景输出 gif / webp 动图)
+#  POST /render  (JSON 请求体，字段同上)
+#  GET  /metrics (JSON 统计)
+# ==========================================
+
+# 支持的输出格式: 格式名 -> Content-Type
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+}
+
+MAX_BODY = 1024 * 1024  # 请求体上限 1 MB
+
+
+class RenderService:
+    def __init__(self, bg_folder="background_images", font_folder="Font", workers=4,
+                 response_cache_bytes=64 * 1024 * 1024, encode_options=None, glyph_atlas=False,
+                 stroke_engine='freetype', layout_store=True, render_cache="cache/renders"):
+        """
+        渲染服务核心：线程池渲染 + 编码结果缓存 + 统计
+        与 HTTP 层分开，方便在其他程序里直接调用
+        encode_options: 各格式的编码参数 {格式: {参数: 值}}，由部署方按 CPU/体积取舍配置
+        glyph_atlas: 启用字形图集后端 (单字蒙版缓存，长文案渲染更快，输出不变)
+        stroke_engine: 描边引擎 ('freetype' / 'dilate'，见 ImageGenerator)
+        layout_store: 使用排版结果磁盘缓存 (重启后常用文案不用重新试字号)
+        render_cache: 编码结果磁盘缓存的目录，为 None 时不缓存到磁盘
+        """
+        self.generator = ImageGenerator(bg_folder=bg_folder, font_folder=font_folder,
+                                        glyph_atlas=GlyphAtlas() if glyph_atlas else None,
+                                        stroke_engine=stroke_engine,
+                                        layout_store=LayoutStore() if layout_store else None,
+                                        coverage_index=CoverageIndex(),
+                                        render_cache=RenderCache(render_cache) if render_cache else None)
+        self.encode_options = {fmt: normalize_options(fmt, (encode_options or {}).get(fmt))
+                               for fmt in CONTENT_TYPES}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+        # 已编码结果缓存: ETag -> bytes
+        self.responses = LRUCache(max_items=1024, max_cost=response_cache_bytes, cost=len)
+        self._lock = threading.Lock()
+        self._inflight = {}  # ETag -> 正在渲染的 future
+        self.counters = {
+            'requests': 0,
+            'renders': 0,
+            'not_modified': 0,
+            'response_cache_hits': 0,
+            'errors': 0,
+            'in_flight': 0,
+        }
+        self.render_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.encoded_bytes = 0
+        self.started = time.time()
+
+    def count(self, name, delta=1):
+        """[辅助] 线程安全地累加计数器"""
+        with self._lock:
+            self.counters[name] += delta
+
+    def parse_settings(self, record):
+        """
+        把请求参数转成 settings
+        只允许使用背景/字体文件夹里的文件 (按文件名取 basename)，不接受任意路径
+        字号和描边宽度超出界面滑块的范围时拒绝 (一个超大字号/描边的请求会长时间占住渲染线程)
+        """
+        record = dict(record)
+        record.pop('bg_path', None)
+        if record.get('bg_file'):
+            record['bg_file'] = os.path.basename(str(record['bg_file']))
+        if record.get('font_file'):
+            record['font_file'] = os.path.basename(str(record['font_file']))
+        fmt = str(record.pop('format', 'png')).lower()
+        fmt = 'jpeg' if fmt == 'jpg' else fmt
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"不支持的格式: {fmt}")
+        settings = settings_from_record(record, self.generator.bg_folder)
+        for key, (low, high) in SETTING_RANGES.items():
+            if not low <= settings[key] <= high:
+                raise ValueError(f"{key} 超出范围 {low}~{high}: {settings[key]}")
+        return settings, fmt
+
+    def etag(self, settings, fmt):
+        """
+        ETag = 参数指纹 + 输出格式和编码参数 + 描边引擎 + 背景/字体/回退字体文件的 (大小, 修改时间)
+        资源文件被替换 (包括回退字体链里的字体) 后 ETag 会跟着变化
+        """
+        font_path = os.path.join(self.generator.font_folder, settings.get('font_file', ''))
+        fallback = self.generator.fallback.plan(settings.get('text', ''), font_path)
+        extra = [fmt, self.encode_options[fmt], self.generator.stroke_engine,
+                 file_signature(settings.get('bg_path')), file_signature(font_path),
+                 [file_signature(path) for path, _ in fallback] if fallback else None]
+        return '"' + settings_digest(settings, extra)[:32] + '"'
+
+    def render(self, settings, fmt, etag):
+        """在工作线程池里渲染并编码，返回图片字节 (命中缓存时直接返回)"""
+        data = self.responses.get(etag)
+        if data is not None:
+            self.count('response_cache_hits')
+            return data
+        # 同一张图的并发请求只渲染一次，后来的请求等待同一个 future
+        with self._lock:
+            future = self._inflight.get(etag)
+            owner = future is None
+            if owner:
+                future = self.pool.submit(self._render_bytes, settings, fmt)
+                self._inflight[etag] = future
+                self.counters['in_flight'] += 1
+        try:
+            data = future.result()
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(etag, None)
+                    self.counters['in_flight'] -= 1
+        if owner:
+            self.responses.put(etag, data)
+        return data
+
+    def _render_bytes(self, settings, fmt):
+        """[工作线程] 渲染 + 编码 (走渲染器的磁盘缓存，服务重启后热门图片仍可直接返回)"""
+        start = time.perf_counter()
+        data, _, info = self.generator.render_bytes(settings, fmt, options=self.encode_options[fmt])
+        with self._lock:
+            self.counters['renders'] += 1
+            self.render_seconds += time.perf_counter() - start
+            self.encode_seconds += info['encode_ms'] / 1000
+            self.encoded_bytes += info['bytes']
+        return data
+
+    def metrics(self):
+        """统计信息 (/metrics 输出)"""
+        with self._lock:
+            data = dict(self.counters)
+            renders = self.counters['renders']
+            data['avg_render_ms'] = self.render_seconds / renders * 1000 if renders else 0.0
+            data['avg_encode_ms'] = self.encode_seconds / renders * 1000 if renders else 0.0
+            data['avg_bytes'] = self.encoded_bytes / renders if renders else 0
+        data['encode_options'] = self.encode_options
+        data['stroke_engine'] = self.generator.stroke_engine
+        data['uptime_sec'] = time.time() - self.started
+        data['response_cache'] = self.responses.stats()
+        data['font_cache'] = self.generator.font_cache.stats()
+        data['background_cache'] = self.generator.background_cache.stats()
+        data['layout_cache'] = self.generator.layout_cache.stats()
+        data['mask_cache'] = self.generator.mask_cache.stats()
+        if self.generator.render_cache is not None:
+            data['render_cache'] = self.generator.render_cache.stats()
+        # 渲染各阶段耗时分位数和计数器 (探测次数、getlength 调用、缓存命中)
+        data['render_stats'] = self.generator.stats.snapshot()
+        if self.generator.glyph_atlas is not None:
+            data['glyph_atlas'] = self.generator.glyph_atlas.stats()
+        return data
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: 默认保持连接 (keep-alive)，每个响应都带 Content-Length
+    protocol_version = "HTTP/1.1"
+    service = None  # 由 make_server 注入 RenderService
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/metrics':
+            self._send_json(200, self.service.metrics())
+        elif url.path == '/render':
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            self._handle_render(params)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/render':
+            # 请求体没有读走，连接上剩下的字节不能当成下一个请求解析
+            self.close_connection = True
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                raise ValueError("Content-Length 无效") from None
+            if length < 0:
+                raise ValueError("Content-Length 无效")
+            if length > MAX_BODY:
+                raise ValueError("请求体过大")
+        except ValueError as e:
+            # 请求体没有读走，回复后关闭连接
+            self.close_connection = True
+            self.service.count('requests')
+            self.service.count('errors')
+            self._send_json(400, {'error': str(e)})
+            return
+        try:
+            record = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(record, dict):
+                raise ValueError("请求体必须是 JSON 对象")
+        except ValueError as e:
+            self.service.count('requests')
+            self.service.count('errors')
+            self._send_json(400, {'error': str(e)})
+            return
+        self._handle_render(record)
+
+    def _handle_render(self, record):
+        """解析参数 -> ETag 协商 -> 渲染"""
+        service = self.service
+        service.count('requests')
+        try:
+            settings, fmt = service.parse_settings(record)
+        except (ValueError, TypeError) as e:
+            service.count('errors')
+            self._send_json(400, {'error': str(e)})
+            return
+
+        etag = service.etag(settings, fmt)
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            # 客户端已有同样的图，不用渲染
+            service.count('not_modified')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        try:
+            data = service.render(settings, fmt, etag)
+        except Exception as e:
+            service.count('errors')
+            self._send_json(500, {'error': str(e)})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[fmt])
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, obj):
+        """[辅助] 输出 JSON 响应"""
+        data = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # 压测时逐条打印访问日志太吵，默认关闭
+        pass
+
+
+def make_server(host="127.0.0.1", port=8765, service=None):
+    """创建 HTTP 服务 (每个连接一个线程，渲染走 RenderService 的线程池)"""
+    handler = type('BoundRenderHandler', (RenderHandler,), {'service': service or RenderService()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="橘雪莉表情包本地渲染服务")
+    parser.add_argument('--host', default="127.0.0.1", help="监听地址，默认只监听本机")
+    parser.add_argument('--port', type=int, default=8765, help="监听端口")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help="渲染线程数")
+    parser.add_argument('--bg-folder', default="background_images", help="背景图片文件夹")
+    parser.add_argument('--font-folder', default="Font", help="字体文件夹")
+    # 编码参数：用 CPU 换体积
+    parser.add_argument('--png-level', type=int, default=None, help="PNG compress_level (0-9)")
+    parser.add_argument('--webp-quality', type=int, default=None, help="WebP 画质 (0-100)")
+    parser.add_argument('--webp-lossless', action='store_true', help="WebP 使用无损压缩")
+    parser.add_argument('--jpeg-quality', type=int, default=None, help="JPEG 画质 (1-95)")
+    parser.add_argument('--quantize', type=int, default=None, help="PNG/WebP 调色板颜色数 (0 为不量化)")
+    parser.add_argument('--glyph-atlas', action='store_true', help="使用字形图集后端 (缓存单字蒙版)")
+    parser.add_argument('--stroke-engine', default='freetype', choices=STROKE_ENGINES,
+                        help="描边引擎: freetype 逐行描轮廓 / dilate 文字蒙版膨胀 (宽描边、长文案更快)")
+    parser.add_argument('--no-layout-store', action='store_true',
+                        help="不使用排版结果磁盘缓存 (cache/layouts.sqlite3)")
+    parser.add_argument('--render-cache', default="cache/renders",
+                        help="编码结果磁盘缓存目录 (传空字符串不缓存到磁盘)")
+    args = parser.parse_args(argv)
+
+    encode_options = {
+        'png': {'compress_level': args.png_level, 'quantize': args.quantize},
+        'webp': {'quality': args.webp_quality, 'lossless': args.webp_lossless or None, 'quantize': args.quantize},
+        'jpeg': {'quality': args.jpeg_quality},
+    }
+    service = RenderService(args.bg_folder, args.font_folder, args.workers, encode_options=encode_options,
+                            glyph_atlas=args.glyph_atlas, stroke_engine=args.stroke_engine,
+                            layout_store=not args.no_layout_store, render_cache=args.render_cache or None)
+    server = make_server(args.host, args.port, service)
+    print(f"渲染服务已启动: http://{args.host}:{args.port}/render")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
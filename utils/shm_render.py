@@ -0,0 +1,299 @@
+import os  # 拼接字体路径
+import struct  # 槽位头部: 代号 + 宽高
+import threading  # 槽位状态表会被主线程和结果回调线程同时访问
+import multiprocessing  # 渲染进程 (绕开 GIL，渲染再重也不会卡住界面)
+from multiprocessing import shared_memory  # 预先分配的帧缓冲环
+from concurrent.futures import ProcessPoolExecutor  # 进程池
+from concurrent.futures.process import BrokenProcessPool  # 渲染进程被杀 / 内存不足时进程池整体失效
+from PIL import Image  # 把共享内存直接包装成图片
+from generator import ImageGenerator, RenderCancelled
+from glyph_atlas import shared_glyph_atlas
+from layout_store import LayoutStore
+from font_coverage import CoverageIndex
+
+# ==========================================
+#  进程渲染 + 共享内存帧环: 渲染进程把像素写进预先分配的共享内存槽位，
+#  主进程用 Image.frombuffer 直接包装槽位，不用把 900x900 的图 pickle 回来
+#  槽位归属 (空闲 / 渲染中 / 界面持有) 由主进程管理，每个槽位带代号，过期的帧不会交给界面
+# ==========================================
+
+# 槽位头部 (代号, 宽, 高)，像素从 HEADER_SIZE 开始，每像素 4 字节 (RGBA，A 恒为 255)
+_HEADER = struct.Struct('<QII')
+HEADER_SIZE = 64
+
+# 槽位状态
+FREE, RENDERING, HELD = 0, 1, 2
+
+# 渲染进程里的常驻状态
+_generator = None
+_ring = None
+_slot_bytes = 0
+_latest = None
+
+
+def _attach(name):
+    """[渲染进程] 连接主进程创建的共享内存 (只连接，不登记清理，由主进程负责 unlink)"""
+    return shared_memory.SharedMemory(name=name, track=False)
+
+
+def _init_process(ring_name, slot_bytes, latest, options):
+    """[渲染进程] 连接帧环并创建常驻渲染器 (字体/背景/排版缓存随进程一直保持热状态)"""
+    global _generator, _ring, _slot_bytes, _latest
+    _ring = _attach(ring_name)
+    _slot_bytes = slot_bytes
+    _latest = latest
+    options = dict(options)
+    glyph_atlas = options.pop('glyph_atlas', False)
+    layout_store = options.pop('layout_store', False)
+    coverage_index = options.pop('coverage_index', False)
+    _generator = ImageGenerator(ensure_dirs=False, glyph_atlas=shared_glyph_atlas if glyph_atlas else None,
+                                layout_store=LayoutStore() if layout_store else None,
+                                coverage_index=CoverageIndex() if coverage_index else None, **options)
+
+
+def _warm(font_file, size):
+    """[渲染进程] 预热字体和字符覆盖表"""
+    font_path = os.path.join(_generator.font_folder, font_file or '')
+    try:
+        _generator.font_cache.get_font(font_path, size)
+        _generator.fallback.coverage.get(font_path)
+    except OSError:
+        pass
+
+
+def _render_into(slot, generation, settings, size):
+    """
+    [渲染进程] 渲染一张图并写进指定槽位 (先写像素，最后写头部的代号)
+    size 不小于画布时渲染高清图，否则渲染该边长的草稿
+    返回: (槽位, 代号, 图片尺寸 或 None (已被更新的任务取代), 各阶段耗时 trace)
+    """
+    def cancelled():
+        return _latest.value != generation
+
+    with _generator.stats.trace() as trace:
+        try:
+            if size >= _generator.CANVAS_SIZE:
+                img = _generator.render_image(settings, cancel=cancelled)
+            else:
+                img = _generator.render_preview(settings, size, cancel=cancelled)
+        except RenderCancelled:
+            return slot, generation, None, trace
+        # RGB 图内部每像素也是 4 字节，但第 4 字节在缩放/重采样后不保证是 255，
+        # 直接按 RGBX 导出再当 RGBA 读会得到 (半) 透明的图，这里显式转成 alpha 恒为 255 的 RGBA
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        data = img.tobytes()
+        if len(data) > _slot_bytes - HEADER_SIZE:
+            raise ValueError(f"图片超出槽位容量: {img.size}")
+        start = slot * _slot_bytes
+        _ring.buf[start + HEADER_SIZE:start + HEADER_SIZE + len(data)] = data
+        _HEADER.pack_into(_ring.buf, start, generation, img.width, img.height)
+    return slot, generation, img.size, trace
+
+
+class SharedFrame:
+    def __init__(self, worker, slot, generation, image):
+        """
+        帧环里的一帧: image 直接引用共享内存 (RGBA，只读)，不是副本
+        用完必须调用 release()，之后槽位会被新的渲染覆盖；需要多处持有时先 retain()
+        """
+        self._worker = worker
+        self.slot = slot
+        self.generation = generation
+        self.image = image
+
+    def retain(self):
+        """增加一个持有者 (例如后台保存线程)"""
+        self._worker._retain(self)
+
+    def release(self):
+        """释放一个持有者，全部释放后槽位归还帧环"""
+        self._worker._release(self)
+
+
+class ShmRenderWorker:
+    def __init__(self, bg_folder="background_images", font_folder="Font", slots=4, max_size=900,
+                 workers=1, stats=None, **options):
+        """
+        进程渲染工作者: 最多 workers 个渲染同时在跑，最新请求优先 (latest-wins)，每次提交递增代号，
+        旧代号的任务会被取消、结果被丢弃
+        slots: 帧环槽位数 (界面同时持有的帧 + 渲染中的帧，4 个足够)
+        max_size: 最大边长，决定每个槽位的大小
+        workers: 渲染进程数 (同时在跑的渲染数)
+        stats: 汇总渲染进程上报的阶段耗时 (RenderStats)
+        options: 传给渲染进程里 ImageGenerator 的参数 (glyph_atlas=True 时启用字形图集，
+                 layout_store=True 时使用磁盘排版缓存，coverage_index=True 时使用覆盖表磁盘缓存)
+        """
+        self.slots = slots
+        self.slot_bytes = HEADER_SIZE + max_size * max_size * 4
+        self.workers = workers
+        self.stats = stats
+        self._ring = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        self._lock = threading.RLock()
+        self._state = [FREE] * slots
+        self._tags = [0] * slots    # 槽位当前 (或最近一次) 的渲染代号
+        self._refs = [0] * slots    # 界面持有者数量
+        self._pending = None        # 等待空闲槽位的任务: (代号, settings, 边长, 回调)
+        self._in_flight = 0
+        self._generation = 0
+        self._retried = 0           # 因进程池失效而重试过的代号 (同一个任务只重试一次)
+        self._stopped = False
+        # spawn: 不把 Tk 主进程 fork 一份；最新代号放在共享内存里，渲染进程在检查点读取
+        self._context = multiprocessing.get_context('spawn')
+        self._latest = self._context.RawValue('Q', 0)
+        options = dict(options, bg_folder=bg_folder, font_folder=font_folder)
+        self._initargs = (self._ring.name, self.slot_bytes, self._latest, options)
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        """[辅助] 创建渲染进程池 (进程按需启动)"""
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context,
+                                   initializer=_init_process, initargs=self._initargs)
+
+    def _restart_pool(self):
+        """
+        [辅助] 进程池失效 (渲染进程被杀、内存不足) 后换一个新的 (调用方持有锁)
+        失效的进程池由它自己的管理线程收尾；这里不能调用它的 shutdown，
+        结果回调就在那个线程里执行，它此时还持有进程池的关闭锁
+        """
+        self._pool = self._new_pool()
+
+    def warm(self, font_file, size):
+        """提前启动渲染进程并预热字体 (不等待结果)"""
+        if self._stopped:
+            return
+        with self._lock:
+            try:
+                self._pool.submit(_warm, font_file, size)
+            except BrokenProcessPool:
+                self._restart_pool()
+
+    def submit(self, settings, size, callback):
+        """
+        提交渲染任务，返回任务代号；还没开始的旧任务被直接替换，正在跑的旧任务在下一个检查点放弃
+        callback(frame, generation) 只会在任务仍是最新时于回调线程里调用，frame 为 SharedFrame
+        """
+        with self._lock:
+            self._generation += 1
+            self._latest.value = self._generation
+            self._pending = (self._generation, settings, size, callback)
+            self._dispatch()
+            return self._generation
+
+    def is_current(self, generation):
+        """[辅助] 判断代号是否仍是最新提交的任务"""
+        return generation == self._generation
+
+    def _dispatch(self):
+        """[辅助] 有空闲槽位和空闲进程时把等待中的任务发出去 (调用方持有锁)"""
+        if self._pending is None or self._stopped or self._in_flight >= self.workers:
+            return
+        if FREE not in self._state:
+            # 槽位都被占着，等界面释放或渲染结束
+            return
+        slot = self._state.index(FREE)
+        job = self._pending
+        generation, settings, size, callback = job
+        try:
+            future = self._pool.submit(_render_into, slot, generation, settings, size)
+        except BrokenProcessPool:
+            # 进程池在两次渲染之间失效，换一个新的再提交
+            self._restart_pool()
+            try:
+                future = self._pool.submit(_render_into, slot, generation, settings, size)
+            except BrokenProcessPool as e:
+                print(f"渲染进程无法启动: {e}")
+                return
+        pool = self._pool
+        self._pending = None
+        self._state[slot] = RENDERING
+        self._tags[slot] = generation
+        self._in_flight += 1
+        future.add_done_callback(lambda f: self._on_done(f, pool, slot, job))
+
+    def _on_done(self, future, pool, slot, job):
+        """
+        [回调线程] 渲染结束：过期/失败时归还槽位，否则包装成 SharedFrame 交给回调
+        进程池失效时重建进程池，最新的任务重新排队 (只重试一次)
+        """
+        generation, _, _, callback = job
+        size = None
+        broken = False
+        if not future.cancelled():
+            try:
+                _, _, size, trace = future.result()
+                if self.stats is not None:
+                    self.stats.record(trace)
+            except BrokenProcessPool as e:
+                broken = True
+                print(f"渲染进程异常退出: {e}")
+            except Exception as e:
+                print(f"渲染失败: {e}")
+        frame = None
+        with self._lock:
+            self._in_flight -= 1
+            if broken and not self._stopped:
+                if pool is self._pool:
+                    self._restart_pool()
+                if generation == self._generation and self._pending is None and self._retried != generation:
+                    self._retried = generation
+                    self._pending = job
+            start = slot * self.slot_bytes
+            if size is not None and not self._stopped and generation == self._generation:
+                tag, width, height = _HEADER.unpack_from(self._ring.buf, start)
+                if (tag, (width, height)) == (generation, tuple(size)):
+                    view = self._ring.buf[start + HEADER_SIZE:start + HEADER_SIZE + width * height * 4]
+                    image = Image.frombuffer('RGBA', (width, height), view, 'raw', 'RGBA', 0, 1)
+                    frame = SharedFrame(self, slot, generation, image)
+                    self._state[slot] = HELD
+                    self._refs[slot] = 1
+            if frame is None:
+                self._state[slot] = FREE
+            self._dispatch()
+        if frame is not None:
+            callback(frame, generation)
+
+    def _retain(self, frame):
+        """[辅助] 增加槽位持有者"""
+        with self._lock:
+            if self._state[frame.slot] == HELD and self._tags[frame.slot] == frame.generation:
+                self._refs[frame.slot] += 1
+
+    def _release(self, frame):
+        """[辅助] 减少槽位持有者，归零时槽位变为空闲"""
+        with self._lock:
+            slot = frame.slot
+            if self._state[slot] != HELD or self._tags[slot] != frame.generation:
+                return
+            self._refs[slot] -= 1
+            if self._refs[slot] <= 0:
+                self._refs[slot] = 0
+                self._state[slot] = FREE
+                self._dispatch()
+
+    def stats_snapshot(self):
+        """槽位占用情况 (调试用)"""
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'free': self._state.count(FREE),
+                'rendering': self._state.count(RENDERING),
+                'held': self._state.count(HELD),
+                'in_flight': self._in_flight,
+                'generation': self._generation,
+            }
+
+    def stop(self):
+        """停止渲染进程并释放共享内存 (正在执行的任务会在下一个检查点放弃)"""
+        with self._lock:
+            self._stopped = True
+            self._generation += 1
+            self._latest.value = self._generation
+            self._pending = None
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        try:
+            self._ring.close()
+        except BufferError:
+            # 界面还持有帧 (进程马上退出，映射随进程一起释放)
+            pass
+        self._ring.unlink()
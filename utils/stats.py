@@ -0,0 +1,130 @@
+import time  # 计时
+import threading  # 保护统计数据，记录每个线程当前的追踪
+from collections import deque  # 滚动窗口
+from contextlib import contextmanager  # 计时用的 with 语句
+
+
+def _percentile(sorted_values, q):
+    """[辅助] 已排序列表的分位数 (最近秩法)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RenderStats:
+    def __init__(self, window=256):
+        """
+        渲染各阶段的耗时与计数器
+        每个阶段保留最近 window 个样本用于计算滚动分位数 (p50/p90/p99)，另外累计总次数和总耗时
+        线程安全；还可以注册监听函数 (hook)，每记录一个样本都会被调用
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}    # 阶段 -> deque[秒]
+        self._totals = {}     # 阶段 -> [次数, 总秒数]
+        self._last = {}       # 阶段 -> 最近一次秒数
+        self._counters = {}   # 计数器名 -> 累计值
+        self._listeners = []
+        self._local = threading.local()  # 当前线程正在进行的追踪 (trace)
+
+    def add_listener(self, func):
+        """注册监听函数 func(阶段, 秒数)，每记录一个阶段样本调用一次"""
+        self._listeners.append(func)
+
+    def add(self, stage, seconds):
+        """记录一个阶段耗时样本"""
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._totals[stage] = [0, 0.0]
+            samples.append(seconds)
+            total = self._totals[stage]
+            total[0] += 1
+            total[1] += seconds
+            self._last[stage] = seconds
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace['stages'][stage] = trace['stages'].get(stage, 0.0) + seconds * 1000
+        for func in self._listeners:
+            func(stage, seconds)
+
+    def count(self, name, n=1):
+        """累加计数器 (探测次数、getlength 调用次数、缓存命中等)"""
+        if not n:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace['counters'][name] = trace['counters'].get(name, 0) + n
+
+    @contextmanager
+    def timer(self, stage):
+        """with stats.timer('fit'): ... 记录代码块耗时 (抛异常时也记录)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    @contextmanager
+    def trace(self):
+        """
+        追踪当前线程里一次调用的各阶段耗时 (毫秒) 和计数器
+        with stats.trace() as t: ...  结束后 t = {'stages': {...}, 'counters': {...}}
+        可以原样传给另一个进程的 record() 汇总 (批处理的工作进程就是这样上报的)
+        """
+        previous = getattr(self._local, 'trace', None)
+        trace = {'stages': {}, 'counters': {}}
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = previous
+
+    def record(self, trace):
+        """汇总一份 trace() 的结果"""
+        for stage, ms in trace.get('stages', {}).items():
+            self.add(stage, ms / 1000)
+        for name, n in trace.get('counters', {}).items():
+            self.count(name, n)
+
+    def last_ms(self, stage):
+        """某阶段最近一次的耗时 (毫秒)，没有记录时返回 None"""
+        with self._lock:
+            seconds = self._last.get(stage)
+        return None if seconds is None else seconds * 1000
+
+    def snapshot(self):
+        """
+        返回当前统计 (可直接 json.dump):
+        {'stages': {阶段: {count, total_ms, avg_ms, last_ms, p50_ms, p90_ms, p99_ms}}, 'counters': {...}}
+        """
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            totals = {stage: list(total) for stage, total in self._totals.items()}
+            last = dict(self._last)
+            counters = dict(self._counters)
+        stages = {}
+        for stage, values in samples.items():
+            count, seconds = totals[stage]
+            stages[stage] = {
+                'count': count,
+                'total_ms': seconds * 1000,
+                'avg_ms': seconds / count * 1000 if count else 0.0,
+                'last_ms': last[stage] * 1000,
+                'p50_ms': _percentile(values, 0.5) * 1000,
+                'p90_ms': _percentile(values, 0.9) * 1000,
+                'p99_ms': _percentile(values, 0.99) * 1000,
+            }
+        return {'stages': stages, 'counters': counters}
+
+    def reset(self):
+        """清空所有统计"""
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+            self._last.clear()
+            self._counters.clear()
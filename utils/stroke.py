@@ -0,0 +1,101 @@
+import math  # 计算圆盘每一行的半宽
+from PIL import Image, ImageChops  # 导入 Pillow 库 (ImageChops.lighter 即逐像素取最大值)
+
+# ==========================================
+#  描边引擎: 文字蒙版只栅格化一次，描边由蒙版膨胀得到
+#  FreeType 描边 (stroke_width) 要对每一行重新描轮廓再栅格化，宽度越大、行数越多越慢；
+#  膨胀只在蒙版上做若干次整图取最大值 (小半径 O(r)，大半径 O(log r))，和字数、行数无关
+# ==========================================
+
+# 可选的描边引擎
+STROKE_ENGINES = ('freetype', 'dilate')
+
+
+def _shift(image, dx, dy):
+    """[辅助] 平移图像 (移出去的部分丢弃，移进来的部分补 0)"""
+    w, h = image.size
+    return image.crop((-dx, -dy, w - dx, h - dy))
+
+
+def _disk(base, r):
+    """
+    [辅助] 按圆盘精确膨胀：圆盘看成几个同心矩形的并集 (圆盘每一行的半宽只有少数几种取值)，
+    每个矩形 = 对应宽度的水平膨胀再做竖直线段膨胀，适合小半径
+    """
+    # 圆盘第 dy 行的半宽 (用 r + 0.5 作为半径，小半径时更接近圆)
+    half = [min(r, int(math.sqrt(max(0.0, (r + 0.5) ** 2 - dy * dy)))) for dy in range(r + 1)]
+    # 每种半宽能延伸到的最大行号
+    reach = {}
+    for dy, k in enumerate(half):
+        reach[k] = dy
+    # rows[k]: 半宽为 k 的水平膨胀 (每加宽一格只多两次取最大值)
+    rows = [base]
+    for k in range(1, half[0] + 1):
+        rows.append(ImageChops.lighter(rows[-1], ImageChops.lighter(_shift(base, k, 0), _shift(base, -k, 0))))
+    result = None
+    for k, dy in reach.items():
+        rect = _segment(rows[k], 0, 1, dy)
+        result = rect if result is None else ImageChops.lighter(result, rect)
+    return result
+
+
+def _segment(image, dx, dy, half):
+    """
+    [辅助] 沿方向 (dx, dy) 的线段膨胀 (偏移 -half ~ half 步)
+    倍增: 已覆盖 c 步时再与平移 c 步的自己取最大值，约 log2(2*half+1) 次整图运算
+    """
+    n = 2 * half + 1
+    result = _shift(image, -half * dx, -half * dy)
+    covered = 1
+    while covered < n:
+        step = min(covered, n - covered)
+        result = ImageChops.lighter(result, _shift(result, step * dx, step * dy))
+        covered += step
+    return result
+
+
+def _octagon(base, r):
+    """
+    [辅助] 按正八边形近似圆盘膨胀：水平、竖直、两条对角线四个方向的线段膨胀依次叠加 (闵可夫斯基和)，
+    每个方向只要 O(log r) 次整图运算；八边形面积与半径 r 的圆相同，边界与圆的偏差约 ±4%
+    """
+    inradius = (r + 0.5) * 0.9737  # 面积相等: 8 * tan(22.5°) * R^2 = pi * r^2 (与 _disk 一样取 r + 0.5)
+    b = max(1, round(inradius * (1 - 1 / math.sqrt(2))))  # 对角线段半长 (每步 √2 像素)
+    a = max(1, round(inradius - 2 * b))                    # 水平/竖直线段半长
+    result = _segment(base, 1, 0, a)
+    result = _segment(result, 0, 1, a)
+    result = _segment(result, 1, 1, b)
+    return _segment(result, 1, -1, b)
+
+
+# 半径不超过该值时用精确圆盘，更大时用八边形 (运算次数随半径只按对数增长)
+EXACT_RADIUS = 5
+
+
+def dilate(mask, radius):
+    """
+    灰度蒙版按半径为 radius 的圆盘膨胀 (灰度形态学: 每个像素取圆盘范围内的最大值)
+    抗锯齿的边缘 (灰度值) 会原样带到描边外缘上
+    返回: 四周各扩大 radius 像素的新蒙版
+    """
+    if radius <= 0:
+        return mask.copy()
+    r = int(radius)
+    w, h = mask.size
+    base = Image.new('L', (w + 2 * r, h + 2 * r), 0)
+    base.paste(mask, (r, r))
+    return _disk(base, r) if r <= EXACT_RADIUS else _octagon(base, r)
+
+
+def stroke_from_fill(fill, radius):
+    """
+    由文字蒙版 (mask, box) 得到描边蒙版 (mask, box)，box 为画布上的位置 (可能超出画布，贴图时会被裁掉)
+    与 FreeType 描边一样，描边蒙版覆盖整个字形加上外扩的轮廓带
+    """
+    mask, box = fill
+    if mask is None:
+        return None
+    r = int(radius)
+    stroke = dilate(mask, r)
+    x0, y0 = box[0] - r, box[1] - r
+    return stroke, (x0, y0, x0 + stroke.width, y0 + stroke.height)
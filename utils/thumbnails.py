@@ -0,0 +1,145 @@
+import os  # 导入操作系统模块，用于文件路径和修改时间
+import threading  # 保护在途任务表
+from concurrent.futures import ThreadPoolExecutor  # 缩略图线程池
+from PIL import Image  # 导入 Pillow 库
+from cache import LRUCache  # 复用通用 LRU 缓存
+from render_cache import file_digest  # 文件内容哈希 (资源索引里已有时不再读文件)
+
+# ==========================================
+#  缩略图: 线程池生成，JPEG 用 draft 模式按缩小比例直接解码，
+#  结果按 (内容哈希, 修改时间, 边长) 存到磁盘，内存里只保留最近用到的一部分
+# ==========================================
+
+
+def make_thumbnail(path, size=128):
+    """
+    生成不超过 size x size 的 RGB 缩略图
+    JPEG 用 draft 模式让解码器直接按 1/2 ~ 1/8 缩小解码，大图也只需要解出很少的像素
+    """
+    with Image.open(path) as img:
+        if img.format == 'JPEG':
+            img.draft('RGB', (size, size))
+        img = img.convert('RGB')
+    # reducing_gap: 先整数倍快速缩小，再做一次高质量缩放
+    img.thumbnail((size, size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return img
+
+
+class ThumbnailCache:
+    def __init__(self, folder="cache/thumbs", size=128, workers=4, max_items=512, quality=85):
+        """
+        缩略图缓存
+        folder: 磁盘缓存目录，文件名 = 内容哈希-修改时间-边长.jpg (同一张图改名后也能命中)
+        size: 缩略图边长
+        workers: 生成缩略图的线程数
+        max_items: 内存里最多保留的缩略图数 (滚动浏览几千张图时内存不会一直涨)
+        """
+        self.folder = folder
+        self.size = size
+        self.quality = quality
+        self._memory = LRUCache(max_items=max_items)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        # 可重入: 取消任务时完成回调会在同一线程里立刻执行
+        self._lock = threading.RLock()
+        self._pending = {}  # 绝对路径 -> Future (同一张图同时只生成一次)
+        self.generated = 0  # 实际解码原图的次数
+        self.disk_hits = 0
+
+    def _disk_path(self, digest, mtime_ns):
+        """[辅助] 磁盘缓存路径 (按前两位分子目录)"""
+        return os.path.join(self.folder, digest[:2], f"{digest}-{mtime_ns}-{self.size}.jpg")
+
+    def load(self, path, entry=None):
+        """
+        [工作线程] 取缩略图：内存 -> 磁盘 -> 解码原图
+        entry: 资源索引里的元数据 (含 sha256 / mtime_ns)，给出时不用再读文件算哈希
+        返回: PIL.Image，文件不存在或无法解码时返回 None
+        """
+        path = os.path.abspath(path)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        key = (path, mtime_ns)
+        thumb = self._memory.get(key)
+        if thumb is not None:
+            return thumb
+
+        digest = entry.get('sha256') if entry and entry.get('mtime_ns') == mtime_ns else None
+        digest = digest or file_digest(path)
+        if digest is None:
+            return None
+        disk_path = self._disk_path(digest, mtime_ns)
+        try:
+            with Image.open(disk_path) as img:
+                thumb = img.convert('RGB')
+            self.disk_hits += 1
+        except (OSError, ValueError):
+            thumb = None
+        if thumb is None:
+            try:
+                thumb = make_thumbnail(path, self.size)
+            except Exception as e:
+                print(f"缩略图生成失败: {e}")
+                return None
+            self.generated += 1
+            try:
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                tmp = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                thumb.save(tmp, 'JPEG', quality=self.quality)
+                os.replace(tmp, disk_path)
+            except OSError as e:
+                print(f"缩略图缓存写入失败: {e}")
+        self._memory.put(key, thumb)
+        return thumb
+
+    def cached(self, path):
+        """只查内存 (不触发任何 IO)，没有时返回 None"""
+        path = os.path.abspath(path)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        return self._memory.get((path, mtime_ns))
+
+    def request(self, path, entry=None, callback=None):
+        """
+        在线程池里取缩略图，返回 Future (结果为 PIL.Image 或 None)
+        callback(path, image) 在工作线程里调用；同一张图在途时复用同一个任务
+        """
+        key = os.path.abspath(path)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None or future.cancelled():
+                future = self._pool.submit(self.load, path, entry)
+                self._pending[key] = future
+
+                def done(f, key=key):
+                    with self._lock:
+                        if self._pending.get(key) is f:
+                            del self._pending[key]
+                future.add_done_callback(done)
+        if callback is not None:
+            def notify(f):
+                if not f.cancelled():
+                    callback(path, f.result())
+            future.add_done_callback(notify)
+        return future
+
+    def cancel_pending(self, keep=()):
+        """取消还没开始的任务 (keep 里的路径除外)，滚动后不再需要的缩略图不用生成"""
+        keep = {os.path.abspath(p) for p in keep}
+        with self._lock:
+            for key, future in list(self._pending.items()):
+                if key not in keep:
+                    future.cancel()
+
+    def stats(self):
+        """返回缓存统计信息"""
+        data = self._memory.stats()
+        data.update({'generated': self.generated, 'disk_hits': self.disk_hits, 'pending': len(self._pending)})
+        return data
+
+    def shutdown(self, wait=False):
+        """关闭线程池"""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,108 @@
+import threading  # 导入多线程模块，保护字宽表的共享字典
+import weakref  # 弱引用字典：字体对象被缓存淘汰后，对应的字宽表自动释放
+from PIL import ImageFont  # 导入 Pillow 字体模块
+
+
+class AdvanceTable:
+    def __init__(self, font):
+        """
+        单个字体对象 (固定字号) 的字宽表
+        每个字符的 advance 只测量一次，相邻字符的字距修正 (kerning) 按字符对缓存
+        """
+        self.font = font
+        self.advances = {}  # 字符 -> 宽度
+        self.kerning = {}   # 字符对 -> 修正量 (大部分 CJK 字体为 0)
+        # BASIC 布局下整行宽度 = 各字宽 + 字距修正，可以直接累加
+        # RAQM 布局可能有连字等整形，需要在换行边界处用整行宽度复核
+        self.additive = getattr(font, 'layout_engine', None) == ImageFont.Layout.BASIC
+        self._line_height = None
+        self.calls = 0  # font.getlength 实际调用次数 (统计用)
+
+    def advance(self, char):
+        """[辅助] 单个字符宽度"""
+        w = self.advances.get(char)
+        if w is None:
+            self.calls += 1
+            w = self.font.getlength(char)
+            self.advances[char] = w
+        return w
+
+    def pair(self, prev, char):
+        """[辅助] 字符对的字距修正 = 两字整体宽度 - 各自宽度"""
+        key = prev + char
+        k = self.kerning.get(key)
+        if k is None:
+            self.calls += 1
+            k = self.font.getlength(key) - self.advance(prev) - self.advance(char)
+            self.kerning[key] = k
+        return k
+
+    def measure(self, text):
+        """[辅助] 精确测量整段文字宽度"""
+        self.calls += 1
+        return self.font.getlength(text)
+
+    def line_height(self):
+        """
+        单行高度 (与原换行算法一致)
+        使用 'Ay' 这种比较高的字符来定高，额外加 10 像素行间距
+        """
+        if self._line_height is None:
+            try:
+                bbox = self.font.getbbox("Ay")
+                self._line_height = bbox[3] - bbox[1] + 10
+            except Exception:
+                self._line_height = 30 # 兜底默认值
+        return self._line_height
+
+
+_tables = weakref.WeakKeyDictionary()
+_tables_lock = threading.Lock()
+
+
+def get_advance_table(font):
+    """获取字体对象对应的字宽表 (每个字体对象只建一次)"""
+    with _tables_lock:
+        table = _tables.get(font)
+        if table is None:
+            table = AdvanceTable(font)
+            _tables[font] = table
+        return table
+
+
+def wrap_text(text, font, max_width):
+    """
+    单遍换行：逐字累加字宽，超出 max_width 时断行
+    断行结果与逐字调用 font.getlength(当前行 + 字) 的暴力算法一致，
+    但每个字符只做 O(1) 的查表，整体为线性复杂度
+    Returns: 行列表
+    """
+    table = get_advance_table(font)
+    # 非可加布局时，估算宽度接近上限就用整行宽度复核
+    slack = 0 if table.additive else getattr(font, 'size', 0)
+    lines = []
+
+    for paragraph in text.split('\n'):
+        start = 0      # 当前行在段落中的起始下标
+        width = 0.0    # 当前行宽度
+        prev = None    # 当前行最后一个字符
+        for i, char in enumerate(paragraph):
+            w = width + table.advance(char)
+            if prev is not None:
+                w += table.pair(prev, char)
+            if not table.additive and w > max_width - slack:
+                w = table.measure(paragraph[start:i + 1])
+
+            if w <= max_width:
+                width = w
+            else:
+                # 宽度超了，当前行到此为止，新的一行从这个字符开始
+                lines.append(paragraph[start:i])
+                start = i
+                width = table.advance(char)
+            prev = char
+        # 处理段落末尾的剩余字符
+        if start < len(paragraph):
+            lines.append(paragraph[start:])
+
+    return lines